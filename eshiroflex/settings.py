@@ -32,6 +32,10 @@ INSTALLED_APPS = [
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'store.middleware.RequestIdMiddleware',
+    'store.middleware.PerformanceMiddleware',
+    'store.slow_queries.SlowQueryMiddleware',  # Off unless SLOW_QUERY_MS is set
+    'store.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     
     # CORS Middleware (optional)
@@ -40,10 +44,20 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.middleware.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# /metrics is only served to these addresses (and to anyone when DEBUG is on)
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1 ::1').split()
+
+# Response compression (brotli when the Brotli package is installed, else gzip)
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+# Quality 11 is meant for static assets; 4 is close to gzip -6 in speed with smaller output
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+
 # URL Configuration
 ROOT_URLCONF = 'eshiroflex.urls'
 
@@ -68,23 +82,63 @@ TEMPLATES = [
 WSGI_APPLICATION = 'eshiroflex.wsgi.application'
 
 # Database Configuration
-DATABASES = {
-    'default': {
+# Connections come from a psycopg pool (health-checked on checkout). Set DB_POOL=False
+# to fall back to persistent connections instead.
+DB_POOL = os.getenv('DB_POOL', 'True') == 'True'
+
+
+def database(prefix):
+    """Build a PostgreSQL connection from <prefix>_* env vars, falling back to the primary's."""
+    return {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('DB_NAME', 'my_database'),
-        'USER': os.getenv('DB_USER', 'postgres'),
-        'PASSWORD': os.getenv('DB_PASSWORD', '12345'),
-        'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', '5432'),
+        'NAME': os.getenv(f'{prefix}_NAME', os.getenv('DB_NAME', 'my_database')),
+        'USER': os.getenv(f'{prefix}_USER', os.getenv('DB_USER', 'postgres')),
+        'PASSWORD': os.getenv(f'{prefix}_PASSWORD', os.getenv('DB_PASSWORD', '12345')),
+        'HOST': os.getenv(f'{prefix}_HOST', os.getenv('DB_HOST', 'localhost')),
+        'PORT': os.getenv(f'{prefix}_PORT', os.getenv('DB_PORT', '5432')),
+        'CONN_MAX_AGE': 0 if DB_POOL else 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+                'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            },
+        } if DB_POOL else {},
     }
+
+
+DATABASES = {
+    'default': database('DB'),
 }
 
+# Read replica (optional). Pointing DB_REPLICA_HOST at the primary gives a local
+# two-database setup; tests treat the replica as a mirror of the primary.
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {**database('DB_REPLICA'), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+
+# Catalog, order history and analytics reads may go to a replica
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_READ_MODELS = ['store.product', 'store.order', 'store.orderitem', 'store.payment']
+# After a write, the same client reads from the primary for this many seconds
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# Above this many rows (planner estimate), admin changelists show estimated totals
+ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ESTIMATED_COUNT_THRESHOLD', 100_000))
+
+# User directory (GET /api/users/): page size, and past this many matches the total is the planner estimate
+USER_DIRECTORY_PAGE_SIZE = 50
+USER_DIRECTORY_EXACT_COUNT = 1000
+
 # Authentication
 AUTH_USER_MODEL = 'store.User'
 
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'store.tokens.SignedTokenAuthentication',  # Bearer tokens, verified without a query
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
@@ -94,8 +148,51 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Logging
+# JSON lines written by a background QueueListener, so request threads never block
+# on stdout. Only LOG_DEBUG_SAMPLE_RATE of DEBUG records are kept.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'store.log.RequestIdFilter'},
+        'sample_debug': {'()': 'store.log.SamplingFilter', 'rate': float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 0.01))},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'store.log.QueueingHandler',
+            'filters': ['request_id', 'sample_debug'],
+        },
+    },
+    'loggers': {
+        'store': {
+            'handlers': ['queue'],
+            'level': os.getenv('STORE_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Password Hashing
+# Scrypt is preferred; PBKDF2 hashes still verify and are rehashed on the next login.
+PASSWORD_HASHERS = [
+    'store.hashers.TunedScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# Login password checks run on a bounded pool; logins beyond the queue depth get a 503
+AUTHENTICATION_BACKENDS = ['store.hashers.PooledModelBackend']
+LOGIN_HASH_WORKERS = int(os.getenv('LOGIN_HASH_WORKERS', os.cpu_count() or 1))
+LOGIN_HASH_MAX_PENDING = int(os.getenv('LOGIN_HASH_MAX_PENDING', LOGIN_HASH_WORKERS * 4))
+LOGIN_HASH_TIMEOUT = float(os.getenv('LOGIN_HASH_TIMEOUT', 10))
+
 # Password Validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -116,6 +213,76 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Co-occurrence matrix kept between `build_recommendations` runs
+RECOMMENDATIONS_MATRIX_PATH = Path(os.getenv('RECOMMENDATIONS_MATRIX_PATH', BASE_DIR / 'var' / 'cooccurrence.npz'))
+# Ids below the watermark re-read on each run, for items whose transaction committed late
+RECOMMENDATIONS_WATERMARK_MARGIN = int(os.getenv('RECOMMENDATIONS_WATERMARK_MARGIN', 10_000))
+
+# Monthly Order/OrderItem/Payment partitions (`manage.py partitions`)
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+PARTITION_RETAIN_MONTHS = int(os.getenv('PARTITION_RETAIN_MONTHS', 24))
+PARTITION_ARCHIVE_DIR = Path(os.getenv('PARTITION_ARCHIVE_DIR', BASE_DIR / 'var' / 'archive'))
+# Saved `bench_suite` runs, one <vendor>.json baseline per database (`bench_compare`)
+BENCHMARK_DIR = Path(os.getenv('BENCHMARK_DIR', BASE_DIR / 'var' / 'benchmarks'))
+# Order and payment history lists cover this many days unless ?since= asks for more
+ORDER_HISTORY_DAYS = int(os.getenv('ORDER_HISTORY_DAYS', 365))
+
+# Abandoned carts (`manage.py reap_carts`): a user's cart is reaped once every line
+# is older than the TTL, measured on CART_TTL_FIELD ('updated_at' or 'added_at')
+CART_TTL_DAYS = int(os.getenv('CART_TTL_DAYS', 30))
+CART_TTL_FIELD = os.getenv('CART_TTL_FIELD', 'updated_at')
+CART_REAPER_BATCH_SIZE = int(os.getenv('CART_REAPER_BATCH_SIZE', 1000))
+CART_REAPER_SLEEP = float(os.getenv('CART_REAPER_SLEEP', 0.1))
+
+# Guest carts live in a signed cookie until login/registration merges them into Cart
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_MAX_AGE = int(os.getenv('GUEST_CART_MAX_AGE', 30 * 24 * 3600))
+GUEST_CART_MAX_LINES = 50  # Keeps the cookie well under the 4 KB browser limit
+
+# Cart backend: DatabaseCartStorage writes through, CacheCartStorage writes behind
+# (see store/cart_storage.py for when carts are flushed and what a cache loss costs)
+CART_STORAGE = os.getenv('CART_STORAGE', 'store.cart_storage.DatabaseCartStorage')
+CART_CACHE_ALIAS = os.getenv('CART_CACHE_ALIAS', 'default')
+CART_CACHE_TIMEOUT = 24 * 3600  # Clean carts only; dirty ones never expire
+CART_FLUSH_INTERVAL = float(os.getenv('CART_FLUSH_INTERVAL', 5))  # 0: no in-process flusher, rely on `flush_carts`
+
+# How often a process checks whether promotions changed elsewhere (store/promotions.py)
+PROMOTION_INDEX_CHECK_SECONDS = float(os.getenv('PROMOTION_INDEX_CHECK_SECONDS', 5))
+
+# Signed access tokens (store/tokens.py): lifetimes in seconds, and how often each
+# process reloads the revocation denylist (a revocation elsewhere takes up to this long)
+ACCESS_TOKEN_LIFETIME = int(os.getenv('ACCESS_TOKEN_LIFETIME', 5 * 60))
+REFRESH_TOKEN_LIFETIME = int(os.getenv('REFRESH_TOKEN_LIFETIME', 14 * 24 * 3600))
+TOKEN_DENYLIST_SYNC_SECONDS = float(os.getenv('TOKEN_DENYLIST_SYNC_SECONDS', 5))
+
+# Transactional outbox relay (store/outbox.py): sinks by name, e.g.
+# {'warehouse': {'class': 'store.outbox.HttpSink', 'options': {'url': 'https://...'}}}
+OUTBOX_SINKS = {
+    'file': {'class': 'store.outbox.FileSink', 'options': {'path': os.getenv('OUTBOX_FILE', str(BASE_DIR / 'outbox.jsonl'))}},
+}
+OUTBOX_BATCH_SIZE = 1000
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', 7))
+
+# Order status server-sent events (store/order_events.py; served by the ASGI app)
+ORDER_EVENTS_POLL_SECONDS = float(os.getenv('ORDER_EVENTS_POLL_SECONDS', 1))
+ORDER_EVENTS_KEEPALIVE_SECONDS = 25
+ORDER_EVENTS_QUEUE_SIZE = 100  # Per connection; a slower client loses its oldest events
+ORDER_EVENTS_RETRY_MS = 5000  # Client reconnect delay
+
+# Slow-query recorder (store/slow_queries.py): statements taking SLOW_QUERY_MS or more
+# (0 turns it off) are kept per fingerprint; a sample of them get an EXPLAIN ANALYZE plan
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 0))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+SLOW_QUERY_EXPLAIN_INTERVAL = 300  # Seconds before a fingerprint's plan is taken again
+SLOW_QUERY_MAX_ENTRIES = 200
+SLOW_QUERY_STACK_DEPTH = 8
+SLOW_QUERY_CACHE_ALIAS = os.getenv('SLOW_QUERY_CACHE_ALIAS', 'default')  # Shared, for `manage.py slow_queries`
+
+# Faceted browse (/api/products/browse/): price bucket bounds and how long counts are cached
+FACET_PRICE_BUCKETS = [0, 500, 1000, 2500, 5000]
+FACET_CACHE_SECONDS = int(os.getenv('FACET_CACHE_SECONDS', 60))
+FACET_PAGE_SIZE = 24
+
 # Default Auto Field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
+from store.views import metrics_view
 
 
 def home(request):
@@ -26,5 +27,6 @@ urlpatterns = [
     path('', home),  # Homepage route
     path('admin/', admin.site.urls),
     path('api/', include('store.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
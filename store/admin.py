@@ -1,16 +1,117 @@
 from django.contrib import admin
-from .models import Product, User, Order, Cart, Wishlist, Payment, Profile  
+from django.contrib.admin.utils import get_fields_from_path
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from .models import Product, ProductVariant, User, Order, OrderItem, Cart, Wishlist, Payment, Profile, Promotion
+from .pagination import EstimatedCountPaginator
 
-class OrderAdmin(admin.ModelAdmin):
-    def save_model(self, request, obj, form, change):
-        if not obj.pk:  # Check if the object has a primary key
-            obj.save()  # Save the order first before assigning related items
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists for tables with millions of rows: estimated totals, no second
+    unfiltered COUNT(*) for "x of y selected", and newest first along the primary key.
+    Subclasses list_select_related whatever __str__ or list_display dereferences and
+    use raw_id_fields for foreign keys to big tables (a <select> would load all of them).
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ['-pk']
+    list_per_page = 50
 
-admin.site.register(Product)
-admin.site.register(User)  
-admin.site.register(Order)
-admin.site.register(Cart)
-admin.site.register(Wishlist)
-admin.site.register(Payment)
-admin.site.register(Profile)
\ No newline at end of file
+    def get_search_results(self, request, queryset, search_term):
+        """
+        When every search field is '=field', match the whole term exactly (Django's
+        default compares UPPER() values, which no btree index can serve) and only
+        against fields the term is a valid value for, so '42' never ORs an id lookup
+        with a join on emails.
+        """
+        term = search_term.strip()
+        search_fields = self.get_search_fields(request)
+        if not term or not all(name.startswith('=') for name in search_fields):
+            return super().get_search_results(request, queryset, search_term)
+
+        query = Q()
+        for path in (name[1:] for name in search_fields):
+            field = get_fields_from_path(self.model, path)[-1]
+            try:
+                value = field.to_python(term)
+                field.run_validators(value)
+            except ValidationError:
+                continue
+            query |= Q(**{path: value})
+        return (queryset.filter(query) if query else queryset.none()), False
+
+
+class ProductVariantInline(admin.TabularInline):
+    model = ProductVariant
+    extra = 0
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'price', 'stock', 'product_size', 'created_at']
+    search_fields = ['=id', 'name']
+    inlines = [ProductVariantInline]
+
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ['id', 'email', 'full_name', 'cellphone_number', 'is_active', 'is_staff']
+    list_filter = ['is_staff', 'is_active']
+    search_fields = ['=id', '=email', '=cellphone_number']
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ['product']
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'total_price', 'created_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    search_fields = ['=id', '=user__email']
+    inlines = [OrderItemInline]
+
+
+@admin.register(Cart)
+class CartAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'product', 'quantity', 'added_at']
+    list_select_related = ['user', 'product']
+    raw_id_fields = ['user', 'product']
+    search_fields = ['=user__email', '=product__id']
+
+
+@admin.register(Wishlist)
+class WishlistAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'product', 'added_at']
+    list_select_related = ['user', 'product']
+    raw_id_fields = ['user', 'product']
+    search_fields = ['=user__email', '=product__id']
+
+
+@admin.register(Payment)
+class PaymentAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'order', 'amount', 'status', 'mode_of_payment', 'created_at']
+    list_select_related = ['user', 'order__user']
+    # Choices-based, so building the filter runs no query; mode_of_payment would need a DISTINCT scan
+    list_filter = ['status']
+    raw_id_fields = ['user', 'order']
+    search_fields = ['=id', '=order__id', '=user__email']
+
+
+@admin.register(Profile)
+class ProfileAdmin(LargeTableAdmin):
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    search_fields = ['=user__email']
+
+
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'kind', 'percent', 'amount', 'starts_at', 'ends_at', 'is_active']
+    list_filter = ['kind', 'is_active']
+    search_fields = ['name']
+    raw_id_fields = ['products']
@@ -0,0 +1,15 @@
+"""
+Micro-benchmarks for the hot paths, with JSON baselines.
+
+`manage.py bench_suite --save` times every case in cases.py against the configured
+database and writes BENCHMARK_DIR/<vendor>.json; run it under each settings module to
+keep a SQLite and a PostgreSQL baseline. `manage.py bench_compare` runs the suite again
+(or loads a saved run) and flags cases slower than the baseline by more than a
+threshold, or issuing more queries. Everything the cases seed is rolled back.
+
+Timings are per operation, the median of `repeat` runs, so only compare runs made on
+the same machine. Query counts don't depend on the machine.
+"""
+from .runner import baseline_path, compare, load, run, save
+
+__all__ = ['baseline_path', 'compare', 'load', 'run', 'save']
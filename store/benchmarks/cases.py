@@ -0,0 +1,98 @@
+"""
+The benchmark cases. Each takes the Runner, seeds what it needs (inside the suite's
+rolled-back transaction) and measures one or more named results.
+"""
+from decimal import Decimal
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from store.models import Cart, Order, OrderItem, Product, User
+from store.serializers import CartSerializer, OrderSerializer
+from store.views import CreateOrderAPIView, OrderCreateView, OrderViewSet, PlaceOrderView, create_order
+
+CHECKOUT_LINES = 5
+ITEM_SAVES = 100
+
+
+def customer(name):
+    return User.objects.create_customer(email=f'bench-suite-{name}@example.com', password=None)
+
+
+def catalogue(count):
+    return Product.objects.bulk_create(
+        Product(name=f'Bench suite product {i}', price=Decimal(1000 + i % 9000) / 100, stock=100,
+                image_url=f'https://cdn.example.com/bench/{i}.jpg', product_size='M')
+        for i in range(count)
+    )
+
+
+def order_item_save(runner):
+    order = Order.objects.create(user=customer('items'))
+    product, = catalogue(1)
+
+    def save():
+        for _ in range(ITEM_SAVES):
+            OrderItem(order=order, product=product, quantity=2).save()  # Prices itself from the product
+
+    runner.measure('OrderItem.save', save, ops=ITEM_SAVES, isolated=True)
+
+
+def calculate_total_price(runner):
+    user = customer('totals')
+    product, = catalogue(1)
+    for size in runner.sizes:
+        order = Order.objects.create(user=user)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price=product.price, created_at=order.created_at)
+            for _ in range(size)
+        )
+        runner.measure(f'Order.calculate_total_price[{size}]', order.calculate_total_price)
+
+
+def serializers(runner):
+    """Serialization only: the rows are loaded beforehand."""
+    user, rows = customer('serializers'), max(runner.sizes)
+    Cart.objects.bulk_create(Cart(user=user, product=product, quantity=1 + i % 3) for i, product in enumerate(catalogue(rows)))
+    Order.objects.bulk_create(Order(user=user, total_price=Decimal(100 + i % 900)) for i in range(rows))
+    carts = list(Cart.objects.filter(user=user).select_related('product').order_by('id'))
+    orders = list(Order.objects.filter(user=user).order_by('id'))
+    for size in runner.sizes:
+        runner.measure(f'CartSerializer[{size}]', lambda rows=carts[:size]: CartSerializer(rows, many=True).data)
+        runner.measure(f'OrderSerializer[{size}]', lambda rows=orders[:size]: OrderSerializer(rows, many=True).data)
+
+
+def checkout(runner):
+    """Each checkout view, called directly (no routing, authentication or rendering), for a CHECKOUT_LINES cart."""
+    user, products = customer('checkout'), catalogue(CHECKOUT_LINES)
+    Cart.objects.bulk_create(Cart(user=user, product=product, quantity=2) for product in products)
+    body = {'product_ids': [product.id for product in products], 'quantities': [2] * len(products)}
+    views = {
+        'create_order': (create_order, body),
+        'OrderCreateView': (OrderCreateView.as_view(), body),
+        'PlaceOrderView': (PlaceOrderView.as_view(), {}),
+        'CreateOrderAPIView': (CreateOrderAPIView.as_view(), {}),
+        'OrderViewSet.create': (OrderViewSet.as_view({'post': 'create'}), {}),
+    }
+    factory = APIRequestFactory()
+    for name, (view, data) in views.items():
+        requests = []
+        for _ in range(runner.repeat):  # Built up front so only the view is timed
+            request = factory.post('/api/checkout/', data, format='json')
+            force_authenticate(request, user)
+            requests.append(request)
+        requests = iter(requests)
+
+        def call(view=view, name=name, requests=requests):
+            response = view(next(requests))
+            if response.status_code != 201:  # Rolled back after each run, so the cart is always full
+                raise RuntimeError(f'{name} returned {response.status_code}: {response.data}')
+
+        runner.measure(f'checkout.{name}', call, isolated=True)
+
+
+CASES = {
+    'order_item_save': order_item_save,
+    'calculate_total_price': calculate_total_price,
+    'serializers': serializers,
+    'checkout': checkout,
+}
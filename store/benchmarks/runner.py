@@ -0,0 +1,111 @@
+import platform
+import statistics
+import time
+from pathlib import Path
+
+import django
+import orjson
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+SIZES = (1, 100, 10_000)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Runner:
+    """Collects {case name: result} for the cases; each case calls measure() once per thing it times."""
+
+    def __init__(self, repeat=5, sizes=SIZES):
+        self.repeat, self.sizes = repeat, sizes
+        self.results = {}
+        self.queries = 0
+
+    def count(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def measure(self, name, fn, ops=1, isolated=False):
+        """
+        Time fn(), which performs `ops` operations, `repeat` times. Isolated runs are
+        rolled back to a savepoint afterwards (untimed), so each starts from the same rows.
+        """
+        timings = []
+        for _ in range(self.repeat):
+            if isolated:
+                savepoint = transaction.savepoint()
+            self.queries = 0
+            with connection.execute_wrapper(self.count):
+                start = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - start)
+            if isolated:
+                transaction.savepoint_rollback(savepoint)
+        self.results[name] = {
+            'median_us': statistics.median(timings) / ops * 1e6,
+            'min_us': min(timings) / ops * 1e6,
+            'queries': self.queries,  # Per run, i.e. for `ops` operations
+            'ops': ops,
+        }
+
+
+def run(repeat=5, sizes=SIZES, cases=None):
+    """Run the named cases (all by default) in a transaction that is rolled back; returns the report."""
+    from .cases import CASES
+
+    runner = Runner(repeat, sizes)
+    try:
+        with transaction.atomic():
+            for name, case in CASES.items():
+                if cases is None or name in cases:
+                    case(runner)
+            raise Rollback
+    except Rollback:
+        pass
+    return {
+        'vendor': connection.vendor,
+        'created_at': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'repeat': repeat,
+        'results': runner.results,
+    }
+
+
+def baseline_path(vendor):
+    return Path(settings.BENCHMARK_DIR) / f'{vendor}.json'
+
+
+def save(report, path=None):
+    """Write the report as JSON (to the vendor's baseline by default); returns the path."""
+    path = Path(path or baseline_path(report['vendor']))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    return path
+
+
+def load(path):
+    return orjson.loads(Path(path).read_bytes())
+
+
+def compare(baseline, current, threshold=0.25):
+    """
+    [(name, baseline µs, current µs, problems)] for every case in `current`. Problems are
+    'slower' (median up more than `threshold`), 'more queries', or 'new' (no baseline).
+    """
+    rows = []
+    for name, now in sorted(current['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            rows.append((name, None, now['median_us'], ['new']))
+            continue
+        problems = []
+        if now['median_us'] > before['median_us'] * (1 + threshold):
+            problems.append('slower')
+        if now['queries'] > before['queries']:
+            problems.append('more queries')
+        rows.append((name, before['median_us'], now['median_us'], problems))
+    return rows
@@ -0,0 +1,231 @@
+"""
+Where cart writes go: straight to the Cart table (default) or to the cache first.
+
+settings.CART_STORAGE picks the backend. `CacheCartStorage` keeps each user's cart as
+a {product_id: quantity} dict in the CART_CACHE_ALIAS cache and writes it behind:
+a cart that changes ten times in a few seconds is written to the Cart table once.
+A dirty cart is persisted (one DELETE + one upsert) when any of these happens:
+
+- the in-process flusher finds it dirty for CART_FLUSH_INTERVAL seconds, or
+  `manage.py flush_carts` runs;
+- it is read through the API (the cart ETag and listings come from the table);
+- checkout, wishlist transfers or guest-cart merges touch it (always synchronous).
+
+Crash recovery:
+
+- A web process dying loses nothing: dirty carts and the dirty index live in the
+  cache, and the next flusher pass or `flush_carts` run in any process persists them.
+- Losing the cache (restart, eviction) loses changes made since the cart's last
+  flush, at most about CART_FLUSH_INTERVAL seconds of them. The cart reverts to its
+  Cart rows, which stay the source of truth.
+- The local-memory cache is per process, so it is only suitable for tests and
+  single-process servers; use a shared cache (Redis, Memcached) in production.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Cart, ChangeStamp, Product
+
+logger = logging.getLogger(__name__)
+
+
+def get_storage():
+    return import_string(settings.CART_STORAGE)()
+
+
+class DatabaseCartStorage:
+    """Every change is an immediate write to the Cart table."""
+
+    deferred = False
+
+    def add(self, user_id, product_id, quantity, limit=None):
+        """Add `quantity` of a product; (new quantity, Cart id or None), or None if that would exceed `limit`."""
+        if limit is not None and quantity > limit:
+            return None
+        line, created = Cart.objects.get_or_create(user_id=user_id, product_id=product_id, defaults={"quantity": quantity})
+        if not created:
+            if limit is not None and line.quantity + quantity > limit:
+                return None
+            line.quantity += quantity
+            line.save(update_fields=["quantity", "updated_at"])
+        return line.quantity, line.id
+
+    def flush(self, user_id):
+        return False
+
+    def flush_due(self, min_age=0):
+        return 0
+
+    def forget(self, user_ids):
+        pass
+
+
+class CacheCartStorage(DatabaseCartStorage):
+    """Carts live in the cache and are written to the Cart table behind (see module docstring)."""
+
+    deferred = True
+    prefix = "cart:v1:"
+    lock_timeout = 5
+
+    def __init__(self):
+        self.cache = caches[settings.CART_CACHE_ALIAS]
+
+    @contextmanager
+    def lock(self, name):
+        # cache.add is atomic on every backend; the timeout frees locks of dead processes
+        key = f"{self.prefix}lock:{name}"
+        deadline = time.monotonic() + 2 * self.lock_timeout
+        while not self.cache.add(key, 1, self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Cart lock {name} is busy")
+            time.sleep(0.002)
+        try:
+            yield
+        finally:
+            self.cache.delete(key)
+
+    def load(self, user_id):
+        """The user's cached cart, read from the Cart table on a miss."""
+        entry = self.cache.get(f"{self.prefix}{user_id}")
+        if entry is None:
+            lines = Cart.objects.filter(user_id=user_id, product__isnull=False).values_list("product_id", "quantity")
+            entry = {"items": dict(lines), "dirty_since": None}
+            self.cache.set(f"{self.prefix}{user_id}", entry, settings.CART_CACHE_TIMEOUT)
+        return entry
+
+    def add(self, user_id, product_id, quantity, limit=None):
+        with self.lock(user_id):
+            entry = self.load(user_id)
+            new = entry["items"].get(product_id, 0) + quantity
+            if limit is not None and new > limit:
+                return None
+            entry["items"][product_id] = new
+            if entry["dirty_since"] is None:
+                entry["dirty_since"] = time.time()
+                self.mark_dirty(user_id, entry["dirty_since"])
+            self.cache.set(f"{self.prefix}{user_id}", entry, None)  # Dirty carts must not expire
+        start_flusher()
+        return new, None
+
+    def mark_dirty(self, user_id, since):
+        with self.lock("dirty"):
+            dirty = self.cache.get(f"{self.prefix}dirty") or {}
+            dirty[user_id] = since
+            self.cache.set(f"{self.prefix}dirty", dirty, None)
+
+    def unmark_dirty(self, user_id, since):
+        # Only the mark we flushed: a change made meanwhile re-marked the cart with a later time
+        with self.lock("dirty"):
+            dirty = self.cache.get(f"{self.prefix}dirty") or {}
+            if dirty.get(user_id) == since:
+                del dirty[user_id]
+                self.cache.set(f"{self.prefix}dirty", dirty, None)
+
+    def flush(self, user_id):
+        """Persist the user's cart if it has unwritten changes; True if it did."""
+        with self.lock(user_id):
+            entry = self.cache.get(f"{self.prefix}{user_id}")
+            if entry is None or entry["dirty_since"] is None:
+                return False
+            write_cart(user_id, entry["items"])
+            since, entry["dirty_since"] = entry["dirty_since"], None
+            self.cache.set(f"{self.prefix}{user_id}", entry, settings.CART_CACHE_TIMEOUT)
+        self.unmark_dirty(user_id, since)
+        return True
+
+    def flush_due(self, min_age=0):
+        """Flush every cart dirty for at least `min_age` seconds; returns how many were written."""
+        dirty = self.cache.get(f"{self.prefix}dirty") or {}
+        cutoff = time.time() - min_age
+        flushed = 0
+        for user_id, since in dirty.items():
+            if since > cutoff:
+                continue
+            if self.flush(user_id):
+                flushed += 1
+            else:
+                self.unmark_dirty(user_id, since)  # Cart already written, or lost with the cache
+        return flushed
+
+    def forget(self, user_ids):
+        """
+        Drop clean cached carts after their rows were changed elsewhere. Dirty ones are
+        kept and their next flush rewrites the rows, so writers must flush first
+        (views.user_cart does) or their change is lost.
+        """
+        for user_id in set(user_ids):
+            with self.lock(user_id):
+                entry = self.cache.get(f"{self.prefix}{user_id}")
+                if entry is not None and entry["dirty_since"] is None:
+                    self.cache.delete(f"{self.prefix}{user_id}")
+
+
+def write_cart(user_id, items):
+    """Make the user's Cart rows match `items` with one DELETE and one upsert."""
+    cart, product = Cart._meta.db_table, Product._meta.db_table
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        keep = ", ".join(["%s"] * len(items))
+        cursor.execute(
+            f"DELETE FROM {cart} WHERE user_id = %s" + (f" AND product_id NOT IN ({keep})" if items else ""),
+            [user_id, *items],
+        )
+        if items:
+            # VALUES columns are column1, column2 on both PostgreSQL and SQLite
+            cursor.execute(
+                f"""
+                INSERT INTO {cart} (user_id, product_id, quantity, added_at, updated_at)
+                SELECT %s, p.id, g.column2, %s, %s
+                FROM (VALUES {', '.join(['(%s, %s)'] * len(items))}) g JOIN {product} p ON p.id = g.column1
+                WHERE true
+                ON CONFLICT (user_id, product_id) DO UPDATE
+                SET quantity = excluded.quantity, updated_at = excluded.updated_at
+                """,
+                [user_id, now, now, *(value for pair in items.items() for value in pair)],
+            )
+        # Raw SQL skips the signals that keep conditional GET stamps current
+        ChangeStamp.bump("cart", [user_id])
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def forget_cached_cart(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        get_storage().forget([instance.user_id])
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def start_flusher():
+    """Start this process's write-behind thread (once; CART_FLUSH_INTERVAL = 0 disables it)."""
+    global _flusher
+    interval = settings.CART_FLUSH_INTERVAL
+    if not interval or _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, args=(interval,), name="cart-flusher", daemon=True)
+            _flusher.start()
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            get_storage().flush_due(min_age=interval)
+        except Exception:
+            logger.exception("Cart write-behind flush failed")
+        finally:
+            connections.close_all()
@@ -0,0 +1,125 @@
+"""
+Faceted product browsing.
+
+Filters (sizes, price range, in stock) narrow the products; facet counts (products
+per size, per price bucket, in stock) describe the filtered set. All facets and the
+total come from one statement: the filtered product/variant rows are grouped by
+GROUPING SETS on PostgreSQL, or by a UNION ALL of GROUP BYs over the same rows
+elsewhere. Counts are cached per filter signature for FACET_CACHE_SECONDS, so they
+can lag catalogue changes by that long.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Product, ProductVariant
+
+
+def parse_filters(params):
+    """Normalised filters from query params; raises ValueError on bad values."""
+    filters = {
+        'sizes': sorted({size.strip().upper() for value in params.getlist('size') for size in value.split(',') if size.strip()}),
+        'min_price': None,
+        'max_price': None,
+        'in_stock': params.get('in_stock', '').lower() in ('1', 'true', 'yes'),
+    }
+    for name in ('min_price', 'max_price'):
+        if params.get(name):
+            try:
+                filters[name] = Decimal(params[name])
+            except InvalidOperation:
+                raise ValueError(f'{name} must be a number')
+    return filters
+
+
+def filtered_products(filters):
+    products = Product.objects.all()
+    variants = ProductVariant.objects.filter(product=OuterRef('pk'))
+    if filters['sizes']:
+        # With in_stock too, the same variant has to match both: a sold-out L doesn't count as an L in stock
+        in_size = variants.filter(size__in=filters['sizes'])
+        products = products.filter(Exists(in_size.filter(stock__gt=0) if filters['in_stock'] else in_size))
+    if filters['min_price'] is not None:
+        products = products.filter(price__gte=filters['min_price'])
+    if filters['max_price'] is not None:
+        products = products.filter(price__lte=filters['max_price'])
+    if filters['in_stock'] and not filters['sizes']:
+        # Any variant in stock, or (no variants) the product's own stock
+        products = products.filter(Exists(variants.filter(stock__gt=0)) | Q(~Exists(variants), stock__gt=0))
+    return products
+
+
+def price_buckets():
+    """[(upper bound or None, label)] from FACET_PRICE_BUCKETS, e.g. [0, 50, 100] -> 0-50, 50-100, 100+."""
+    bounds = settings.FACET_PRICE_BUCKETS
+    return [(high, f'{low}-{high}') for low, high in zip(bounds, bounds[1:])] + [(None, f'{bounds[-1]}+')]
+
+
+def price_bucket_sql(column):
+    """CASE expression labelling `column` with its price bucket, plus params."""
+    *ranges, (_, last) = price_buckets()
+    cases = ' '.join(f'WHEN {column} < %s THEN %s' for _ in ranges)
+    return f'CASE {cases} ELSE %s END', [value for pair in ranges for value in pair] + [last]
+
+
+def facet_counts(filters):
+    """{'total', 'in_stock', 'sizes': {size: n}, 'price': {bucket: n}} in one query."""
+    # One row per (product, variant); products without variants get one row with a NULL size.
+    # With sizes selected, only those sizes' stock counts towards in_stock, as in filtered_products.
+    stock_left = Coalesce('variants__stock', 'stock')
+    if filters['sizes']:
+        stock_left = Case(When(variants__size__in=filters['sizes'], then=F('variants__stock')), default=Value(0))
+    rows = filtered_products(filters).values('id', 'price').annotate(size=F('variants__size'), stock_left=stock_left)
+    rows_sql, rows_params = rows.query.sql_with_params()
+    bucket, bucket_params = price_bucket_sql('price')
+    in_stock = 'COUNT(DISTINCT CASE WHEN stock_left > 0 THEN id END)'
+
+    if connection.vendor == 'postgresql':
+        sql = f"""
+            SELECT GROUPING(size), GROUPING(bucket), size, bucket, COUNT(DISTINCT id), {in_stock}
+            FROM (SELECT id, size, stock_left, {bucket} AS bucket FROM ({rows_sql}) r) hits
+            GROUP BY GROUPING SETS ((size), (bucket), ())
+        """
+    else:
+        sql = f"""
+            WITH hits AS (SELECT id, size, stock_left, {bucket} AS bucket FROM ({rows_sql}) r)
+            SELECT 0, 1, size, NULL, COUNT(DISTINCT id), {in_stock} FROM hits GROUP BY size
+            UNION ALL SELECT 1, 0, NULL, bucket, COUNT(DISTINCT id), {in_stock} FROM hits GROUP BY bucket
+            UNION ALL SELECT 1, 1, NULL, NULL, COUNT(DISTINCT id), {in_stock} FROM hits
+        """
+    params = [*bucket_params, *rows_params]
+
+    facets = {'total': 0, 'in_stock': 0, 'sizes': {}, 'price': {}}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for by_size, by_bucket, size, bucket, products, in_stock_products in cursor.fetchall():
+            if not by_size:
+                if size:  # Products without variants have no size to count
+                    facets['sizes'][size] = products
+            elif not by_bucket:
+                facets['price'][bucket] = products
+            else:
+                facets['total'], facets['in_stock'] = products, in_stock_products
+    # Buckets in range order rather than query order
+    facets['price'] = {label: facets['price'][label] for _, label in price_buckets() if label in facets['price']}
+    facets['sizes'] = dict(sorted(facets['sizes'].items()))
+    return facets
+
+
+def signature(filters):
+    raw = repr(sorted(filters.items())) + repr(settings.FACET_PRICE_BUCKETS)
+    return 'facets:v1:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def cached_facet_counts(filters):
+    key = signature(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = facet_counts(filters)
+        cache.set(key, facets, settings.FACET_CACHE_SECONDS)
+    return facets
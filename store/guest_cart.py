@@ -0,0 +1,39 @@
+"""
+Cart for visitors who are not logged in, kept in a signed cookie.
+
+The cookie holds `product_id:quantity` pairs, so adding to a guest cart reads
+Product but never writes to the database. On login or registration the lines are
+merged into `Cart` with one upsert (store/transfers.py) and the cookie is cleared.
+"""
+from django.conf import settings
+from django.core import signing
+
+SALT = 'store.guest_cart'
+
+
+def read(request):
+    """{product_id: quantity} from the request's cookie; empty if missing or tampered with."""
+    try:
+        value = request.get_signed_cookie(settings.GUEST_CART_COOKIE, salt=SALT, max_age=settings.GUEST_CART_MAX_AGE)
+    except (KeyError, signing.BadSignature):
+        return {}
+    items = {}
+    for pair in value.split(','):
+        product_id, _, quantity = pair.partition(':')
+        if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+            items[int(product_id)] = int(quantity)
+    return items
+
+
+def write(response, items):
+    if not items:
+        return clear(response)
+    value = ','.join(f'{product_id}:{quantity}' for product_id, quantity in items.items())
+    response.set_signed_cookie(
+        settings.GUEST_CART_COOKIE, value, salt=SALT, max_age=settings.GUEST_CART_MAX_AGE,
+        httponly=True, samesite='Lax', secure=not settings.DEBUG,
+    )
+
+
+def clear(response):
+    response.delete_cookie(settings.GUEST_CART_COOKIE, samesite='Lax')
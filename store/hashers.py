@@ -0,0 +1,126 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import ScryptPasswordHasher, make_password, verify_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# Password Hasher
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    Scrypt with cost parameters read from the environment.
+
+    Scrypt is memory-hard and its cost is a single knob (work factor), so it can be
+    tuned per deployment without a code change. Hashes created with other
+    parameters (or with PBKDF2) are upgraded by Django on the next successful login.
+    """
+
+    work_factor = int(os.getenv('SCRYPT_WORK_FACTOR', 2**14))
+    block_size = int(os.getenv('SCRYPT_BLOCK_SIZE', 8))
+    parallelism = int(os.getenv('SCRYPT_PARALLELISM', 1))
+    # OpenSSL refuses anything above 32 MB unless told otherwise
+    maxmem = 2 * 128 * work_factor * block_size * parallelism
+
+
+# Login verification pool
+class LoginOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Login service is busy, please retry shortly.'
+    default_code = 'login_overloaded'
+    wait = 1  # Rendered as a Retry-After header by DRF
+
+
+class PasswordCheckPool:
+    """
+    Runs password verification on a bounded thread pool.
+
+    hashlib releases the GIL while hashing, so threads give real parallelism.
+    When more than `max_pending` checks are queued or running, new logins are
+    rejected straight away instead of piling up behind a saturated CPU.
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        self.workers = workers or getattr(settings, 'LOGIN_HASH_WORKERS', None) or os.cpu_count() or 1
+        self.max_pending = max_pending or getattr(settings, 'LOGIN_HASH_MAX_PENDING', None) or self.workers * 4
+        self.timeout = timeout or getattr(settings, 'LOGIN_HASH_TIMEOUT', 10)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='login-hash')
+
+    def _verify(self, password, encoded):
+        """Return (is_correct, new_encoded). new_encoded is set when the hash must be upgraded."""
+        if encoded is None:
+            # Unknown user: hash anyway so response time doesn't reveal which emails exist
+            make_password(password)
+            return False, None
+        is_correct, must_update = verify_password(password, encoded)
+        if is_correct and must_update:
+            return True, make_password(password)
+        return is_correct, None
+
+    def _release(self, future):
+        self._slots.release()
+
+    def check(self, password, encoded):
+        if not self._slots.acquire(blocking=False):
+            raise LoginOverloaded()
+        try:
+            future = self._executor.submit(self._verify, password, encoded)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise LoginOverloaded()
+
+    def authenticate(self, email, password):
+        """Return the active user matching email/password, or None."""
+        from .models import User
+
+        user = User.objects.filter(email=email).first() if email else None
+        encoded = user.password if user and user.has_usable_password() else None
+        is_correct, new_encoded = self.check(password, encoded)
+
+        if not is_correct or not user.is_active:
+            return None
+        if new_encoded:
+            # ✅ Transparently migrate old PBKDF2 hashes to the preferred hasher
+            user.password = new_encoded
+            user.save(update_fields=['password'])
+        return user
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_password_check_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordCheckPool()
+    return _pool
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend whose password check runs on the pool. Going through
+    django.contrib.auth.authenticate() keeps AUTHENTICATION_BACKENDS and the
+    user_login_failed signal working; LoginOverloaded propagates as a 503.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        from .models import User
+
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = get_password_check_pool().authenticate(username, password)
+        return user if user and self.user_can_authenticate(user) else None
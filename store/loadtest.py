@@ -0,0 +1,224 @@
+"""
+HTTP load-test harness for the store API.
+
+Virtual users register, log in and then loop over weighted journeys (browse,
+cart, wishlist, checkout, payment, order history) against a running server.
+Results are aggregated per endpoint template so runs can be compared between commits.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from urllib import error, request
+
+DEFAULT_WEIGHTS = {
+    'browse': 50,
+    'wishlist': 10,
+    'cart': 20,
+    'checkout': 10,
+    'payment': 5,
+    'history': 5,
+}
+
+
+class Client:
+    """Minimal JSON client that records latency per endpoint template."""
+
+    def __init__(self, base_url, stats, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.token = None
+
+    def call(self, method, path, name=None, body=None):
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+
+        req = request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with request.urlopen(req, timeout=self.timeout) as resp:
+                status, payload = resp.status, resp.read()
+        except error.HTTPError as exc:
+            status, payload = exc.code, exc.read()
+        except (error.URLError, OSError):
+            status, payload = 0, b''
+        self.stats.add(f'{method} {name or path}', time.perf_counter() - start, status)
+
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+
+class Stats:
+    """Per-thread samples, merged once at the end so recording takes no lock."""
+
+    def __init__(self):
+        self.samples = {}  # endpoint -> [(seconds, status), ...]
+
+    def add(self, endpoint, seconds, status):
+        self.samples.setdefault(endpoint, []).append((seconds, status))
+
+    def merge(self, other):
+        for endpoint, samples in other.samples.items():
+            self.samples.setdefault(endpoint, []).extend(samples)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, weights, deadline, seed, product_ids):
+        super().__init__(daemon=True)
+        self.stats = Stats()
+        self.client = Client(base_url, self.stats)
+        self.weights = weights
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.product_ids = product_ids
+        self.order_ids = []
+        self.iterations = 0
+
+    # Journeys
+    def signup(self):
+        email = f'loadtest-{uuid.uuid4().hex[:12]}@example.com'
+        password = uuid.uuid4().hex
+        self.client.call('POST', '/api/register/', body={'email': email, 'password': password})
+        status, body = self.client.call('POST', '/api/login/', body={'username': email, 'password': password})
+        if status == 200 and body:
+            self.client.token = body.get('token')
+        return self.client.token is not None
+
+    def product(self):
+        return self.rng.choice(self.product_ids) if self.product_ids else None
+
+    def browse(self):
+        self.client.call('GET', '/api/products/')
+        product_id = self.product()
+        if product_id:
+            self.client.call('GET', f'/api/products/{product_id}/', name='/api/products/{id}/')
+
+    def wishlist(self):
+        product_id = self.product()
+        if product_id:
+            self.client.call('POST', '/api/wishlist/', body={'product': product_id})
+        self.client.call('GET', '/api/wishlist/')
+
+    def cart(self):
+        for _ in range(self.rng.randint(1, 3)):
+            product_id = self.product()
+            if product_id:
+                self.client.call('POST', '/api/cart/', body={'product_id': product_id, 'quantity': self.rng.randint(1, 3)})
+        self.client.call('GET', '/api/cart/')
+
+    def checkout(self):
+        self.cart()
+        status, body = self.client.call('POST', '/api/place-order/')
+        if status == 201 and body and body.get('id'):
+            self.order_ids.append(body['id'])
+            return body['id']
+        return None
+
+    def payment(self):
+        order_id = self.checkout()
+        if order_id:
+            status, body = self.client.call('GET', f'/api/orders/{order_id}/', name='/api/orders/{id}/')
+            amount = (body or {}).get('total_price', '0.00') if status == 200 else '0.00'
+            self.client.call('POST', '/api/payments/', body={'order_id': order_id, 'amount': amount})
+
+    def history(self):
+        self.client.call('GET', '/api/payments/')
+        if self.order_ids:
+            order_id = self.rng.choice(self.order_ids)
+            self.client.call('GET', f'/api/orders/{order_id}/', name='/api/orders/{id}/')
+            self.client.call('GET', f'/api/order-items/{order_id}/', name='/api/order-items/{order_id}/')
+
+    def run(self):
+        if not self.signup():
+            return
+        journeys = list(self.weights)
+        weights = [self.weights[j] for j in journeys]
+        while time.monotonic() < self.deadline:
+            getattr(self, self.rng.choices(journeys, weights)[0])()
+            self.iterations += 1
+
+
+def fetch_product_ids(base_url, token=None):
+    client = Client(base_url, Stats())
+    client.token = token
+    status, body = client.call('GET', '/api/products/')
+    if status != 200 or not isinstance(body, list):
+        return []
+    return [product['id'] for product in body if 'id' in product]
+
+
+def run(base_url, users=10, duration=30, weights=None, seed=0):
+    """Run the load test and return the JSON-serialisable report."""
+    weights = weights or DEFAULT_WEIGHTS
+
+    # Product ids are only readable when authenticated, so borrow one virtual user's token
+    probe = VirtualUser(base_url, weights, 0, seed, [])
+    product_ids = fetch_product_ids(base_url, probe.client.token) if probe.signup() else []
+
+    start = time.monotonic()
+    deadline = start + duration
+    vus = [VirtualUser(base_url, weights, deadline, seed + i + 1, product_ids) for i in range(users)]
+    for vu in vus:
+        vu.start()
+    for vu in vus:
+        vu.join()
+    elapsed = time.monotonic() - start
+
+    stats = Stats()
+    for vu in vus:
+        stats.merge(vu.stats)
+    return report(stats, elapsed, users, weights, sum(vu.iterations for vu in vus))
+
+
+def report(stats, elapsed, users, weights, iterations):
+    endpoints = {}
+    total = errors = 0
+    for endpoint, samples in sorted(stats.samples.items()):
+        latencies = sorted(seconds for seconds, _ in samples)
+        failed = sum(1 for _, status in samples if status == 0 or status >= 400)
+        total += len(samples)
+        errors += failed
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'throughput_rps': round(len(samples) / elapsed, 2),
+            'error_rate': round(failed / len(samples), 4),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+    return {
+        'users': users,
+        'duration_s': round(elapsed, 2),
+        'weights': weights,
+        'journeys': iterations,
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+        'error_rate': round(errors / total, 4) if total else 0,
+        'endpoints': endpoints,
+    }
+
+
+def compare(baseline, current):
+    """Yield (endpoint, metric, before, after) for metrics present in both reports."""
+    for endpoint, after in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate'):
+            yield endpoint, metric, before[metric], after[metric]
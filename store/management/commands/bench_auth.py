@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from store.models import User
+from store.tokens import SignedTokenAuthentication, encode_access
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Authentication cost per request: DRF TokenAuthentication (one query per request) vs "
+            "signed access tokens verified in-process. The test user is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5_000)
+
+    def run(self, authentication, header, requests):
+        factory = RequestFactory()
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                request = factory.get('/api/cart/', HTTP_AUTHORIZATION=header)
+                start = time.perf_counter()
+                authentication.authenticate(request)
+                timings.append(time.perf_counter() - start)
+        return timings, len(queries) / requests
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        try:
+            with transaction.atomic():
+                user = User.objects.create_customer(email='bench-auth@example.com', password=None)
+                results = {
+                    'TokenAuthentication': self.run(TokenAuthentication(), f'Token {Token.objects.create(user=user).key}', requests),
+                    'SignedTokenAuthentication': self.run(SignedTokenAuthentication(), f'Bearer {encode_access(user)}', requests),
+                }
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{'backend':<27} {'median µs':>10} {'p99 µs':>10} {'queries/req':>12} {'auth/s/core':>12}")
+        for name, (timings, queries) in results.items():
+            timings.sort()
+            median = statistics.median(timings)
+            self.stdout.write(f"{name:<27} {median * 1e6:>10.1f} {timings[int(len(timings) * 0.99)] * 1e6:>10.1f} "
+                              f"{queries:>12.2f} {1 / median:>12.0f}")
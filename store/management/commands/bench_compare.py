@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from store import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Compare a benchmark run with the saved baseline and fail on regressions: a median more "
+            "than --threshold slower, or more queries. Runs the suite now unless --current is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', help='Defaults to BENCHMARK_DIR/<vendor>.json.')
+        parser.add_argument('--current', help='A saved run (bench_suite --save PATH) instead of running now.')
+        parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown, 0.25 = 25%%.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        baseline_path = options['baseline'] or benchmarks.baseline_path(connection.vendor)
+        try:
+            baseline = benchmarks.load(baseline_path)
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {baseline_path}; save one with `bench_suite --save`.')
+        if options['current']:
+            current = benchmarks.load(options['current'])
+        else:
+            # Same sizes as the baseline, so every sized case has something to compare with
+            sizes = sorted({int(name.rsplit('[', 1)[1][:-1]) for name in baseline['results'] if name.endswith(']')})
+            current = benchmarks.run(options['repeat'], sizes or benchmarks.runner.SIZES)
+        if baseline['vendor'] != current['vendor']:
+            raise CommandError(f"Baseline is {baseline['vendor']}, this run is {current['vendor']}.")
+
+        rows = benchmarks.compare(baseline, current, options['threshold'])
+        self.stdout.write(f"{'case':<40} {'baseline µs':>12} {'current µs':>12} {'change':>8}")
+        for name, before, now, problems in rows:
+            change = f'{(now / before - 1) * 100:+.0f}%' if before else '-'
+            self.stdout.write(f"{name:<40} {before or 0:>12.1f} {now:>12.1f} {change:>8}  {', '.join(problems)}")
+        regressions = [name for name, _, _, problems in rows if {'slower', 'more queries'} & set(problems)]
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) beyond {options['threshold']:.0%}: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f'No regressions beyond {options["threshold"]:.0%}.'))
@@ -0,0 +1,54 @@
+import copy
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+
+class Command(BaseCommand):
+    help = "Measure per-request connection overhead: fresh connection vs persistent vs pooled."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--requests', type=int, default=200, help='Simulated requests per mode.')
+
+    def wrapper(self, alias, mode):
+        settings_dict = copy.deepcopy(connections.settings[alias])
+        options = settings_dict['OPTIONS']
+        options.pop('pool', None)
+        settings_dict['CONN_MAX_AGE'] = 0
+        if mode == 'persistent':
+            settings_dict['CONN_MAX_AGE'] = None
+        elif mode == 'pooled':
+            options['pool'] = {'min_size': 1, 'max_size': 4}
+        backend = load_backend(settings_dict['ENGINE'])
+        return backend.DatabaseWrapper(settings_dict, alias=f'bench-{mode}')
+
+    def simulate(self, conn, requests):
+        start = time.perf_counter()
+        for _ in range(requests):
+            # What Django does around every request: connect (or reuse), query, release
+            conn.close_if_unusable_or_obsolete()
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.close_if_unusable_or_obsolete()
+        return (time.perf_counter() - start) / requests * 1000
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        requests = options['requests']
+        engine = connections.settings[alias]['ENGINE']
+
+        self.stdout.write(f"{'mode':<12} {'ms/request':>11}")
+        for mode in ('fresh', 'persistent', 'pooled'):
+            if mode == 'pooled' and not engine.endswith('postgresql'):
+                continue
+            conn = self.wrapper(alias, mode)
+            try:
+                ms = self.simulate(conn, requests)
+            finally:
+                conn.close()
+                if mode == 'pooled':
+                    conn.close_pool()
+            self.stdout.write(f"{mode:<12} {ms:>11.3f}")
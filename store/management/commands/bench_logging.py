@@ -0,0 +1,77 @@
+import logging
+import statistics
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from store.log import JsonFormatter, QueueingHandler, RequestIdFilter, SamplingFilter
+from store.models import Order, Product, User
+from store.views import OrderItemListView
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare checkout-path latency (adding order items) with synchronous vs queued logging."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--sample-rate', type=float, default=0.01, help='DEBUG sampling rate for the queued run.')
+
+    def handlers(self, sample_rate):
+        # Old behaviour: every line formatted and written on the request thread, like print()
+        sync = logging.StreamHandler(sys.stdout)
+        sync.setFormatter(JsonFormatter())
+        sync.addFilter(RequestIdFilter())
+
+        queued = QueueingHandler()
+        queued.addFilter(RequestIdFilter())
+        queued.addFilter(SamplingFilter(sample_rate))
+        return [('none', None), ('sync stdout', sync), ('queued', queued)]
+
+    def run(self, requests, handler):
+        logger = logging.getLogger('store')
+        saved = logger.handlers, logger.level, logger.propagate
+        logger.handlers = [handler] if handler else []
+        logger.setLevel(logging.DEBUG if handler else logging.CRITICAL)
+        logger.propagate = False
+
+        factory = APIRequestFactory()
+        view = OrderItemListView.as_view()
+        latencies = []
+        try:
+            with transaction.atomic():
+                user = User.objects.create_customer(email='bench-logging@example.com', password=None)
+                product = Product.objects.create(name='Bench product', price='9.99', stock=1000)
+                order = Order.objects.create(user=user)
+                for _ in range(requests):
+                    request = factory.post('/api/order-items/', {'order_id': order.id, 'product_id': product.id, 'quantity': 1}, format='json')
+                    force_authenticate(request, user=user)
+                    start = time.perf_counter()
+                    view(request)
+                    latencies.append(time.perf_counter() - start)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            if handler:
+                handler.close()
+            logger.handlers, logger.level, logger.propagate = saved
+
+        latencies.sort()
+        return statistics.mean(latencies) * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+    def handle(self, *args, **options):
+        results = []
+        for name, handler in self.handlers(options['sample_rate']):
+            results.append((name, *self.run(options['requests'], handler)))
+
+        # Printed last so the log lines above don't bury the summary
+        self.stdout.write(f"{'logging':<12} {'mean ms':>9} {'p95 ms':>9}")
+        for name, mean, p95 in results:
+            self.stdout.write(f"{name:<12} {mean:>9.3f} {p95:>9.3f}")
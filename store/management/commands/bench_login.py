@@ -0,0 +1,43 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hasher, get_hashers, make_password, verify_password
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Benchmark login password verification (logins/sec per core) for each configured hasher."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Verifications per hasher and mode.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Threads for the pooled run.')
+
+    def run(self, encoded, logins, workers):
+        start = time.perf_counter()
+        if workers == 1:
+            for _ in range(logins):
+                verify_password('correct horse battery staple', encoded)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda _: verify_password('correct horse battery staple', encoded), range(logins)))
+        return logins / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        logins = options['logins']
+        workers = options['workers']
+        preferred = get_hasher('default')
+
+        self.stdout.write(f"{'hasher':<14} {'params':<60} {'1 thread/s':>11} {f'{workers} threads/s':>13} {'per core/s':>11}")
+        for hasher in get_hashers():
+            encoded = make_password('correct horse battery staple', hasher=hasher.algorithm)
+            params = {k: v for k, v in hasher.decode(encoded).items() if k not in ('algorithm', 'salt', 'hash')}
+
+            single = self.run(encoded, logins, 1)
+            pooled = self.run(encoded, logins, workers)
+            label = f"{hasher.algorithm}{'*' if hasher is preferred else ''}"
+            self.stdout.write(
+                f"{label:<14} {str(params):<60} {single:>11.1f} {pooled:>13.1f} {pooled / workers:>11.1f}"
+            )
+
+        self.stdout.write("* preferred hasher; older hashes are upgraded to it on login")
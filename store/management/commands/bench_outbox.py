@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from store.models import OutboxCursor, OutboxEvent
+from store.outbox import deliver, sequence
+
+TOPIC = 'bench'
+
+
+def write(rate, stop_at, per_transaction, written):
+    """Writer process: commit `per_transaction` events at a time, paced to `rate` events/s."""
+    interval = per_transaction / rate
+    next_at = time.perf_counter()
+    while time.perf_counter() < stop_at:
+        with transaction.atomic():
+            OutboxEvent.objects.bulk_create(
+                OutboxEvent(topic=TOPIC, object_id=i, event=OutboxEvent.CREATED,
+                            payload={'id': i, 'total_price': '19.90', 'status': 'pending'})
+                for i in range(per_transaction)
+            )
+        with written.get_lock():
+            written.value += per_transaction
+        next_at += interval
+        time.sleep(max(0.0, next_at - time.perf_counter()))
+    connections.close_all()
+
+
+class LagSink:
+    def __init__(self):
+        self.lags = []
+
+    def send(self, events):
+        now = timezone.now()
+        self.lags.extend((now - event['created_at']).total_seconds() for event in events)
+
+
+class Command(BaseCommand):
+    help = ("Outbox throughput. Drain: how fast the relay sequences and delivers a --backlog of "
+            "committed events. Live: writer processes commit events at --rate per second while this "
+            "process relays them, with commit-to-delivery lag. Bench events and the bench cursor "
+            "are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=int, default=10_000, help='Target events per second.')
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--per-transaction', type=int, default=20, help='Events per writer transaction (e.g. one order).')
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=2000, help='Relay delivery batch.')
+        parser.add_argument('--backlog', type=int, default=100_000, help='Events for the drain run (0 to skip).')
+
+    def drain(self, backlog, batch_size):
+        OutboxEvent.objects.bulk_create(
+            (OutboxEvent(topic=TOPIC, object_id=i, event=OutboxEvent.CREATED, payload={'id': i, 'status': 'pending'})
+             for i in range(backlog)), batch_size=5000,
+        )
+        start = time.perf_counter()
+        while sequence(10_000):
+            pass
+        sequenced = time.perf_counter() - start
+        delivered = deliver(TOPIC, LagSink(), batch_size)
+        total = time.perf_counter() - start
+        self.stdout.write(f"drain      {delivered} events: sequence {backlog / sequenced:,.0f}/s, "
+                          f"deliver {delivered / (total - sequenced):,.0f}/s, both {delivered / total:,.0f}/s")
+        OutboxEvent.objects.filter(topic=TOPIC).delete()
+        OutboxCursor.objects.filter(name=f'sink:{TOPIC}').delete()
+
+    def handle(self, *args, **options):
+        if options['backlog']:
+            self.drain(options['backlog'], options['batch_size'])
+        rate, seconds, writers = options['rate'], options['seconds'], options['writers']
+        for conn in connections.all():  # Children must not inherit this process's connections or pool
+            conn.close()
+            if conn.vendor == 'postgresql':
+                conn.close_pool()
+        context = multiprocessing.get_context('fork')
+        written = context.Value('q', 0)
+        start = time.perf_counter()
+        processes = [context.Process(target=write, args=(rate / writers, start + seconds, options['per_transaction'], written))
+                     for _ in range(writers)]
+        for process in processes:
+            process.start()
+
+        sink, delivered, relay_seconds = LagSink(), 0, 0.0
+        while True:
+            running = any(process.is_alive() for process in processes)
+            pass_start = time.perf_counter()
+            while sequence(10_000):
+                pass
+            sent = deliver(TOPIC, sink, options['batch_size'])
+            relay_seconds += time.perf_counter() - pass_start
+            delivered += sent
+            if not running and delivered >= written.value:
+                break
+            if not sent:
+                time.sleep(0.005)
+        drained = time.perf_counter() - start
+
+        OutboxEvent.objects.filter(topic=TOPIC).delete()
+        OutboxCursor.objects.filter(name=f'sink:{TOPIC}').delete()
+
+        lags = sorted(sink.lags)
+        self.stdout.write(f"live       {writers} writer processes on {os.cpu_count()} CPUs")
+        self.stdout.write(f"written    {written.value} events in {seconds:.1f}s = {written.value / seconds:,.0f}/s (target {rate:,}/s)")
+        self.stdout.write(f"relayed    {delivered} events in {relay_seconds:.2f}s of relay work = {delivered / relay_seconds:,.0f}/s")
+        self.stdout.write(f"drained    {drained:.2f}s after start")
+        self.stdout.write(f"lag        p50 {statistics.median(lags) * 1000:.0f} ms, p99 {lags[int(len(lags) * 0.99)] * 1000:.0f} ms")
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Product, Promotion
+from store.promotions import compile_index
+
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', None]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Price carts against many active promotions: compiled per-product index vs scanning every "
+            "rule for every line. Rules and products are created in a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', type=int, default=10_000)
+        parser.add_argument('--products', type=int, default=20_000)
+        parser.add_argument('--lines', type=int, default=100, help='Lines per cart.')
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def seed(self, rng, rules, products):
+        products = Product.objects.bulk_create(
+            Product(name=f'Bench promo product {i}', price=Decimal(rng.randint(100, 50_000)) / 100,
+                    stock=10, product_size=rng.choice(SIZES))
+            for i in range(products)
+        )
+        kinds = [Promotion.PERCENT_OFF] * 6 + [Promotion.BUY_X_GET_Y] * 3 + [Promotion.CART_THRESHOLD]
+        promotions = Promotion.objects.bulk_create(
+            Promotion(name=f'Bench rule {i}', kind=kind, percent=Decimal(rng.randint(5, 50)),
+                      buy_quantity=rng.randint(1, 3), free_quantity=1,
+                      min_subtotal=Decimal(rng.randint(1_000, 20_000)),
+                      # A few catalogue-wide size deals; everything else targets a handful of products
+                      sizes=rng.choice(SIZES[:-1]) if kind != Promotion.CART_THRESHOLD and i % 500 == 0 else '')
+            for i, kind in ((i, rng.choice(kinds)) for i in range(rules))
+        )
+        Promotion.products.through.objects.bulk_create(
+            Promotion.products.through(promotion_id=promotion.id, product_id=product.id)
+            for promotion in promotions if promotion.kind != Promotion.CART_THRESHOLD and not promotion.sizes
+            for product in rng.sample(products, rng.randint(1, 5))
+        )
+        return products
+
+    def naive(self, index, lines):
+        """What evaluating without the index costs: every rule checked against every line."""
+        rules = [rule for bucket in (*index.by_product.values(), *index.by_size.values(), index.everywhere) for rule in bucket]
+        scope = {}
+        for product_id, bucket in index.by_product.items():
+            for rule in bucket:
+                scope.setdefault(rule.id, set()).add(product_id)
+        total = Decimal(0)
+        for product, quantity in lines:
+            best = Decimal(0)
+            for rule in rules:
+                if rule.id in scope and product.id not in scope[rule.id]:
+                    continue
+                if rule.sizes and product.product_size not in rule.sizes:
+                    continue
+                if rule.kind == Promotion.PERCENT_OFF:
+                    best = max(best, product.price * quantity * rule.rate)
+                else:
+                    best = max(best, product.price * (quantity // (rule.buy + rule.free) * rule.free))
+            total += product.price * quantity - best
+        return total
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                products = self.seed(rng, options['rules'], options['products'])
+                start = time.perf_counter()
+                index = compile_index()
+                compile_seconds = time.perf_counter() - start
+                carts = [[(p, rng.randint(1, 4)) for p in rng.sample(products, options['lines'])]
+                         for _ in range(options['carts'])]
+
+                timings = []
+                for cart in carts:
+                    start = time.perf_counter()
+                    index.price(cart)
+                    timings.append(time.perf_counter() - start)
+                naive = []
+                for cart in carts[:max(1, len(carts) // 20)]:  # Slow; a sample is enough
+                    start = time.perf_counter()
+                    self.naive(index, cart)
+                    naive.append(time.perf_counter() - start)
+                raise Rollback
+        except Rollback:
+            pass
+
+        indexed, scanned = statistics.median(timings), statistics.median(naive)
+        self.stdout.write(f"{index.size} active rules, {options['lines']}-line carts, {options['carts']} carts")
+        self.stdout.write(f'compile index      {compile_seconds * 1000:9.1f} ms (once per change)')
+        self.stdout.write(f'indexed per cart   {indexed * 1000:9.3f} ms (p95 {sorted(timings)[int(len(timings) * 0.95)] * 1000:.3f} ms)')
+        self.stdout.write(f'scan per cart      {scanned * 1000:9.3f} ms ({scanned / indexed:.0f}x slower)')
@@ -0,0 +1,78 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from store.middleware import CompressionMiddleware, brotli
+from store.models import Product
+from store.renderers import ORJSONRenderer
+from store.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare JSON rendering time and response size (plain/gzip/brotli) for a large product list."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--from-db', action='store_true', help='Render real products instead of generated ones.')
+
+    def products(self, count, from_db):
+        if from_db:
+            return list(Product.objects.order_by('id')[:count])
+        now = timezone.now()
+        return [
+            Product(id=i, name=f'Product {i}', description='Generated product for rendering benchmarks',
+                    price=Decimal(f'{100 + i % 9000}.{i % 100:02d}'), stock=i % 500,
+                    image_url=f'https://cdn.example.com/products/{i}.jpg', product_size='M',
+                    created_at=now - timedelta(minutes=i))
+            for i in range(1, count + 1)
+        ]
+
+    def time_render(self, renderer, data, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = renderer.render(data, 'application/json', {})
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000, body
+
+    def handle(self, *args, **options):
+        products = self.products(options['products'], options['from_db'])
+        payloads = {
+            # What ProductViewSet returns: DecimalField already coerced to strings
+            'serializer': ProductSerializer(products, many=True).data,
+            # .values()-style rows, where Decimal and datetime reach the encoder
+            'raw values': [
+                {f.attname: getattr(p, f.attname) for f in Product._meta.concrete_fields} for p in products
+            ],
+        }
+        compression = CompressionMiddleware(lambda request: None)
+
+        self.stdout.write(f'{len(products)} products, median of {options["repeat"]} runs')
+        self.stdout.write(f"{'payload':<12} {'renderer':<10} {'ms':>9} {'bytes':>10}")
+        for name, data in payloads.items():
+            bodies = {}
+            for label, renderer in (('drf', JSONRenderer()), ('orjson', ORJSONRenderer())):
+                ms, bodies[label] = self.time_render(renderer, data, options['repeat'])
+                self.stdout.write(f'{name:<12} {label:<10} {ms:>9.2f} {len(bodies[label]):>10}')
+            if bodies['drf'] != bodies['orjson']:
+                self.stdout.write(self.style.WARNING(f'{name}: renderers produced different output'))
+            if name == 'serializer':
+                body = bodies['orjson']
+        self.stdout.write(f"\n{'encoding':<12} {'ms':>9} {'bytes':>10} {'ratio':>7}")
+        self.stdout.write(f"{'identity':<12} {0:>9.2f} {len(body):>10} {1:>7.2f}")
+        encodings = ['gzip'] + (['br'] if brotli is not None else [])
+        for encoding in encodings:
+            start = time.perf_counter()
+            compressed = compression.compress(body, encoding)
+            ms = (time.perf_counter() - start) * 1000
+            self.stdout.write(f'{encoding:<12} {ms:>9.2f} {len(compressed):>10} {len(body) / len(compressed):>7.2f}')
+        if brotli is None:
+            self.stdout.write('brotli: not installed')
+        self.stdout.write(f'(gzip level {settings.COMPRESSION_GZIP_LEVEL}, brotli quality {settings.COMPRESSION_BROTLI_QUALITY})')
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Cart, Payment, Product, User, Wishlist
+from store.serializers import CartSerializer, PaymentSerializer, ProductSerializer, WishlistSerializer, compiled
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare per-row list serialization cost of DRF serializers and their compiled read paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def seed(self, rows):
+        user = User.objects.create_customer(email='bench-serializers@example.com', password=None)
+        products = Product.objects.bulk_create(
+            Product(name=f'Bench product {i}', price=f'{10 + i % 500}.{i % 100:02d}', stock=i % 50,
+                    image_url=f'https://cdn.example.com/bench/{i}.jpg', product_size='M')
+            for i in range(rows)
+        )
+        Cart.objects.bulk_create(Cart(user=user, product=p, quantity=1 + i % 3) for i, p in enumerate(products))
+        Wishlist.objects.bulk_create(Wishlist(user=user, product=p) for p in products)
+        Payment.objects.bulk_create(Payment(user=user, amount=p.price, status=Payment.STATUS_COMPLETED) for p in products)
+        return user, [p.id for p in products]
+
+    def median(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        results = []
+        try:
+            with transaction.atomic():
+                user, product_ids = self.seed(rows)
+                cases = [
+                    (ProductSerializer, Product.objects.filter(id__in=product_ids)),
+                    (CartSerializer, Cart.objects.filter(user=user)),
+                    (WishlistSerializer, Wishlist.objects.filter(user=user)),
+                    (PaymentSerializer, Payment.objects.filter(user=user)),
+                ]
+                for serializer_class, queryset in cases:
+                    # .all() gives each run a fresh queryset, so both paths pay for the query
+                    drf = self.median(lambda: serializer_class(queryset.all(), many=True).data, repeat)
+                    fast = self.median(lambda: compiled(serializer_class).serialize(queryset.all()), repeat)
+                    same = compiled(serializer_class).serialize(queryset.all()) == serializer_class(queryset.all(), many=True).data
+                    results.append((serializer_class.__name__, drf, fast, same))
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f'{rows} rows, median of {repeat} runs (query time included)')
+        self.stdout.write(f"{'serializer':<20} {'drf us/row':>11} {'compiled':>11} {'speedup':>8}  parity")
+        for name, drf, fast, same in results:
+            self.stdout.write(f'{name:<20} {drf / rows * 1e6:>11.2f} {fast / rows * 1e6:>11.2f} {drf / fast:>7.1f}x  {"ok" if same else "MISMATCH"}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from store import benchmarks
+from store.benchmarks.cases import CASES
+
+
+class Command(BaseCommand):
+    help = ("Time the hot paths (OrderItem.save, Order.calculate_total_price, Cart/Order serializers, "
+            "checkout views) against the configured database; --save keeps the run as a JSON baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10_000], help='Rows per sized case.')
+        parser.add_argument('--case', action='append', choices=list(CASES), help='Only these cases (repeatable).')
+        parser.add_argument('--save', nargs='?', const='', metavar='PATH',
+                            help='Write the report; defaults to BENCHMARK_DIR/<vendor>.json.')
+
+    def handle(self, *args, **options):
+        report = benchmarks.run(options['repeat'], options['sizes'], options['case'])
+        self.stdout.write(f"{report['vendor']}, median of {report['repeat']} runs, per operation")
+        self.stdout.write(f"{'case':<40} {'median µs':>12} {'min µs':>12} {'queries/run':>12}")
+        for name, result in report['results'].items():
+            self.stdout.write(f"{name:<40} {result['median_us']:>12.1f} {result['min_us']:>12.1f} {result['queries']:>12}")
+        if options['save'] is not None:
+            self.stdout.write(f"Saved {benchmarks.save(report, options['save'] or None)}")
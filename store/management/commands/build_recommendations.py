@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.recommendations import build
+
+
+class Command(BaseCommand):
+    help = "Update 'frequently bought together' recommendations from order items added since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20, help='Neighbours stored per product.')
+        parser.add_argument('--full', action='store_true', help='Ignore the saved matrix and rebuild from all orders.')
+
+    def handle(self, *args, **options):
+        build(top_k=options['top_k'], full=options['full'], log=self.stdout.write)
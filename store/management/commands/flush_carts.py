@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store.cart_storage import get_storage
+
+
+class Command(BaseCommand):
+    help = ("Write cached (write-behind) carts to the Cart table. Run from cron as a backstop for the "
+            "in-process flusher, and after restarting web processes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=0, help='Only carts dirty for at least this many seconds.')
+
+    def handle(self, *args, **options):
+        storage = get_storage()
+        if not storage.deferred:
+            self.stdout.write('CART_STORAGE writes through; nothing to flush.')
+            return
+        self.stdout.write(f"Flushed {storage.flush_due(min_age=options['min_age'])} carts")
@@ -0,0 +1,59 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import loadtest
+
+
+class Command(BaseCommand):
+    help = "Run weighted user journeys against a running server and report per-endpoint latency as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users.')
+        parser.add_argument('--duration', type=int, default=30, help='Seconds to run.')
+        parser.add_argument('--weights', help='Journey weights, e.g. browse=50,cart=20,checkout=10')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here.')
+        parser.add_argument('--compare', help='A previous JSON report to diff against.')
+
+    def parse_weights(self, value):
+        if not value:
+            return dict(loadtest.DEFAULT_WEIGHTS)
+        weights = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name not in loadtest.DEFAULT_WEIGHTS or not weight.isdigit():
+                raise CommandError(f"Bad weight '{part}'. Journeys: {', '.join(loadtest.DEFAULT_WEIGHTS)}")
+            weights[name] = int(weight)
+        return weights
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+        except OSError:
+            return None
+
+    def handle(self, *args, **options):
+        result = loadtest.run(
+            options['base_url'],
+            users=options['users'],
+            duration=options['duration'],
+            weights=self.parse_weights(options['weights']),
+            seed=options['seed'],
+        )
+        result['commit'] = self.commit()
+
+        output = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stdout.write(f"\n{'endpoint':<40} {'metric':<15} {'before':>10} {'after':>10}")
+            for endpoint, metric, before, after in loadtest.compare(baseline, result):
+                self.stdout.write(f"{endpoint:<40} {metric:<15} {before:>10} {after:>10}")
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from store import partitions
+
+
+class Command(BaseCommand):
+    help = ("Maintain monthly Order/OrderItem/Payment partitions: create the coming months, archive "
+            "months past retention to gzipped CSV, refresh the id ranges used for pruning. Run daily.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.PARTITION_MONTHS_AHEAD, help='Months to create in advance.')
+        parser.add_argument('--retain', type=int, default=settings.PARTITION_RETAIN_MONTHS, help='Full months to keep attached.')
+        parser.add_argument('--archive-dir', default=str(settings.PARTITION_ARCHIVE_DIR))
+        parser.add_argument('--dry-run', action='store_true', help='Only list the partitions that would be archived.')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned(partitions.Order._meta.db_table):
+            raise CommandError('Orders are not partitioned (PostgreSQL with migration 0017 applied is required).')
+
+        if not options['dry_run']:
+            for name in partitions.ensure_partitions(ahead=options['ahead']):
+                self.stdout.write(f'Created {name}')
+
+        cutoff = partitions.add_months(partitions.month_start(timezone.now()), -options['retain'])
+        for archived in partitions.archive_before(cutoff, options['archive_dir'], dry_run=options['dry_run']):
+            self.stdout.write(f"{'Would archive' if options['dry_run'] else 'Archived'} {archived}")
+
+        if not options['dry_run']:
+            self.stdout.write(f'Refreshed bounds of {partitions.refresh_bounds()} order partitions')
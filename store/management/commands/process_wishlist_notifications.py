@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.notifications import process_pending
+
+
+class Command(BaseCommand):
+    help = "Fan out pending back-in-stock / price-drop notifications to wishlist watchers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Wishlist rows per batch insert.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending(chunk_size=options['chunk_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} job(s)")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from store.tokens import purge_expired
+
+
+class Command(BaseCommand):
+    help = ("Delete expired refresh tokens and access-token revocations (the tokens they cover have "
+            "expired). Run from cron; it keeps the denylist every process reloads small.")
+
+    def handle(self, *args, **options):
+        revocations, refresh_tokens = purge_expired()
+        self.stdout.write(f"Deleted {revocations} revocations and {refresh_tokens} refresh tokens")
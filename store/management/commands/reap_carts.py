@@ -0,0 +1,51 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store import metrics, reaper
+
+
+class Command(BaseCommand):
+    help = ("Delete carts whose every line is older than CART_TTL_DAYS, in small keyset batches. "
+            "Optionally export them to CSV first (e.g. for win-back campaigns). Run from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-days', type=int, default=settings.CART_TTL_DAYS)
+        parser.add_argument('--field', choices=reaper.TTL_FIELDS, default=settings.CART_TTL_FIELD,
+                            help='Age carts by last activity (updated_at) or by when lines were added.')
+        parser.add_argument('--batch-size', type=int, default=settings.CART_REAPER_BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=settings.CART_REAPER_SLEEP, help='Seconds between batches.')
+        parser.add_argument('--export', help='Write reaped lines to this CSV (.csv.gz to compress) before deleting.')
+        parser.add_argument('--metrics-file', help='Write run counters in Prometheus text format (node_exporter textfile).')
+        parser.add_argument('--dry-run', action='store_true', help='Count (and export) without deleting.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['ttl_days'])
+        stream, writer = reaper.open_export(options['export']) if options['export'] else (None, None)
+        try:
+            stats = reaper.reap(
+                cutoff, field=options['field'], batch_size=options['batch_size'], sleep=options['sleep'],
+                writer=writer, dry_run=options['dry_run'],
+                log=self.stdout.write if options['verbosity'] > 1 else None,
+            )
+        finally:
+            if stream is not None:
+                stream.close()
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f"{verb} {stats['rows']} cart lines of {stats['users']} carts older than "
+                          f"{cutoff:%Y-%m-%d %H:%M} in {stats['batches']} batches")
+        if options['export']:
+            self.stdout.write(f"Exported {stats['exported']} lines to {options['export']}")
+
+        if options['metrics_file'] and not options['dry_run']:
+            counters = {f'cart_reaper_last_run_{key}': (f'Cart reaper {key} in the last run.', value)
+                        for key, value in stats.items()}
+            counters['cart_reaper_last_run_timestamp_seconds'] = ('End of the last cart reaper run.', int(timezone.now().timestamp()))
+            tmp = options['metrics_file'] + '.tmp'
+            with open(tmp, 'w') as out:
+                out.write('\n'.join(metrics.render_counters(counters, kind='gauge')) + '\n')
+            os.replace(tmp, options['metrics_file'])  # The collector never reads a partial file
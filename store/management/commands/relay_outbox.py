@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.outbox import get_sinks, purge, relay
+
+
+class Command(BaseCommand):
+    help = ("Sequence committed outbox events and deliver them, in order and at least once, to the "
+            "sinks in OUTBOX_SINKS. Run one relay per sink set; a second one waits on the cursor locks.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sink', action='append', help='Only this sink (repeatable). Default: all of them.')
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep relaying.')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to wait when caught up, with --loop.')
+        parser.add_argument('--purge', action='store_true', help='Delete delivered events past OUTBOX_RETENTION_DAYS.')
+
+    def handle(self, *args, **options):
+        sinks = get_sinks(options['sink'])
+        if options['sink'] and len(sinks) != len(options['sink']):
+            raise CommandError(f"Unknown sink; configured: {', '.join(settings.OUTBOX_SINKS)}")
+        while True:
+            sequenced, delivered = relay(sinks, options['batch_size'])
+            if sequenced or any(delivered.values()):
+                self.stdout.write(f"Sequenced {sequenced}; delivered " + ', '.join(f'{n} to {name}' for name, n in delivered.items()))
+            if options['purge']:
+                self.stdout.write(f"Purged {purge(list(sinks))} delivered events")
+            if not options['loop']:
+                break
+            if not sequenced:
+                time.sleep(options['interval'])
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = "Generate deterministic, Zipf-skewed users, products, carts, wishlists, orders and payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--products', type=int, default=2_000)
+        parser.add_argument('--orders', type=int, default=50_000)
+        parser.add_argument('--items-per-order', type=float, default=4, help='Mean order items per order.')
+        parser.add_argument('--cart-items', type=int, default=20_000, help='Cart rows to draw (duplicates are merged).')
+        parser.add_argument('--wishlist-items', type=int, default=20_000, help='Wishlist rows to draw (duplicates are merged).')
+        parser.add_argument('--paid-ratio', type=float, default=0.8, help='Share of orders with a completed payment.')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for product popularity.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=4, help='Parallel loaders (PostgreSQL only).')
+        parser.add_argument('--batch-size', type=int, default=50_000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        seeder = Seeder(
+            users=options['users'],
+            products=options['products'],
+            orders=options['orders'],
+            items_per_order=options['items_per_order'],
+            cart_items=options['cart_items'],
+            wishlist_items=options['wishlist_items'],
+            paid_ratio=options['paid_ratio'],
+            zipf_s=options['zipf'],
+            seed=options['seed'],
+            workers=options['workers'],
+            using=options['database'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        seeder.run()
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - start:.1f}s"))
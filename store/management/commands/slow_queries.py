@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.slow_queries import get_log
+
+
+class Command(BaseCommand):
+    help = ("Show the statements the slow-query recorder captured (SLOW_QUERY_MS), most total time first. "
+            "Sees other processes' captures only when SLOW_QUERY_CACHE_ALIAS is a shared cache.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--plans', action='store_true', help='Print the captured EXPLAIN plans and stacks.')
+        parser.add_argument('--clear', action='store_true', help='Forget everything recorded so far.')
+
+    def handle(self, *args, **options):
+        log = get_log()
+        if options['clear']:
+            log.clear()
+            self.stdout.write('Cleared the slow query log')
+            return
+        entries = log.entries()[:options['limit']]
+        if not settings.SLOW_QUERY_MS:
+            self.stdout.write(self.style.WARNING('SLOW_QUERY_MS is 0: nothing new is being recorded'))
+        self.stdout.write(f"{'fingerprint':<17} {'count':>7} {'total ms':>10} {'max ms':>9}  views / sql")
+        for entry in entries:
+            views = ', '.join(f'{view} ({count})' for view, count in sorted(entry['views'].items(), key=lambda item: -item[1]))
+            self.stdout.write(f"{entry['fingerprint']:<17} {entry['count']:>7} {entry['total_ms']:>10.1f} {entry['max_ms']:>9.1f}  {views}")
+            self.stdout.write(f"{'':<47}{entry['sql'][:200]}")
+            if options['plans']:
+                for frame in entry['stack']:
+                    self.stdout.write(f'    at {frame}')
+                for line in (entry['plan'] or '(no plan sampled yet)').splitlines():
+                    self.stdout.write(f'    {line}')
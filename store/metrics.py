@@ -0,0 +1,186 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Request latency buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RouteStats:
+    __slots__ = ('count', 'buckets', 'seconds', 'errors', 'queries', 'query_seconds', 'serializer_seconds', 'response_bytes')
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Last slot is +Inf
+        self.seconds = 0.0
+        self.errors = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.response_bytes = 0
+
+    def merge(self, other):
+        self.count += other.count
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.seconds += other.seconds
+        self.errors += other.errors
+        self.queries += other.queries
+        self.query_seconds += other.query_seconds
+        self.serializer_seconds += other.serializer_seconds
+        self.response_bytes += other.response_bytes
+
+
+class RequestTimings:
+    """Counters for the request currently running on this thread."""
+
+    __slots__ = ('queries', 'query_seconds', 'serializer_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+# Each thread writes only to its own registry, so recording needs no lock.
+# The lock is only taken when a new thread registers or when /metrics reads.
+_local = threading.local()
+_registries = []
+_registries_lock = threading.Lock()
+
+
+# Counters bumped by maintenance jobs (cart reaper, ...) running in this process: {name: (help, value)}
+_job_counters = {}
+
+
+def increment(name, value, help_text=''):
+    with _registries_lock:
+        _, current = _job_counters.get(name, (help_text, 0))
+        _job_counters[name] = (help_text, current + value)
+
+
+def job_counters():
+    with _registries_lock:
+        return dict(_job_counters)
+
+
+def render_counters(counters, kind='counter'):
+    """Prometheus lines for {name: (help, value)}; also used for node_exporter textfiles."""
+    lines = []
+    for name, (help_text, value) in sorted(counters.items()):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return lines
+
+
+def _registry():
+    registry = getattr(_local, 'registry', None)
+    if registry is None:
+        registry = _local.registry = {}
+        with _registries_lock:
+            _registries.append(registry)
+    return registry
+
+
+def start_request():
+    timings = _local.timings = RequestTimings()
+    return timings
+
+
+def finish_request():
+    _local.timings = None
+
+
+def current_timings():
+    return getattr(_local, 'timings', None)
+
+
+def record(route, seconds, status_code, response_bytes, timings):
+    registry = _registry()
+    stats = registry.get(route)
+    if stats is None:
+        stats = registry[route] = RouteStats()
+
+    stats.count += 1
+    stats.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    stats.seconds += seconds
+    stats.response_bytes += response_bytes
+    stats.queries += timings.queries
+    stats.query_seconds += timings.query_seconds
+    stats.serializer_seconds += timings.serializer_seconds
+    if status_code >= 500:
+        stats.errors += 1
+
+
+def snapshot():
+    """Aggregate every thread's counters into one {route: RouteStats} dict."""
+    totals = {}
+    with _registries_lock:
+        registries = list(_registries)
+    for registry in registries:
+        for route, stats in list(registry.items()):
+            totals.setdefault(route, RouteStats()).merge(stats)
+    return totals
+
+
+def render_prometheus():
+    totals = snapshot()
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by URL name.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for route, stats in sorted(totals.items()):
+        cumulative = 0
+        for bound, hits in zip(LATENCY_BUCKETS + ('+Inf',), stats.buckets):
+            cumulative += hits
+            lines.append(f'http_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{route="{route}"}} {stats.seconds}')
+        lines.append(f'http_request_duration_seconds_count{{route="{route}"}} {stats.count}')
+
+    counters = [
+        ('http_request_errors_total', 'Responses with a 5xx status.', 'errors'),
+        ('db_queries_total', 'Database queries executed.', 'queries'),
+        ('db_query_seconds_total', 'Time spent executing database queries.', 'query_seconds'),
+        ('serializer_seconds_total', 'Time spent building serializer output.', 'serializer_seconds'),
+        ('http_response_bytes_total', 'Response body bytes sent.', 'response_bytes'),
+    ]
+    for name, help_text, attr in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for route, stats in sorted(totals.items()):
+            lines.append(f'{name}{{route="{route}"}} {getattr(stats, attr)}')
+
+    lines.extend(render_counters(job_counters()))
+    return '\n'.join(lines) + '\n'
+
+
+def instrument_serializers():
+    """Time DRF serializer `.data` so it can be attributed to the current request."""
+    from rest_framework import serializers
+
+    def timed(fget):
+        def data(self):
+            timings = current_timings()
+            if timings is None:
+                return fget(self)
+            start = time.perf_counter()
+            try:
+                return fget(self)
+            finally:
+                timings.serializer_seconds += time.perf_counter() - start
+        return data
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'instrumented', False):
+            wrapped = timed(cls.data.fget)
+            wrapped.instrumented = True
+            cls.data = property(wrapped)
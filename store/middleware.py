@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+from . import metrics
+from .log import request_id
+from .routers import reset_pin, wrote_to_primary
+
+
+class RequestIdMiddleware:
+    """Tags every log record of a request with its X-Request-ID (generated if absent)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rid = request.META.get('HTTP_X_REQUEST_ID') or uuid.uuid4().hex
+        token = request_id.set(rid[:64])
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response['X-Request-ID'] = rid[:64]
+        return response
+
+
+class PerformanceMiddleware:
+    """
+    Records latency, DB query count/time, serializer time and response size per URL name.
+
+    Counters live in per-thread registries (see store.metrics) and are exposed at
+    /metrics. With DEBUG on, the request's own numbers go out as a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            metrics.finish_request()
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        size = 0 if response.streaming else len(response.content)
+        metrics.record(route, elapsed, response.status_code, size, timings)
+
+        if settings.DEBUG:
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.2f}, '
+                f'db;dur={timings.query_seconds * 1000:.2f};desc="{timings.queries} queries", '
+                f'ser;dur={timings.serializer_seconds * 1000:.2f}'
+            )
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes for replica routing.
+
+    A client that wrote within the last REPLICA_STICKY_SECONDS has all of its reads
+    sent to the primary. Clients are identified by their auth token or session key
+    (hashed), so no database lookup is needed to decide. Use a shared cache backend
+    when running more than one process.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def client_key(self, request):
+        auth = request.META.get('HTTP_AUTHORIZATION', '')
+        ident = auth or request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+        if not ident:
+            return None
+        return 'db-pin:' + hashlib.blake2b(ident.encode(), digest_size=16).hexdigest()
+
+    def __call__(self, request):
+        key = self.client_key(request)
+        reset_pin(pinned=bool(key and cache.get(key)))
+
+        response = self.get_response(request)
+
+        if key and wrote_to_primary():
+            cache.set(key, 1, timeout=settings.REPLICA_STICKY_SECONDS)
+        reset_pin()
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Brotli or gzip response bodies, whichever the client accepts (brotli preferred).
+
+    Bodies under COMPRESSION_MIN_SIZE bytes, streaming responses and responses that
+    already carry a Content-Encoding are left alone. Sits below PerformanceMiddleware
+    so /metrics reports bytes on the wire and includes the compression time.
+    """
+
+    accept_br = _lazy_re_compile(r'\bbr\b')
+    accept_gzip = _lazy_re_compile(r'\bgzip\b')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def encoding(self, request):
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and self.accept_br.search(accepted):
+            return 'br'
+        if self.accept_gzip.search(accepted):
+            return 'gzip'
+        return None
+
+    def compress(self, content, encoding):
+        if encoding == 'br':
+            return brotli.compress(content, mode=brotli.MODE_TEXT, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        # Cached copies must be keyed on the encoding even when this one goes out plain
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        encoding = self.encoding(request)
+        if encoding is None:
+            return response
+
+        compressed = self.compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # Strong ETags no longer describe the bytes sent (same rule as GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
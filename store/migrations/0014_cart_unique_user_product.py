@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_lines(apps, schema_editor):
+    """Fold duplicate (user, product) cart rows into the oldest one before adding the constraint."""
+    Cart = apps.get_model('store', 'Cart')
+    duplicates = (
+        Cart.objects.filter(product__isnull=False)
+        .values('user_id', 'product_id')
+        .annotate(rows=Count('id'), quantity=Sum('quantity'), keep=Min('id'))
+        .filter(rows__gt=1)
+    )
+    for dup in duplicates.iterator():
+        Cart.objects.filter(id=dup['keep']).update(quantity=dup['quantity'])
+        Cart.objects.filter(user_id=dup['user_id'], product_id=dup['product_id']).exclude(id=dup['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_wishlist_notifications'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_unique_user_product'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_cart_unique_user_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeStamp',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='change_stamp', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('cart', models.PositiveBigIntegerField(db_default=0, default=0)),
+                ('wishlist', models.PositiveBigIntegerField(db_default=0, default=0)),
+                ('orders', models.PositiveBigIntegerField(db_default=0, default=0)),
+            ],
+        ),
+    ]
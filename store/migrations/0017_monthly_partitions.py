@@ -0,0 +1,154 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:05
+
+from datetime import datetime, timezone as dt_timezone
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_created_at(apps, schema_editor):
+    """Orders without a timestamp get the migration time; items copy their order's."""
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Order.objects.filter(created_at__isnull=True).update(created_at=django.utils.timezone.now())
+    OrderItem.objects.update(
+        created_at=Subquery(Order.objects.filter(id=OuterRef('order_id')).values('created_at')[:1])
+    )
+    if schema_editor.connection.vendor == 'postgresql':
+        # Fire the deferred FK checks now; ALTER TABLE refuses to run with them pending
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def convert_to_partitioned(cursor, table, ahead=3):
+    """
+    A frozen copy of store.partitions.convert_to_partitioned as it was when this
+    migration was written. Returns [(partition, start, end)].
+    """
+    staging = f'{table}_unpartitioned'
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+        [table, f'{table}_pkey'],
+    )
+    indexes = cursor.fetchall()
+    if any(definition.startswith('CREATE UNIQUE') for _, definition in indexes):
+        raise ValueError(f'{table} has unique indexes without created_at; they cannot be partitioned.')
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {staging}")
+    cursor.execute(
+        f"CREATE TABLE {table} (LIKE {staging} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE (created_at)"
+    )
+    cursor.execute(f"SELECT min(created_at) FROM {staging}")
+    oldest = (cursor.fetchone()[0] or django.utils.timezone.now()).astimezone(dt_timezone.utc)
+    month = datetime(oldest.year, oldest.month, 1, tzinfo=dt_timezone.utc)
+    now = django.utils.timezone.now().astimezone(dt_timezone.utc)
+    last = add_months(datetime(now.year, now.month, 1, tzinfo=dt_timezone.utc), ahead)
+    partitions = []
+    while month <= last:
+        name = f'{table}_p{month.year:04d}_{month.month:02d}'
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+        partitions.append((name, month, add_months(month, 1)))
+        month = add_months(month, 1)
+    cursor.execute(f"INSERT INTO {table} SELECT * FROM {staging}")
+
+    # Carry the id sequence on, then give the new one the old name
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id'), pg_get_serial_sequence(%s, 'id')", [staging, table])
+    old_sequence, new_sequence = cursor.fetchone()
+    cursor.execute(f"SELECT last_value, is_called FROM {old_sequence}")
+    cursor.execute("SELECT setval(%s, %s, %s)", [new_sequence, *cursor.fetchone()])
+    cursor.execute(f"DROP TABLE {staging}")
+    cursor.execute(f"ALTER SEQUENCE {new_sequence} RENAME TO {old_sequence.split('.')[-1]}")
+
+    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)")
+    for _, definition in indexes:
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    cursor.execute(f"ANALYZE {table}")
+    return partitions
+
+
+def partition_tables(apps, schema_editor):
+    # Self-contained on purpose: store.partitions follows the current models, not this migration's state
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    PartitionBounds = apps.get_model('store', 'PartitionBounds')
+    order_table = apps.get_model('store', 'Order')._meta.db_table
+    now = django.utils.timezone.now()
+    with schema_editor.connection.cursor() as cursor:
+        for model_name in ('Order', 'OrderItem', 'Payment'):
+            table = apps.get_model('store', model_name)._meta.db_table
+            partitions = convert_to_partitioned(cursor, table)
+            if table != order_table:
+                continue
+            # Id ranges of the closed months, as `manage.py partitions` keeps them
+            for name, start, end in partitions:
+                closed, min_id, max_id = end <= now, None, None
+                if closed:
+                    cursor.execute(f"SELECT min(id), max(id) FROM {name}")
+                    min_id, max_id = cursor.fetchone()
+                PartitionBounds.objects.create(
+                    table=table, partition=name, start=start, end=end, closed=closed, min_id=min_id, max_id=max_id,
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_payment_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartitionBounds',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=63)),
+                ('partition', models.CharField(max_length=63, unique=True)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('closed', models.BooleanField(default=False)),
+                ('min_id', models.BigIntegerField(blank=True, null=True)),
+                ('max_id', models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='store.order'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='store.order'),
+        ),
+        # Irreversible: going back means copying every row into plain tables again
+        migrations.RunPython(partition_tables),
+    ]
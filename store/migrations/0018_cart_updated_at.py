@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-19 21:05
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    """Existing lines were last touched when added, as far as we know."""
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(updated_at=F('added_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_monthly_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_cart_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('percent', 'Percent off'), ('buy_x_get_y', 'Buy X get Y free'), ('cart_threshold', 'Cart threshold')], max_length=20)),
+                ('percent', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('buy_quantity', models.PositiveIntegerField(blank=True, null=True)),
+                ('free_quantity', models.PositiveIntegerField(blank=True, null=True)),
+                ('min_subtotal', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('sizes', models.CharField(blank=True, default='', help_text='Comma-separated product sizes, e.g. XL,XXL', max_length=255)),
+                ('starts_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('products', models.ManyToManyField(blank=True, related_name='promotions', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated_at'], name='promotion_updated_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def variants_from_product_size(apps, schema_editor):
+    """One variant per sized product, carrying its stock (a single INSERT ... SELECT)."""
+    Product = apps.get_model('store', 'Product')
+    ProductVariant = apps.get_model('store', 'ProductVariant')
+    product, variant = Product._meta.db_table, ProductVariant._meta.db_table
+    schema_editor.execute(
+        f"INSERT INTO {variant} (product_id, size, color, stock) "
+        f"SELECT id, SUBSTR(UPPER(TRIM(product_size)), 1, 20), '', stock FROM {product} "
+        f"WHERE product_size IS NOT NULL AND TRIM(product_size) <> ''"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_promotions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(blank=True, default='', max_length=20)),
+                ('color', models.CharField(blank=True, default='', max_length=30)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['size', 'product'], name='variant_size_product_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'size', 'color'), name='variant_unique_attributes')],
+            },
+        ),
+        migrations.RunPython(variants_from_product_size, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.6 on 2026-10-19 18:16
+
+from django.db import migrations, models
+
+
+def status_from_payments(apps, schema_editor):
+    """Existing orders with a completed payment are paid; refunded-only ones are cancelled."""
+    Order = apps.get_model('store', 'Order')
+    Payment = apps.get_model('store', 'Payment')
+    order, payment = Order._meta.db_table, Payment._meta.db_table
+    for status, payment_status in (('paid', 'completed'), ('cancelled', 'refunded')):
+        schema_editor.execute(
+            f"UPDATE {order} SET status = %s WHERE status = 'pending' AND EXISTS "
+            f"(SELECT 1 FROM {payment} p WHERE p.order_id = {order}.id AND p.status = %s)",
+            [status, payment_status],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='status_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='event',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.RunPython(status_from_payments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# The user directory's case-insensitive searches (views.directory_search) compare
+# UPPER(column::text), so these indexes are on the same expressions: btree
+# text_pattern_ops for prefixes (istartswith) and GIN trigrams for substrings (icontains).
+#
+# The trigram indexes need the pg_trgm extension. When it isn't installed and this role
+# can't install it (not offered by the server, or not trusted and the role isn't a
+# superuser, or no CREATE on the database), they are skipped without a word and contains
+# searches scan the table. To add them later, have a superuser run CREATE EXTENSION
+# pg_trgm, then `migrate store 0023` and `migrate store 0024`.
+FIELDS = {'email': 'email', 'name': 'full_name', 'phone': 'cellphone_number'}
+
+
+def can_use_trigrams(cursor):
+    """pg_trgm is installed, or this role may install it."""
+    cursor.execute(
+        """
+        SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+            OR EXISTS (
+                SELECT 1 FROM pg_available_extension_versions v, pg_roles r
+                WHERE v.name = 'pg_trgm' AND r.rolname = current_user
+                AND (r.rolsuper OR (v.trusted AND has_database_privilege(current_database(), 'CREATE')))
+            )
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('store', 'User')._meta.db_table
+    # Decided (and the extension created) first, so a failure here leaves nothing half built
+    with schema_editor.connection.cursor() as cursor:
+        trigrams = can_use_trigrams(cursor)
+    if trigrams:
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # CONCURRENTLY: building these on a large user table must not block logins and sign-ups
+    for name, column in FIELDS.items():
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS user_{name}_prefix_idx ON {table} (UPPER({column}::text) text_pattern_ops)'
+        )
+        if trigrams:
+            schema_editor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS user_{name}_trgm_idx ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in FIELDS:
+        for kind in ('prefix', 'trgm'):
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS user_{name}_{kind}_idx')
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run in a transaction
+
+    dependencies = [
+        ('store', '0023_order_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-19 19:11
+
+from django.db import migrations, models
+
+
+def deactivate_incomplete_promotions(apps, schema_editor):
+    """Active promotions the new constraints would reject were never applied at checkout; park them as drafts."""
+    Promotion = apps.get_model('store', 'Promotion')
+    usable_rate = models.Q(percent__isnull=False, percent__gt=0, percent__lte=100)
+    Promotion.objects.filter(is_active=True).filter(
+        models.Q(kind='percent') & ~usable_rate
+        | models.Q(kind='buy_x_get_y') & ~models.Q(buy_quantity__isnull=False, buy_quantity__gt=0,
+                                                    free_quantity__isnull=False, free_quantity__gt=0)
+        | models.Q(kind='cart_threshold') & ~(models.Q(min_subtotal__isnull=False)
+                                              & (models.Q(amount__isnull=False) | usable_rate))
+    ).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_user_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_incomplete_promotions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='promotion',
+            constraint=models.CheckConstraint(condition=models.Q(('is_active', False), models.Q(('kind', 'percent'), _negated=True), models.Q(('percent__gt', 0), ('percent__isnull', False), ('percent__lte', 100)), _connector='OR'), name='promotion_percent_off_rate'),
+        ),
+        migrations.AddConstraint(
+            model_name='promotion',
+            constraint=models.CheckConstraint(condition=models.Q(('is_active', False), models.Q(('kind', 'buy_x_get_y'), _negated=True), models.Q(('buy_quantity__gt', 0), ('buy_quantity__isnull', False), ('free_quantity__gt', 0), ('free_quantity__isnull', False)), _connector='OR'), name='promotion_buy_x_get_y_quantities'),
+        ),
+        migrations.AddConstraint(
+            model_name='promotion',
+            constraint=models.CheckConstraint(condition=models.Q(('is_active', False), models.Q(('kind', 'cart_threshold'), _negated=True), models.Q(('min_subtotal__isnull', False), models.Q(('amount__isnull', False), models.Q(('percent__gt', 0), ('percent__isnull', False), ('percent__lte', 100)), _connector='OR')), _connector='OR'), name='promotion_threshold_deal'),
+        ),
+    ]
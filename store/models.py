@@ -1,9 +1,13 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.db.models.functions import Now
 from django.utils.timezone import now
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
+from decimal import Decimal
 
 # User Manager
 class UserManager(BaseUserManager):
@@ -74,8 +78,39 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         instance.profile.save()
 
 
+# Transactional outbox (see store/outbox.py)
+class OutboxModel(models.Model):
+    """
+    Every save() also writes an OutboxEvent, in the same transaction; deletes are
+    recorded by the post_delete receiver below, so cascades and queryset.delete()
+    (e.g. the admin's delete action) are covered too. Bulk writes (bulk_create,
+    queryset.update) bypass this and call OutboxEvent.record().
+    """
+    outbox_topic = None
+    outbox_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def outbox_payload(self):
+        return {name: getattr(self, name) for name in ('id', *self.outbox_fields)}
+
+    def save(self, *args, outbox_event=None, **kwargs):
+        """`outbox_event`: 'created'/'updated' by default, False for none."""
+        if outbox_event is None:
+            outbox_event = OutboxEvent.CREATED if self._state.adding else OutboxEvent.UPDATED
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if outbox_event:
+                OutboxEvent.record([self], outbox_event)
+
+
 # Product Model [GOODS]
-class Product(models.Model):
+class Product(OutboxModel):
+    outbox_topic = 'product'
+    outbox_fields = ('name', 'price', 'stock', 'product_size', 'image_url')
+
+
     name = models.CharField(max_length=255)
     description = models.TextField(default="No description available")
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -84,16 +119,61 @@ class Product(models.Model):
     product_size = models.CharField(max_length=50, blank=True, null=True)
     created_at = models.DateTimeField(default=now)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so saves can detect restocks and price drops
+        instance._loaded_stock = getattr(instance, 'stock', None) if 'stock' in field_names else None
+        instance._loaded_price = getattr(instance, 'price', None) if 'price' in field_names else None
+        instance._loaded_listing = instance.listing() if {'name', 'price', 'image_url'} <= set(field_names) else None
+        return instance
+
+    def listing(self):
+        """The fields cart and wishlist responses show; a change invalidates their ETags."""
+        return (self.name, Decimal(str(self.price)), self.image_url)
+
     def __str__(self):
         return self.name
 
 
+# Product Variants (size/colour with their own stock; product_size is kept for old clients)
+class ProductVariant(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="variants")
+    size = models.CharField(max_length=20, blank=True, default="")  # Normalised: stripped, upper case
+    color = models.CharField(max_length=30, blank=True, default="")
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "size", "color"], name="variant_unique_attributes"),
+        ]
+        indexes = [
+            # Size filters and facets; lookups by product use the unique constraint's index
+            models.Index(fields=["size", "product"], name="variant_size_product_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.size = self.size.strip().upper()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.product.name} ({' / '.join(filter(None, [self.size, self.color])) or 'default'})"
+
+
 # Cart Model [GOODS]
 class Cart(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="cart")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="cart_items", null=True)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
+    # Last activity on the line; carts idle past CART_TTL_DAYS are reaped (store/reaper.py)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    class Meta:
+        constraints = [
+            # One line per product; lets set-based transfers upsert with ON CONFLICT
+            models.UniqueConstraint(fields=["user", "product"], name="cart_unique_user_product"),
+        ]
 
     def subtotal(self):
         return self.quantity * self.product.price
@@ -102,21 +182,116 @@ class Cart(models.Model):
         return f"{self.user.email} - {self.product.name} ({self.quantity})"
 
 
+# Monthly partitioned tables (see store/partitions.py)
+class MonthlyPartitioned(models.Model):
+    """
+    Rows live in the created_at month's partition on PostgreSQL. Updates filter on the
+    created_at the row was loaded or saved with, so they touch a single partition.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._partition_key = getattr(instance, 'created_at', None) if 'created_at' in field_names else None
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._partition_key = self.created_at
+
+    def _do_update(self, base_qs, *args, **kwargs):
+        partition_key = getattr(self, '_partition_key', None)
+        if partition_key is not None:
+            base_qs = base_qs.filter(created_at=partition_key)
+        return super()._do_update(base_qs, *args, **kwargs)
+
+
 # Order Model
-class Order(models.Model):
+class Order(MonthlyPartitioned, OutboxModel):
+    outbox_topic = 'order'
+    outbox_fields = ('user_id', 'total_price', 'status', 'created_at')
+
+    STATUS_PENDING = 'pending'
+    STATUS_PAID = 'paid'
+    STATUS_SHIPPED = 'shipped'
+    STATUS_DELIVERED = 'delivered'
+    STATUS_CANCELLED = 'cancelled'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PAID, 'Paid'),
+        (STATUS_SHIPPED, 'Shipped'),
+        (STATUS_DELIVERED, 'Delivered'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+    # Allowed moves; delivered and cancelled are final
+    TRANSITIONS = {
+        STATUS_PENDING: {STATUS_PAID, STATUS_CANCELLED},
+        STATUS_PAID: {STATUS_SHIPPED, STATUS_CANCELLED},
+        STATUS_SHIPPED: {STATUS_DELIVERED},
+        STATUS_DELIVERED: set(),
+        STATUS_CANCELLED: set(),
+    }
+    # Payment status -> the order status it moves the order to (when that move is allowed)
+    PAYMENT_TRANSITIONS = {
+        'completed': STATUS_PAID,
+        'refunded': STATUS_CANCELLED,
+    }
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="orders")
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  
-    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    status_changed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Work queues (paid orders to ship, oldest first) and status filters
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+        ]
+
+    def can_transition(self, status):
+        return status in self.TRANSITIONS[self.status]
+
+    def transition(self, status):
+        """
+        Move to `status`, publishing a status_changed outbox event. Raises ValidationError
+        if the move isn't allowed, or if another request changed the status first.
+        """
+        if not self.can_transition(status):
+            raise ValidationError(f"Order {self.pk} can't go from {self.status} to {status}.")
+        previous, changed_at = self.status, now()
+        with transaction.atomic():
+            # Conditional on the status we saw, so two concurrent moves can't both win
+            updated = Order.objects.filter(pk=self.pk, created_at=self.created_at, status=previous).update(
+                status=status, status_changed_at=changed_at,
+            )
+            if not updated:
+                raise ValidationError(f"Order {self.pk} was changed meanwhile; reload it and retry.")
+            OutboxEvent.objects.create(topic=self.outbox_topic, object_id=self.pk, event=OutboxEvent.STATUS_CHANGED, payload={
+                'id': self.pk, 'user_id': self.user_id, 'status': status, 'previous': previous, 'changed_at': changed_at,
+            })
+            ChangeStamp.bump('orders', [self.user_id])  # .update() skips the signal
+        self.status, self.status_changed_at = status, changed_at
 
     def calculate_total_price(self):
-        return sum(item.total_price for item in self.order_items.all())
+        # Items share the order's created_at, so this reads a single partition
+        items = self.order_items.filter(created_at=self.created_at)
+        return sum(item.price or 0 for item in items)  # OrderItem.price is the line total
 
-    def save(self, *args, **kwargs):
-        if not self.pk:  # If order is new (no primary key)
-            super().save(*args, **kwargs)  # Save first to get an ID
-        
-        self.total_price = self.calculate_total_price()  # Now safe to calculate
-        super().save(update_fields=["total_price"])  # Save only total_price field
+    def save(self, *args, outbox_event=None, **kwargs):
+        created = not self.pk
+        if outbox_event is None:  # One event for both writes
+            outbox_event = OutboxEvent.CREATED if created else OutboxEvent.UPDATED
+        with transaction.atomic():
+            if created:  # If order is new (no primary key)
+                super().save(*args, outbox_event=False, **kwargs)  # Save first to get an ID
+
+            self.total_price = self.calculate_total_price()  # Now safe to calculate
+            super().save(update_fields=["total_price"], outbox_event=outbox_event)  # Save only total_price field
 
     def __str__(self):
         return f"Order {self.id} - {self.user.email}"
@@ -124,11 +299,18 @@ class Order(models.Model):
 
 
 # OrderItem Model
-class OrderItem(models.Model):
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="order_items")
+class OrderItem(MonthlyPartitioned, OutboxModel):
+    outbox_topic = 'order_item'
+    outbox_fields = ('order_id', 'product_id', 'quantity', 'price', 'discount')
+
+    # Not enforced by the database: Order's key is (id, created_at) once partitioned
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="order_items", db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Store price at purchase time
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Promotions taken off `price`
+    # Copy of order.created_at (set in save()), so items sit in their order's partition
+    created_at = models.DateTimeField(editable=False)
 
     def calculate_price(self):
         """Calculate total price for this item based on product price."""
@@ -140,6 +322,8 @@ class OrderItem(models.Model):
         """Ensure price is set before saving."""
         if not self.price:
             self.price = self.calculate_price()
+        if self._state.adding and self.created_at is None:
+            self.created_at = self.order.created_at
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -153,12 +337,21 @@ class Wishlist(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="wishlist_items")
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination over a product's watchers
+            models.Index(fields=["product", "id"], name="wishlist_product_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.email} - {self.product.name}"
 
 
 # Payment Model
-class Payment(models.Model):
+class Payment(MonthlyPartitioned, OutboxModel):
+    outbox_topic = 'payment'
+    outbox_fields = ('order_id', 'user_id', 'amount', 'status', 'mode_of_payment')
+
     STATUS_PENDING = 'pending'
     STATUS_COMPLETED = 'completed'
     STATUS_FAILED = 'failed'
@@ -172,11 +365,373 @@ class Payment(models.Model):
     ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="payments")
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="payments", null=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="payments", null=True, db_constraint=False)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
     mode_of_payment = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(default=now)
 
+    class Meta:
+        indexes = [
+            # Admin status filter, newest first
+            models.Index(fields=["status", "id"], name="payment_status_id_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.advance_order()
+
+    def advance_order(self):
+        """Move the order along with this payment (completed -> paid, refunded -> cancelled) where allowed."""
+        target = Order.PAYMENT_TRANSITIONS.get(self.status)
+        if target is None or self.order_id is None:
+            return
+        order = Order.objects.select_for_update().filter(pk=self.order_id).first()
+        if order is not None and order.can_transition(target):
+            order.transition(target)
+
     def __str__(self):
         return f"Payment {self.id} - {self.status} ({self.amount})"
+
+
+# Promotions (evaluated by store/promotions.py)
+class Promotion(models.Model):
+    PERCENT_OFF = 'percent'
+    BUY_X_GET_Y = 'buy_x_get_y'
+    CART_THRESHOLD = 'cart_threshold'
+    KIND_CHOICES = [
+        (PERCENT_OFF, 'Percent off'),
+        (BUY_X_GET_Y, 'Buy X get Y free'),
+        (CART_THRESHOLD, 'Cart threshold'),
+    ]
+
+    name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)  # Percent off, and threshold deals
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Fixed amount off (threshold deals)
+    buy_quantity = models.PositiveIntegerField(null=True, blank=True)
+    free_quantity = models.PositiveIntegerField(null=True, blank=True)
+    min_subtotal = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Line deals only apply to these products / sizes; empty means any
+    products = models.ManyToManyField(Product, blank=True, related_name="promotions")
+    sizes = models.CharField(max_length=255, blank=True, default="", help_text="Comma-separated product sizes, e.g. XL,XXL")
+    starts_at = models.DateTimeField(default=now)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # MAX(updated_at) tells other processes their compiled rule index is stale
+            models.Index(fields=["updated_at"], name="promotion_updated_at_idx"),
+        ]
+        # What clean() asks for, enforced for active promotions however they are written
+        # (shell, fixtures, bulk loads); inactive drafts may be incomplete
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(is_active=False) | ~models.Q(kind="percent")
+                | models.Q(percent__isnull=False, percent__gt=0, percent__lte=100),
+                name="promotion_percent_off_rate",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(is_active=False) | ~models.Q(kind="buy_x_get_y")
+                | models.Q(buy_quantity__isnull=False, buy_quantity__gt=0, free_quantity__isnull=False, free_quantity__gt=0),
+                name="promotion_buy_x_get_y_quantities",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(is_active=False) | ~models.Q(kind="cart_threshold")
+                | models.Q(min_subtotal__isnull=False) & (
+                    models.Q(amount__isnull=False) | models.Q(percent__isnull=False, percent__gt=0, percent__lte=100)),
+                name="promotion_threshold_deal",
+            ),
+        ]
+
+    def size_list(self):
+        return [size.strip() for size in self.sizes.split(",") if size.strip()]
+
+    def clean(self):
+        required = {
+            self.PERCENT_OFF: ["percent"],
+            self.BUY_X_GET_Y: ["buy_quantity", "free_quantity"],
+            self.CART_THRESHOLD: ["min_subtotal"],
+        }.get(self.kind, [])
+        errors = {name: "Required for this kind of promotion." for name in required if getattr(self, name) in (None, 0)}
+        if self.kind == self.CART_THRESHOLD and self.percent is None and self.amount is None:
+            errors["amount"] = "Set an amount or a percent."
+        if self.percent is not None and not 0 < self.percent <= 100:
+            errors["percent"] = "Must be between 0 and 100."
+        if errors:
+            raise ValidationError(errors)
+
+    def __str__(self):
+        return self.name
+
+
+# Product Recommendations ("frequently bought together")
+class ProductRecommendation(models.Model):
+    """Top-K co-purchased products, rebuilt offline by `manage.py build_recommendations`."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="recommendation")
+    neighbor_ids = models.JSONField(default=list)  # Best first
+    scores = models.JSONField(default=list)  # Co-occurrence counts, aligned with neighbor_ids
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Recommendations for product {self.product_id}"
+
+
+# Wishlist Notifications
+class WishlistNotificationJob(models.Model):
+    """A fan-out to everyone watching a product, processed by `manage.py process_wishlist_notifications`."""
+    KIND_BACK_IN_STOCK = 'back_in_stock'
+    KIND_PRICE_DROP = 'price_drop'
+    KIND_CHOICES = [
+        (KIND_BACK_IN_STOCK, 'Back in stock'),
+        (KIND_PRICE_DROP, 'Price drop'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="notification_jobs")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    old_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    cursor = models.BigIntegerField(default=0)  # Last Wishlist id fanned out, so a crashed job resumes
+    sent = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Bumped per chunk; a stale running job is re-claimed
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} for product {self.product_id} ({self.status})"
+
+
+class Notification(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notifications")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="notifications")
+    job = models.ForeignKey(WishlistNotificationJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="notifications")
+    kind = models.CharField(max_length=20, choices=WishlistNotificationJob.KIND_CHOICES)
+    message = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # One notification per user per job, even if they wishlisted the product twice
+            models.UniqueConstraint(fields=["job", "user"], name="notification_once_per_job"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="notification_user_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.message}"
+
+
+@receiver(post_save, sender=Product)
+def enqueue_wishlist_notifications(sender, instance, created, **kwargs):
+    """Queue a fan-out when a product comes back in stock or gets cheaper. Never loops over watchers here."""
+    old_stock = getattr(instance, '_loaded_stock', None)
+    old_price = getattr(instance, '_loaded_price', None)
+    stock, price = int(instance.stock), Decimal(str(instance.price))
+    instance._loaded_stock, instance._loaded_price = stock, price
+    if created:
+        return
+
+    jobs = []
+    if old_stock == 0 and stock > 0:
+        jobs.append(WishlistNotificationJob(product=instance, kind=WishlistNotificationJob.KIND_BACK_IN_STOCK))
+    if old_price is not None and price < old_price:
+        jobs.append(WishlistNotificationJob(
+            product=instance, kind=WishlistNotificationJob.KIND_PRICE_DROP, old_price=old_price, new_price=price,
+        ))
+    if jobs and instance.wishlist_items.exists():
+        WishlistNotificationJob.objects.bulk_create(jobs)
+
+
+# Partition id ranges
+class PartitionBounds(models.Model):
+    """Id range of each Order partition, maintained by `manage.py partitions` (see store/partitions.py)."""
+    table = models.CharField(max_length=63)
+    partition = models.CharField(max_length=63, unique=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    closed = models.BooleanField(default=False)  # Month is over: min_id/max_id are final
+    min_id = models.BigIntegerField(null=True, blank=True)
+    max_id = models.BigIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return self.partition
+
+
+# Conditional GET version stamps
+class ChangeStamp(models.Model):
+    """
+    Per-user change counters behind the ETags of cart, wishlist and order responses.
+
+    Bumped in the same transaction as the write (signals below, plus explicit calls
+    for raw SQL writers), so a matching If-None-Match can be answered with one
+    primary key lookup.
+    """
+    KINDS = ('cart', 'wishlist', 'orders')
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="change_stamp")
+    # db_default so the upserts below only have to name the counter they bump
+    cart = models.PositiveBigIntegerField(default=0, db_default=0)
+    wishlist = models.PositiveBigIntegerField(default=0, db_default=0)
+    orders = models.PositiveBigIntegerField(default=0, db_default=0)
+
+    def __str__(self):
+        return f"Stamps for user {self.user_id}"
+
+    @classmethod
+    def current(cls, user_id, kind):
+        return cls.objects.filter(user_id=user_id).values_list(kind, flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, kind, user_ids):
+        user_ids = sorted(set(user_ids))  # A row can only be upserted once per statement
+        if not user_ids:
+            return
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, {kind}) VALUES {', '.join(['(%s, 1)'] * len(user_ids))} "
+                f"ON CONFLICT (user_id) DO UPDATE SET {kind} = {table}.{kind} + 1",
+                user_ids,
+            )
+
+    @classmethod
+    def bump_product_holders(cls, product_id):
+        """Invalidate the carts and wishlists that show this product, in two statements."""
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            for kind, model in (('cart', Cart), ('wishlist', Wishlist)):
+                cursor.execute(
+                    f"INSERT INTO {table} (user_id, {kind}) "
+                    f"SELECT DISTINCT user_id, 1 FROM {model._meta.db_table} WHERE product_id = %s "
+                    f"ON CONFLICT (user_id) DO UPDATE SET {kind} = {table}.{kind} + 1",
+                    [product_id],
+                )
+
+
+@receiver(post_save, sender=Product)
+def bump_listing_holders(sender, instance, created, **kwargs):
+    listing, old = instance.listing(), getattr(instance, '_loaded_listing', None)
+    instance._loaded_listing = listing
+    if not created and listing != old:
+        ChangeStamp.bump_product_holders(instance.id)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_save, sender=Wishlist)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Cart)
+@receiver(post_delete, sender=Wishlist)
+@receiver(post_delete, sender=Order)
+def bump_change_stamp(sender, instance, origin=None, **kwargs):
+    # Rows cascading from a user's own deletion: the stamp row is going away too
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User or instance.user_id is None:
+        return
+    kind = {Cart: 'cart', Wishlist: 'wishlist', Order: 'orders'}[sender]
+    ChangeStamp.bump(kind, [instance.user_id])
+
+
+# Signed access tokens (see store/tokens.py)
+class RefreshToken(models.Model):
+    """A long-lived refresh token, stored as its SHA-256. Each use rotates it within its family."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="refresh_tokens")
+    token_hash = models.CharField(max_length=64, unique=True)
+    family = models.CharField(max_length=32, db_index=True)  # Shared by a login's chain of rotated tokens
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    used_at = models.DateTimeField(null=True, blank=True)  # Rotated; presenting it again means it leaked
+
+    def __str__(self):
+        return f"Refresh token {self.family} for user {self.user_id}"
+
+
+class TokenRevocation(models.Model):
+    """
+    Denylist entry for access tokens: one token (jti) or, with a blank jti, every token
+    the user was issued before `revoked_at`. Rows are only needed until the tokens they
+    cover have expired anyway (`expires_at`).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="token_revocations")
+    jti = models.CharField(max_length=32, blank=True)
+    revoked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Revoked {self.jti or 'all tokens'} of user {self.user_id}"
+
+
+class OutboxEvent(models.Model):
+    """
+    A change to an Order, OrderItem, Payment or Product, written in the writer's
+    transaction. The relay gives committed events a gap-free `position` (their order in
+    the stream) and delivers them to sinks; consumers read the stream by position.
+    """
+    CREATED, UPDATED, DELETED = 'created', 'updated', 'deleted'
+    STATUS_CHANGED = 'status_changed'  # Order lifecycle moves (Order.transition)
+
+    topic = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    event = models.CharField(max_length=20)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=now)
+    position = models.BigIntegerField(null=True, blank=True, unique=True)  # Set by the relay's sequencer
+
+    class Meta:
+        indexes = [
+            # What the sequencer scans: committed events that have no position yet
+            models.Index(fields=["id"], condition=models.Q(position__isnull=True), name="outbox_unsequenced_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} {self.object_id} {self.event}"
+
+    @classmethod
+    def record(cls, instances, event):
+        """Outbox rows for OutboxModel instances; call inside the transaction that wrote them."""
+        return cls.objects.bulk_create([
+            cls(topic=instance.outbox_topic, object_id=instance.pk, event=event, payload=instance.outbox_payload())
+            for instance in instances
+        ])
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_delete, sender=Payment)
+def record_outbox_delete(sender, instance, **kwargs):
+    # Sent for every row Django deletes, cascaded ones included, inside the delete's transaction
+    OutboxEvent.objects.create(topic=sender.outbox_topic, object_id=instance.pk, event=OutboxEvent.DELETED, payload={'id': instance.pk})
+
+
+@receiver(pre_delete, sender=Product)
+def record_order_items_losing_product(sender, instance, **kwargs):
+    # OrderItem.product is SET_NULL: the collector clears it with one UPDATE and no save(),
+    # so the items' 'updated' events are recorded here, as the items will read once it has run
+    items = list(OrderItem.objects.filter(product_id=instance.pk))
+    for item in items:
+        item.product_id = None
+    OutboxEvent.record(items, OutboxEvent.UPDATED)
+
+
+class OutboxCursor(models.Model):
+    """Last stream position handed to a sink (or, for the sequencer, assigned)."""
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
@@ -0,0 +1,90 @@
+"""
+Wishlist fan-out for back-in-stock and price-drop jobs.
+
+A job walks the product's Wishlist rows in keyset order (product_id, id > cursor),
+so every chunk is an index range scan no matter how many watchers there are. Each
+chunk becomes one bulk insert of Notification rows; the (job, user) unique
+constraint drops duplicate users and makes a resumed chunk harmless.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification, Wishlist, WishlistNotificationJob
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker hasn't finished a chunk for this long is assumed dead
+STALE_AFTER = timedelta(minutes=10)
+
+
+def message_for(job, product_name):
+    if job.kind == WishlistNotificationJob.KIND_BACK_IN_STOCK:
+        return f"{product_name} is back in stock!"[:255]
+    return f"{product_name} dropped from {job.old_price} to {job.new_price}"[:255]
+
+
+def run_chunk(job, product_name, chunk_size):
+    """Fan out one chunk and advance the cursor. Returns False when the job is finished."""
+    rows = list(
+        Wishlist.objects.filter(product_id=job.product_id, id__gt=job.cursor)
+        .order_by("id").values_list("id", "user_id")[:chunk_size]
+    )
+    if not rows:
+        job.status = WishlistNotificationJob.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.sent = job.notifications.count()  # Exact, after cross-chunk duplicates were dropped
+        job.save(update_fields=["status", "finished_at", "sent"])
+        return False
+
+    message = message_for(job, product_name)
+    users = dict.fromkeys(user_id for _, user_id in rows)  # Dedupe, keep order
+    with transaction.atomic():
+        Notification.objects.bulk_create(
+            [Notification(user_id=user_id, product_id=job.product_id, job=job, kind=job.kind, message=message) for user_id in users],
+            ignore_conflicts=True,
+        )
+        job.cursor = rows[-1][0]
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=["cursor", "heartbeat_at"])
+    return True
+
+
+def claim_job():
+    """Mark the oldest pending (or abandoned) job as running and return it, or None."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            WishlistNotificationJob.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(
+                Q(status=WishlistNotificationJob.STATUS_PENDING)
+                | Q(status=WishlistNotificationJob.STATUS_RUNNING, heartbeat_at__lt=now - STALE_AFTER)
+            )
+            .select_related("product").order_by("id").first()
+        )
+        if job is not None:
+            job.status = WishlistNotificationJob.STATUS_RUNNING
+            job.heartbeat_at = now
+            job.save(update_fields=["status", "heartbeat_at"])
+        return job
+
+
+def process_job(job, chunk_size=5000):
+    product_name = job.product.name
+    while run_chunk(job, product_name, chunk_size):
+        pass
+    logger.info("Wishlist fan-out finished", extra={"job_id": job.id, "product_id": job.product_id, "sent": job.sent})
+
+
+def process_pending(chunk_size=5000, limit=None):
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job()
+        if job is None:
+            break
+        process_job(job, chunk_size)
+        processed += 1
+    return processed
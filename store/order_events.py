@@ -0,0 +1,143 @@
+"""
+Order status changes pushed to their owners as server-sent events.
+
+GET /api/order-events/ (ASGI only) keeps a text/event-stream open per client.
+Each connection is a coroutine waiting on a small asyncio.Queue; there is no thread
+and no database connection per client, so a node holds thousands of idle ones.
+
+One feeder task per process reads status_changed events from the outbox
+(store/outbox.py) every ORDER_EVENTS_POLL_SECONDS. That is one query per process,
+however many clients are connected. The broker fans each event out to the owner's
+connections. Event ids are outbox positions: a client that reconnects with
+Last-Event-ID gets what it missed, read back from the outbox. A client too slow to
+keep up with its queue loses the oldest events; its next reconnect replays them.
+"""
+import asyncio
+from collections import defaultdict
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import outbox
+from .models import Order, OutboxEvent
+from .tokens import SignedTokenAuthentication
+
+
+def status_events(after, limit=1000):
+    """(status_changed order events after position `after`, position read up to, more to read)."""
+    outbox.sequence()  # Cheap when the relay already did it; saves waiting for its next pass
+    events = outbox.read(after, limit, [Order.outbox_topic])
+    changes = [event for event in events if event['event'] == OutboxEvent.STATUS_CHANGED]
+    return changes, (events[-1]['position'] if events else after), len(events) == limit
+
+
+def missed_events(user_id, after):
+    """The user's status changes after position `after` (Last-Event-ID replay)."""
+    return list(
+        OutboxEvent.objects.filter(position__gt=after, topic=Order.outbox_topic, event=OutboxEvent.STATUS_CHANGED,
+                                   payload__user_id=user_id)
+        .order_by('position').values(*outbox.FIELDS)
+    )
+
+
+class Broker:
+    """In-process fan-out from the feeder to subscribers' queues, keyed by user id."""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.cursor = None
+        self.feeder = None
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(settings.ORDER_EVENTS_QUEUE_SIZE)
+        self.subscribers[user_id].add(queue)
+        loop = asyncio.get_running_loop()
+        if self.feeder is None or self.feeder.done() or self.feeder.get_loop() is not loop:
+            self.cursor = None
+            self.feeder = loop.create_task(self.feed())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def publish(self, event):
+        for queue in self.subscribers.get(event['payload']['user_id'], ()):
+            if queue.full():
+                queue.get_nowait()  # Slow client: drop its oldest event
+            queue.put_nowait(event)
+
+    async def feed(self):
+        """Poll the outbox while anyone is subscribed; ends when the last client leaves."""
+        if self.cursor is None:
+            self.cursor = await sync_to_async(lambda: OutboxEvent.objects.aggregate(last=Max('position'))['last'] or 0)()
+        while self.subscribers:
+            events, self.cursor, more = await sync_to_async(status_events)(self.cursor)
+            for event in events:
+                self.publish(event)
+            if not more:
+                await asyncio.sleep(settings.ORDER_EVENTS_POLL_SECONDS)
+        self.cursor = None  # Nobody missed anything; reconnects replay from Last-Event-ID
+
+
+broker = Broker()
+
+
+def authenticate(request):
+    """User id from a bearer/DRF token header, or ?access_token= (EventSource can't set headers)."""
+    if 'HTTP_AUTHORIZATION' not in request.META and request.GET.get('access_token'):
+        request.META['HTTP_AUTHORIZATION'] = f"Bearer {request.GET['access_token']}"
+    for authentication in (SignedTokenAuthentication(), TokenAuthentication()):
+        try:
+            result = authentication.authenticate(request)
+        except AuthenticationFailed:
+            return None
+        if result is not None:
+            return result[0].pk
+    return None
+
+
+def sse(event):
+    data = {key: event['payload'][key] for key in ('id', 'status', 'previous', 'changed_at')}
+    return f"id: {event['position']}\nevent: order_status\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def order_events(request):
+    user_id = await sync_to_async(authenticate)(request)
+    if user_id is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+    last_seen = request.headers.get('Last-Event-ID', '')
+
+    async def stream():
+        sent = 0
+        queue = broker.subscribe(user_id)  # Before the replay, so nothing falls in between
+        try:
+            yield f"retry: {settings.ORDER_EVENTS_RETRY_MS}\n\n"
+            if last_seen.isdigit():
+                for event in await sync_to_async(missed_events)(user_id, int(last_seen)):
+                    sent = event['position']
+                    yield sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.ORDER_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"  # Keeps proxies from closing an idle stream
+                    continue
+                if event['position'] > sent:  # Already replayed otherwise
+                    sent = event['position']
+                    yield sse(event)
+        finally:
+            broker.unsubscribe(user_id, queue)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: don't buffer the stream
+    return response
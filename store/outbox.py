@@ -0,0 +1,160 @@
+"""
+Change-event stream for Orders, OrderItems, Payments and Products (transactional outbox).
+
+Writers add OutboxEvent rows in their own transaction (OutboxModel), so an event
+exists exactly when its change committed. The relay (`manage.py relay_outbox`) then:
+
+1. sequences: gives committed, unsequenced events the next stream positions in id
+   order, under a lock so positions are gap-free and never reused. An event whose
+   transaction commits late simply gets a later position; nothing is skipped.
+2. delivers: hands each sink its events after its cursor, in position order, in
+   batches. The cursor only moves after the sink accepted the batch (in the same
+   transaction that locks it), so delivery is at least once: after a crash or a
+   failed send the batch is sent again. Sinks and consumers dedupe on `position`.
+
+Consumers without a sink read the stream by cursor (`read()`, GET /api/events/).
+Events every sink has passed are purged after OUTBOX_RETENTION_DAYS.
+"""
+import os
+import queue
+import urllib.request
+from datetime import timedelta
+
+import orjson
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import OutboxCursor, OutboxEvent
+
+SEQUENCER = 'sequencer'
+FIELDS = ('position', 'id', 'topic', 'object_id', 'event', 'payload', 'created_at')
+
+
+# Sinks: send(events) gets a list of event dicts and raises if they weren't accepted
+class FileSink:
+    """Appends JSON lines to a file, synced to disk before the cursor moves."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, 'ab') as stream:
+            stream.write(b''.join(orjson.dumps(event) + b'\n' for event in events))
+            stream.flush()
+            os.fsync(stream.fileno())
+
+
+class HttpSink:
+    """POSTs {"events": [...]} to a URL; any non-2xx response fails the batch."""
+
+    def __init__(self, url, timeout=10, headers=None):
+        self.url, self.timeout, self.headers = url, timeout, headers or {}
+
+    def send(self, events):
+        request = urllib.request.Request(
+            self.url, data=orjson.dumps({'events': events}), method='POST',
+            headers={'Content-Type': 'application/json', **self.headers},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):  # Raises HTTPError on 4xx/5xx
+            pass
+
+
+queues = {}
+
+
+class QueueSink:
+    """Puts events on a named in-process queue.Queue (`queues[name]`) for consumers in the relay's process."""
+
+    def __init__(self, name='default', maxsize=0):
+        self.queue = queues.setdefault(name, queue.Queue(maxsize))
+
+    def send(self, events):
+        for event in events:
+            self.queue.put(event)
+
+
+def get_sinks(names=None):
+    """{name: sink} from settings.OUTBOX_SINKS, optionally only `names`."""
+    sinks = {}
+    for name, config in settings.OUTBOX_SINKS.items():
+        if names is None or name in names:
+            sinks[name] = import_string(config['class'])(**config.get('options', {}))
+    return sinks
+
+
+def sequence(batch_size=5000):
+    """Give up to `batch_size` committed events the next positions; returns how many."""
+    OutboxCursor.objects.get_or_create(name=SEQUENCER)
+    table = OutboxEvent._meta.db_table
+    with transaction.atomic():
+        sequencer = OutboxCursor.objects.select_for_update().get(name=SEQUENCER)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} SET position = %s + n.rn
+                FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS rn FROM {table}
+                      WHERE position IS NULL ORDER BY id LIMIT %s) n
+                WHERE {table}.id = n.id
+                """,
+                [sequencer.position, batch_size],
+            )
+            sequenced = cursor.rowcount
+        if sequenced:
+            sequencer.position += sequenced
+            sequencer.save(update_fields=['position', 'updated_at'])
+    return sequenced
+
+
+def read(after=0, limit=1000, topics=None):
+    """Sequenced events after position `after`, in stream order."""
+    events = OutboxEvent.objects.filter(position__gt=after).order_by('position')
+    if topics:
+        events = events.filter(topic__in=topics)
+    return list(events.values(*FIELDS)[:limit])
+
+
+def deliver(name, sink, batch_size=1000):
+    """Send the sink everything after its cursor; returns how many events went out."""
+    OutboxCursor.objects.get_or_create(name=f'sink:{name}')
+    delivered = 0
+    while True:
+        with transaction.atomic():
+            # The row lock keeps a second relay from sending the same batch concurrently
+            cursor = OutboxCursor.objects.select_for_update().get(name=f'sink:{name}')
+            events = read(cursor.position, batch_size)
+            if not events:
+                break
+            sink.send(events)
+            cursor.position = events[-1]['position']
+            cursor.save(update_fields=['position', 'updated_at'])
+        delivered += len(events)
+        if len(events) < batch_size:
+            break
+    if delivered:
+        metrics.increment(f'outbox_{name}_delivered_total', delivered, f'Outbox events delivered to the {name} sink.')
+    return delivered
+
+
+def purge(sink_names, retention_days=None):
+    """Delete events older than the retention that every named sink has received."""
+    retention_days = settings.OUTBOX_RETENTION_DAYS if retention_days is None else retention_days
+    cursors = OutboxCursor.objects.filter(name__in=[f'sink:{name}' for name in sink_names] or [SEQUENCER])
+    if cursors.count() < max(1, len(sink_names)):
+        return 0  # A sink that never ran still needs everything
+    upto = cursors.aggregate(upto=Min('position'))['upto']
+    deleted, _ = OutboxEvent.objects.filter(
+        position__lte=upto, created_at__lt=timezone.now() - timedelta(days=retention_days),
+    ).delete()
+    return deleted
+
+
+def relay(sinks, batch_size=1000):
+    """One pass: sequence everything committed, then bring every sink up to date."""
+    sequenced = 0
+    while (count := sequence(max(batch_size, 5000))):
+        sequenced += count
+    return sequenced, {name: deliver(name, sink, batch_size) for name, sink in sinks.items()}
@@ -0,0 +1,243 @@
+"""
+Monthly range partitioning of Order, OrderItem and Payment on created_at (PostgreSQL).
+
+Each table is split into `<table>_pYYYY_MM` partitions. PostgreSQL requires the
+partition key in every unique constraint, so the database primary key becomes
+(id, created_at), ids stay unique through the identity sequence, and foreign keys
+pointing at these tables (OrderItem.order, Payment.order) are not enforced by the
+database. Unique constraints added to these tables later must include created_at.
+
+Order ids only say which partition an order is in through PartitionBounds, the id
+range of every closed month, refreshed by `manage.py partitions`. `prune()` turns an
+order id into created_at ranges so lookups by id touch one or two partitions instead
+of all of them; lookups fall back to an unpruned query when the bounds are stale.
+
+On other databases all of this is a no-op.
+"""
+import gzip
+import os
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Order, OrderItem, PartitionBounds, Payment
+
+PARTITIONED_MODELS = [Order, OrderItem, Payment]
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month.year:04d}_{month.month:02d}'
+
+
+def is_partitioned(table):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+    return bool(row and row[0] == 'p')
+
+
+def attached_partitions(table):
+    """[(partition, start, end)] for the table, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            [table],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        if bound == 'DEFAULT':
+            continue
+        # FOR VALUES FROM ('2025-01-01 00:00:00+00') TO ('2025-02-01 00:00:00+00')
+        start, end = (datetime.fromisoformat(part.split("'")[1]) for part in bound.split(' TO '))
+        partitions.append((name, start, end))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(cursor, table, month):
+    name = partition_name(table, month)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+    if table == Order._meta.db_table:
+        PartitionBounds.objects.get_or_create(partition=name, defaults={
+            'table': table, 'start': month, 'end': add_months(month, 1),
+        })
+    return name
+
+
+def ensure_partitions(since=None, ahead=3):
+    """Create missing monthly partitions from `since` (default: now) to `ahead` months out."""
+    created = []
+    now = month_start(timezone.now())
+    first = month_start(since) if since else now
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            continue
+        existing = {name for name, _, _ in attached_partitions(table)}
+        with transaction.atomic(), connection.cursor() as cursor:
+            month = first
+            while month <= add_months(now, ahead):
+                if partition_name(table, month) not in existing:
+                    created.append(create_partition(cursor, table, month))
+                month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(model, ahead=3):
+    """
+    Rebuild a table as a partitioned one, keeping its indexes, foreign keys, check
+    constraints and id sequence. Rows are copied, so run this in a maintenance window.
+    """
+    table = model._meta.db_table
+    staging = f'{table}_unpartitioned'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [table, f'{table}_pkey'],
+        )
+        indexes = cursor.fetchall()
+        if any(definition.startswith('CREATE UNIQUE') for _, definition in indexes):
+            raise ValueError(f'{table} has unique indexes without created_at; they cannot be partitioned.')
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {staging}")
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {staging} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"SELECT min(created_at) FROM {staging}")
+        oldest = cursor.fetchone()[0] or timezone.now()
+        month = month_start(oldest)
+        while month <= add_months(month_start(timezone.now()), ahead):
+            create_partition(cursor, table, month)
+            month = add_months(month, 1)
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {staging}")
+
+        # Carry the id sequence on, then give the new one the old name
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id'), pg_get_serial_sequence(%s, 'id')", [staging, table])
+        old_sequence, new_sequence = cursor.fetchone()
+        cursor.execute(f"SELECT last_value, is_called FROM {old_sequence}")
+        cursor.execute("SELECT setval(%s, %s, %s)", [new_sequence, *cursor.fetchone()])
+        cursor.execute(f"DROP TABLE {staging}")
+        cursor.execute(f"ALTER SEQUENCE {new_sequence} RENAME TO {old_sequence.split('.')[-1]}")
+
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)")
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        cursor.execute(f"ANALYZE {table}")
+    refresh_bounds()
+
+
+def refresh_bounds():
+    """Record the id range of every closed Order partition (open months stay unbounded)."""
+    table = Order._meta.db_table
+    if not is_partitioned(table):
+        return 0
+    now = timezone.now()
+    partitions = attached_partitions(table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        PartitionBounds.objects.filter(table=table).exclude(partition__in=[p[0] for p in partitions]).delete()
+        for name, start, end in partitions:
+            closed = end <= now
+            min_id = max_id = None
+            if closed:
+                cursor.execute(f"SELECT min(id), max(id) FROM {name}")
+                min_id, max_id = cursor.fetchone()
+            PartitionBounds.objects.update_or_create(partition=name, defaults={
+                'table': table, 'start': start, 'end': end, 'closed': closed, 'min_id': min_id, 'max_id': max_id,
+            })
+    return len(partitions)
+
+
+def order_ranges(order_id):
+    """Merged created_at ranges of the partitions that can hold this order, or None to not prune."""
+    bounds = PartitionBounds.objects.filter(table=Order._meta.db_table)
+    # Future months are open but empty: created_at is always "now" on insert
+    candidates = bounds.filter(Q(closed=False, start__lte=timezone.now()) | Q(min_id__lte=order_id, max_id__gte=order_id))
+    ranges = []
+    for start, end in candidates.order_by('start').values_list('start', 'end'):
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges or None
+
+
+def prune(queryset, order_id):
+    """Restrict an Order or OrderItem queryset to the partitions order `order_id` can be in."""
+    ranges = order_ranges(order_id) if connection.vendor == 'postgresql' else None
+    if not ranges:
+        return queryset
+    condition = Q()
+    for start, end in ranges:
+        condition |= Q(created_at__gte=start, created_at__lt=end)
+    return queryset.filter(condition)
+
+
+def get_pruned(queryset, order_id):
+    """queryset.get(id=order_id) through pruning, retried unpruned if the bounds are stale."""
+    try:
+        return prune(queryset, order_id).get(id=order_id)
+    except queryset.model.DoesNotExist:
+        return queryset.get(id=order_id)
+
+
+def archive_partition(table, name, directory):
+    """Detach a partition, write it to <directory>/<table>/<partition>.csv.gz and drop it."""
+    path = os.path.join(directory, table, f'{name}.csv.gz')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        with gzip.open(tmp, 'wb') as out:
+            # psycopg 3 cursor underneath Django's wrapper
+            with cursor.cursor.copy(f"COPY {name} TO STDOUT (FORMAT csv, HEADER)") as copy:
+                for block in copy:
+                    out.write(block)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+        # Dropped in the same transaction, so a failure leaves the partition attached
+        cursor.execute(f"DROP TABLE {name}")
+        PartitionBounds.objects.filter(partition=name).delete()
+    return path
+
+
+def archive_before(cutoff, directory, dry_run=False):
+    """Archive every partition (of all three tables) that ends on or before `cutoff`."""
+    archived = []
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        if not is_partitioned(table):
+            continue
+        for name, _, end in attached_partitions(table):
+            if end <= cutoff:
+                archived.append(name if dry_run else archive_partition(table, name, directory))
+    return archived
@@ -0,0 +1,203 @@
+"""
+Promotion engine: percent off, buy X get Y free and cart-threshold deals.
+
+Line deals can be limited to products and/or sizes. Active rules are compiled into a
+PromotionIndex: product-scoped rules keyed by product id, size-only rules by size,
+unscoped rules in one (short) list, thresholds sorted by minimum subtotal. Pricing a
+cart looks up each line's candidates in O(1) and takes the best line deal, then the
+best cart-threshold deal on what is left (one bisect), spread back over the lines so
+OrderItem.price still sums to Order.total_price. Deals do not stack: each line gets
+at most one line deal.
+
+The index is rebuilt when this process changes a Promotion, when another process did
+(noticed within PROMOTION_INDEX_CHECK_SECONDS through one aggregate query), and when
+a rule starts or ends.
+"""
+import threading
+from bisect import bisect_right
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Promotion
+
+CENT = Decimal('0.01')
+FAR_FUTURE = datetime.max.replace(tzinfo=dt_timezone.utc)
+
+Rule = namedtuple('Rule', 'id kind rate buy free min_subtotal amount sizes')
+QuotedLine = namedtuple('QuotedLine', 'product quantity unit_price subtotal discount total promotion_id')
+Quote = namedtuple('Quote', 'lines subtotal discount total cart_promotion_id')
+
+
+def money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class PromotionIndex:
+    def __init__(self, rules, product_ids, fingerprint=None, valid_until=FAR_FUTURE):
+        """`rules`: Rule list; `product_ids`: {rule id: [product ids]} for product-scoped rules."""
+        self.by_product = defaultdict(list)
+        self.by_size = defaultdict(list)
+        self.everywhere = []
+        self.thresholds = []
+        for rule in rules:
+            if rule.kind == Promotion.CART_THRESHOLD:
+                self.thresholds.append(rule)
+            elif rule.id in product_ids:
+                for product_id in product_ids[rule.id]:
+                    self.by_product[product_id].append(rule)
+            elif rule.sizes:
+                for size in rule.sizes:
+                    self.by_size[size].append(rule)
+            else:
+                self.everywhere.append(rule)
+        # Thresholds sorted by minimum subtotal, each position holding the best fixed-amount and
+        # best percent rule reachable so far: a cart's best threshold deal is one bisect away
+        self.thresholds.sort(key=lambda rule: rule.min_subtotal)
+        self.threshold_mins = [rule.min_subtotal for rule in self.thresholds]
+        self.threshold_best = []
+        best_amount = best_rate = None
+        for rule in self.thresholds:
+            if rule.amount is not None:
+                if best_amount is None or rule.amount > best_amount.amount:
+                    best_amount = rule
+            elif rule.rate and (best_rate is None or rule.rate > best_rate.rate):
+                best_rate = rule
+            self.threshold_best.append((best_amount, best_rate))
+        self.fingerprint = fingerprint
+        self.valid_until = valid_until
+        self.size = len(rules)
+
+    def candidates(self, product):
+        size = product.product_size
+        for rule in self.by_product.get(product.id, ()):
+            if not rule.sizes or size in rule.sizes:
+                yield rule
+        yield from self.by_size.get(size, ())
+        yield from self.everywhere
+
+    def best_line_deal(self, product, quantity, unit_price):
+        best, best_rule = Decimal(0), None
+        for rule in self.candidates(product):
+            if rule.kind == Promotion.PERCENT_OFF:
+                discount = unit_price * quantity * rule.rate
+            else:
+                discount = unit_price * (quantity // (rule.buy + rule.free) * rule.free)
+            if discount > best:
+                best, best_rule = discount, rule
+        return money(best), best_rule  # Rounded once, for the winner only
+
+    def best_cart_deal(self, subtotal):
+        reachable = bisect_right(self.threshold_mins, subtotal)
+        best, best_rule = Decimal(0), None
+        if not reachable:
+            return best, best_rule
+        for rule in self.threshold_best[reachable - 1]:
+            if rule is None:
+                continue
+            discount = min(subtotal, rule.amount if rule.amount is not None else money(subtotal * rule.rate))
+            if discount > best:
+                best, best_rule = discount, rule
+        return best, best_rule
+
+    def price(self, lines):
+        """Quote for [(product, quantity)]; products need id, price and product_size."""
+        quoted = []
+        for product, quantity in lines:
+            unit_price = Decimal(product.price)
+            subtotal = unit_price * quantity
+            discount, rule = self.best_line_deal(product, quantity, unit_price)
+            quoted.append(QuotedLine(product, quantity, unit_price, subtotal, discount, subtotal - discount,
+                                     rule.id if rule else None))
+
+        subtotal = sum((line.subtotal for line in quoted), Decimal(0))
+        after_lines = sum((line.total for line in quoted), Decimal(0))
+        cart_discount, cart_rule = self.best_cart_deal(after_lines)
+        if cart_discount:
+            quoted = self.spread(quoted, cart_discount, after_lines)
+        total = after_lines - cart_discount
+        return Quote(quoted, subtotal, subtotal - total, total, cart_rule.id if cart_rule else None)
+
+    @staticmethod
+    def spread(lines, discount, base):
+        """Share a cart discount over the lines by their totals; the largest line takes the rounding."""
+        largest = max(range(len(lines)), key=lambda i: lines[i].total)
+        shares = [money(discount * line.total / base) if i != largest else None for i, line in enumerate(lines)]
+        shares[largest] = discount - sum(share for share in shares if share is not None)
+        return [line._replace(discount=line.discount + share, total=line.total - share) for line, share in zip(lines, shares)]
+
+
+def fingerprint():
+    """Changes whenever any promotion is added, edited or deleted."""
+    stats = Promotion.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return stats['count'], stats['updated']
+
+
+def compile_index(now=None):
+    now = now or timezone.now()
+    stamp = fingerprint()
+    live = Promotion.objects.filter(is_active=True).filter(Q(ends_at__isnull=True) | Q(ends_at__gt=now))
+    rules = []
+    for row in live.filter(starts_at__lte=now).values_list(
+            'id', 'kind', 'percent', 'buy_quantity', 'free_quantity', 'min_subtotal', 'amount', 'sizes'):
+        pid, kind, percent, buy, free, min_subtotal, amount, sizes = row
+        rate = percent / 100 if percent is not None and 0 < percent <= 100 else None
+        # Rows the per-kind constraints would reject (written before them, or as drafts turned
+        # live) are skipped rather than crashing checkout
+        if kind == Promotion.BUY_X_GET_Y and not (buy and free):
+            continue
+        if kind == Promotion.PERCENT_OFF and rate is None:
+            continue
+        if kind == Promotion.CART_THRESHOLD and rate is None and amount is None:
+            continue
+        rules.append(Rule(pid, kind, rate, buy, free, min_subtotal or Decimal(0), amount,
+                          frozenset(size.strip() for size in sizes.split(',') if size.strip())))
+
+    product_ids = defaultdict(list)
+    scoped = Promotion.products.through.objects.filter(promotion__in=live.filter(starts_at__lte=now))
+    for promotion_id, product_id in scoped.values_list('promotion_id', 'product_id'):
+        product_ids[promotion_id].append(product_id)
+
+    # Rebuild when the next rule starts or the first live one ends
+    bounds = live.aggregate(next_start=Min('starts_at', filter=Q(starts_at__gt=now)), next_end=Min('ends_at'))
+    valid_until = min(bounds['next_start'] or FAR_FUTURE, bounds['next_end'] or FAR_FUTURE)
+    return PromotionIndex(rules, product_ids, stamp, valid_until)
+
+
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    """This process's compiled index, rebuilt if promotions changed or a rule started or ended."""
+    global _index, _checked_at
+    now = timezone.now()
+    with _lock:
+        fresh = time.monotonic() - _checked_at < settings.PROMOTION_INDEX_CHECK_SECONDS
+        if _index is not None and now < _index.valid_until and fresh:
+            return _index
+        if _index is None or now >= _index.valid_until or fingerprint() != _index.fingerprint:
+            _index = compile_index(now)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def price_cart(lines):
+    return get_index().price(lines)
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(m2m_changed, sender=Promotion.products.through)
+def invalidate(**kwargs):
+    global _index
+    with _lock:
+        _index = None
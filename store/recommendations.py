@@ -0,0 +1,166 @@
+"""
+"Frequently bought together" from OrderItem co-occurrence.
+
+The product x product co-occurrence matrix is kept in sparse COO form (sorted
+int64 keys `a << 32 | b` plus counts) in an .npz file next to a watermark: the
+highest OrderItem id already counted. Each run only reads items past the
+watermark, adds their pairs to the matrix and rewrites the top-K rows of the
+products those pairs touched.
+
+Ids are handed out at insert time but become visible at commit, so a slow
+checkout can commit items below a watermark that has already moved on. Each run
+therefore re-reads the last RECOMMENDATIONS_WATERMARK_MARGIN ids below the
+watermark too, skipping the ones the matrix remembers counting (`recent`). Items
+committed later than that are only picked up by a --full rebuild.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import OrderItem, ProductRecommendation
+
+SHIFT = np.int64(32)
+MASK = np.int64(0xFFFFFFFF)
+
+
+def matrix_path():
+    return Path(getattr(settings, 'RECOMMENDATIONS_MATRIX_PATH', settings.BASE_DIR / 'var' / 'cooccurrence.npz'))
+
+
+def watermark_margin():
+    return int(getattr(settings, 'RECOMMENDATIONS_WATERMARK_MARGIN', 10_000))
+
+
+class CooccurrenceMatrix:
+    def __init__(self, keys=None, counts=None, watermark=0, recent=None):
+        self.keys = np.empty(0, dtype=np.int64) if keys is None else keys
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else counts
+        self.watermark = int(watermark)
+        # Counted item ids within the margin below the watermark (sorted)
+        self.recent = np.empty(0, dtype=np.int64) if recent is None else recent
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        data = np.load(path)
+        return cls(data['keys'], data['counts'], data['watermark'], data['recent'])
+
+    def save(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.stem + '.tmp.npz')
+        np.savez_compressed(tmp, keys=self.keys, counts=self.counts, watermark=self.watermark, recent=self.recent)
+        os.replace(tmp, path)  # Readers never see a half-written file
+
+    def add(self, keys, counts):
+        """Sum new (key, count) entries into the matrix."""
+        merged, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]), minlength=len(merged)).astype(np.int64)
+        self.keys = merged
+
+    def top_k(self, products, k):
+        """{product_id: ([neighbor ids], [counts])} for the given row ids, best first."""
+        rows = self.keys >> SHIFT
+        selected = np.isin(rows, products)
+        rows, cols, counts = rows[selected], self.keys[selected] & MASK, self.counts[selected]
+        order = np.lexsort((cols, -counts, rows))
+        rows, cols, counts = rows[order], cols[order], counts[order]
+
+        result = {}
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else []
+        ends = list(starts[1:]) + [len(rows)]
+        for start, end in zip(starts, ends):
+            end = min(end, start + k)
+            result[int(rows[start])] = (cols[start:end].tolist(), counts[start:end].tolist())
+        return result
+
+
+def pair_counts(order_ids, product_ids, item_ids, watermark, counted=()):
+    """
+    Co-occurrence pairs for items grouped by order (inputs sorted by order id).
+
+    Only pairs involving at least one new item (id above `watermark` and not in
+    `counted`) are counted, so re-reading a whole order that gained an item never
+    double counts old pairs.
+    """
+    if not len(order_ids):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(order_ids)])
+    item_group_start = np.repeat(starts, sizes)
+    item_group_size = np.repeat(sizes, sizes)
+
+    # Every item paired with every item of its order (including itself, dropped below)
+    left = np.repeat(np.arange(len(order_ids)), item_group_size)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(item_group_size) - item_group_size, item_group_size)
+    right = np.repeat(item_group_start, item_group_size) + offsets
+
+    new = (item_ids > watermark) & ~np.isin(item_ids, counted)
+    keep = (product_ids[left] != product_ids[right]) & (new[left] | new[right])
+    keys = (product_ids[left][keep] << SHIFT) | product_ids[right][keep]
+    return np.unique(keys, return_counts=True)
+
+
+@transaction.atomic
+def build(top_k=20, full=False, chunk_orders=200_000, log=None):
+    """Fold new order items into the matrix and refresh the affected top-K rows."""
+    log = log or (lambda message: None)
+    path = matrix_path()
+    matrix = CooccurrenceMatrix() if full else CooccurrenceMatrix.load(path)
+    floor = max(matrix.watermark - watermark_margin(), 0)
+
+    items = np.array(
+        OrderItem.objects.filter(id__gt=floor, product__isnull=False).values_list('id', 'order_id'), dtype=np.int64,
+    ).reshape(-1, 2)
+    items = items[(items[:, 0] > matrix.watermark) | ~np.isin(items[:, 0], matrix.recent)]
+    if not len(items):
+        log('No new order items.')
+        return 0
+    latest = max(int(items[:, 0].max()), matrix.watermark)
+
+    touched = set()
+    order_ids = np.unique(items[:, 1])
+    for start in range(0, len(order_ids), chunk_orders):
+        chunk = order_ids[start:start + chunk_orders]
+        rows = np.array(
+            # A range scan instead of a huge IN list; untouched orders inside the range
+            # only have old items, which pair_counts ignores
+            OrderItem.objects.filter(order_id__gte=int(chunk[0]), order_id__lte=int(chunk[-1]), product__isnull=False, id__lte=latest)
+            .order_by('order_id', 'id').values_list('order_id', 'product_id', 'id'),
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        keys, counts = pair_counts(rows[:, 0], rows[:, 1], rows[:, 2], floor, matrix.recent)
+        matrix.add(keys, counts)
+        touched.update(np.unique(keys >> SHIFT).tolist())
+        log(f'{start + len(chunk)}/{len(order_ids)} orders')
+
+    recent = np.union1d(matrix.recent, items[:, 0])
+    matrix.watermark, matrix.recent = latest, recent[recent > latest - watermark_margin()]
+    neighbours = matrix.top_k(np.array(sorted(touched), dtype=np.int64), top_k)
+    if full:
+        ProductRecommendation.objects.exclude(product_id__in=list(neighbours)).delete()
+    ProductRecommendation.objects.bulk_create(
+        [ProductRecommendation(product_id=pid, neighbor_ids=ids, scores=scores) for pid, (ids, scores) in neighbours.items()],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['neighbor_ids', 'scores', 'updated_at'],
+    )
+    # Saved last: if the upsert fails, the next run redoes these orders
+    matrix.save(path)
+    log(f'Refreshed {len(neighbours)} products, watermark {latest}.')
+    return len(neighbours)
+
+
+def recommended_ids(recommendations, exclude=(), limit=10):
+    """Merge one or more ProductRecommendation rows into a single ranked id list."""
+    scores = {}
+    for rec in recommendations:
+        for pid, score in zip(rec.neighbor_ids, rec.scores):
+            scores[pid] = scores.get(pid, 0) + score
+    ranked = sorted((pid for pid in scores if pid not in exclude), key=lambda pid: (-scores[pid], pid))
+    return ranked[:limit]
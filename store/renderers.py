@@ -0,0 +1,40 @@
+"""
+orjson-backed drop-in for DRF's JSONRenderer.
+
+Output matches JSONRenderer's compact form: Decimal is rendered as a number
+(COERCE_DECIMAL_TO_STRING aside), datetimes as ISO 8601 with 'Z' for UTC, and
+anything orjson doesn't know natively goes through DRF's JSONEncoder.default.
+"""
+from decimal import Decimal
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+# datetime/date/time go through DRF's encoder too: it trims microseconds to milliseconds
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+    def __init__(self):
+        self._default = self.encoder_class().default
+
+    def default(self, obj):
+        # Prices are the common case; checked before walking JSONEncoder's isinstance chain
+        if type(obj) is Decimal:
+            return float(obj)
+        return self._default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        # Pretty printing (browsable API, ?indent) and ASCII-only output stay on the stdlib path
+        if self.get_indent(accepted_media_type, renderer_context) is not None or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.default, option=OPTIONS)
+        # Same escaping as JSONRenderer, so output stays a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
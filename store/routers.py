@@ -0,0 +1,60 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+
+# Per-request routing state, set by ReplicaPinMiddleware
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+_wrote = ContextVar('db_wrote', default=False)
+
+
+def pin_to_primary():
+    """Send every read for the rest of this request/context to the primary."""
+    _pinned.set(True)
+
+
+def reset_pin(pinned=False):
+    _pinned.set(pinned)
+    _wrote.set(False)
+
+
+def wrote_to_primary():
+    return _wrote.get()
+
+
+class ReplicaRouter:
+    """
+    Routes catalog and order-history reads to a replica.
+
+    Reads stay on the primary when:
+    - the model isn't in REPLICA_READ_MODELS (auth, tokens, carts, wishlists, ...)
+    - we're inside a transaction on the primary
+    - the client wrote recently (read-your-writes, see ReplicaPinMiddleware)
+    """
+
+    def _replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        if not replicas or _pinned.get():
+            return 'default'
+        if model._meta.label_lower not in getattr(settings, 'REPLICA_READ_MODELS', []):
+            return 'default'
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,281 @@
+"""
+Synthetic data for performance work.
+
+Rows are generated with NumPy from a fixed seed (same seed, same data, whatever the
+worker count) and streamed into PostgreSQL with COPY. Other databases fall back to
+bulk_create. Product popularity, orders per user and cart/wishlist ownership follow
+Zipf distributions so a few products and users dominate, as in production.
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections
+from django.utils import timezone
+
+from .models import Cart, Order, OrderItem, Payment, Product, Profile, User, Wishlist
+from .partitions import ensure_partitions, refresh_bounds
+
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', None]
+PAYMENT_MODES = ['card', 'gcash', 'cod', 'bank_transfer']
+HISTORY_DAYS = 730
+
+# Streams for np.random.default_rng([seed, STREAM, chunk])
+USERS, PRODUCTS, ORDERS, ORDER_CHUNK, CARTS, WISHLISTS = range(6)
+
+
+def zipf_weights(n, s):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def money(cents):
+    return f'{cents // 100}.{cents % 100:02d}'
+
+
+class Loader:
+    """Writes rows (tuples in `fields` order) with COPY on PostgreSQL, bulk_create elsewhere."""
+
+    def __init__(self, using='default', batch_size=50_000):
+        self.using = using
+        self.batch_size = batch_size
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def load(self, model, fields, rows):
+        if self.connection.vendor == 'postgresql':
+            return self._copy(model, fields, rows)
+        return self._bulk_create(model, fields, rows)
+
+    def _copy(self, model, fields, rows):
+        columns = ', '.join(self.connection.ops.quote_name(model._meta.get_field(f).column) for f in fields)
+        sql = f'COPY {self.connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN'
+        count = 0
+        with self.connection.cursor() as cursor:
+            # psycopg 3 cursor underneath Django's wrapper
+            with cursor.cursor.copy(sql) as copy:
+                buffer = io.StringIO()
+                for row in rows:
+                    buffer.write('\t'.join(r'\N' if value is None else str(value) for value in row))
+                    buffer.write('\n')
+                    count += 1
+                    if count % self.batch_size == 0:
+                        copy.write(buffer.getvalue())
+                        buffer = io.StringIO()
+                copy.write(buffer.getvalue())
+        return count
+
+    def _bulk_create(self, model, fields, rows):
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(model(**dict(zip(fields, row))))
+            if len(batch) >= self.batch_size:
+                model.objects.using(self.using).bulk_create(batch)
+                count += len(batch)
+                batch = []
+        model.objects.using(self.using).bulk_create(batch)
+        return count + len(batch)
+
+
+class Seeder:
+    def __init__(self, users, products, orders, items_per_order=4, cart_items=0, wishlist_items=0,
+                 paid_ratio=0.8, zipf_s=1.1, seed=0, workers=4, using='default', batch_size=50_000,
+                 chunk_size=100_000, log=None):
+        self.counts = {'users': users, 'products': products, 'orders': orders}
+        self.items_per_order = items_per_order
+        self.cart_items = cart_items
+        self.wishlist_items = wishlist_items
+        self.paid_ratio = paid_ratio
+        self.zipf_s = zipf_s
+        self.seed = seed
+        self.using = using
+        self.loader = Loader(using, batch_size)
+        self.chunk_size = chunk_size
+        self.log = log or (lambda message: None)
+        # SQLite allows a single writer; parallel loads would only fight over the lock
+        self.workers = workers if connections[using].vendor == 'postgresql' else 1
+        self.now = timezone.now()
+
+    def rng(self, *stream):
+        return np.random.default_rng([self.seed, *stream])
+
+    def next_id(self, model):
+        last = model.objects.using(self.using).order_by('-pk').values_list('pk', flat=True).first()
+        return (last or 0) + 1
+
+    def timestamp(self, seconds_ago):
+        return (self.now - timedelta(seconds=int(seconds_ago))).isoformat()
+
+    def parallel(self, *jobs):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._job, job) for job in jobs]
+            return [future.result() for future in futures]
+
+    def _job(self, job):
+        try:
+            return job()
+        finally:
+            connections[self.using].close()
+
+    # Tables
+    def seed_users(self):
+        n = self.counts['users']
+        first = self.user_base
+        password = make_password('password123')  # Hashed once: hashing per row would dominate the run
+        rng = self.rng(USERS)
+        cities = rng.integers(1, 500, n)
+
+        def users():
+            for i in range(n):
+                uid = first + i
+                yield (uid, password, None, False, f'user{uid}@seed.example.com', f'Seed User {uid}',
+                       f'{cities[i]} Seed Street', f'09{uid:09d}'[-15:], None, True, False)
+
+        count = self.loader.load(User, ['id', 'password', 'last_login', 'is_superuser', 'email', 'full_name',
+                                        'complete_address', 'cellphone_number', 'image_url', 'is_active', 'is_staff'], users())
+        # COPY skips the post_save signal that normally creates the profile
+        first_profile = self.next_id(Profile)
+        self.loader.load(Profile, ['id', 'user_id', 'reset_password_token', 'reset_password_token_expiry'],
+                         ((first_profile + i, first + i, None, None) for i in range(n)))
+        self.log(f'users: {count}')
+        return count
+
+    def seed_products(self):
+        n = self.counts['products']
+        rng = self.rng(PRODUCTS)
+        self.product_cents = rng.lognormal(mean=7.0, sigma=0.8, size=n).astype(np.int64) + 100
+        stock = rng.integers(0, 500, n)
+        sizes = rng.integers(0, len(SIZES), n)
+        age = rng.integers(0, HISTORY_DAYS * 86400, n)
+
+        def products():
+            for i in range(n):
+                pid = self.product_base + i
+                yield (pid, f'Product {pid}', 'Seeded product', money(int(self.product_cents[i])), int(stock[i]),
+                       None, SIZES[sizes[i]], self.timestamp(age[i]))
+
+        count = self.loader.load(Product, ['id', 'name', 'description', 'price', 'stock', 'image_url',
+                                           'product_size', 'created_at'], products())
+        self.log(f'products: {count}')
+        return count
+
+    def seed_pairs(self, model, stream, total, with_quantity):
+        """Cart or wishlist rows: Zipf over users (a few huge carts) and over products."""
+        rng = self.rng(stream)
+        users = self.user_base + self.user_rank[rng.choice(self.counts['users'], total, p=self.user_weights)]
+        products = self.product_base + self.product_rank[rng.choice(self.counts['products'], total, p=self.product_weights)]
+        pairs = np.unique(np.stack([users, products], axis=1), axis=0)
+        quantities = rng.integers(1, 5, len(pairs))
+        age = rng.integers(0, 90 * 86400, len(pairs))
+        first = self.next_id(model)
+
+        def rows():
+            for i, (user_id, product_id) in enumerate(pairs):
+                row = (first + i, int(user_id), int(product_id))
+                added = self.timestamp(age[i])
+                if with_quantity:
+                    row += (int(quantities[i]), added)  # Cart lines also carry updated_at
+                yield row + (added,)
+
+        fields = ['id', 'user_id', 'product_id'] + (['quantity', 'updated_at'] if with_quantity else []) + ['added_at']
+        count = self.loader.load(model, fields, rows())
+        self.log(f'{model._meta.model_name}: {count}')
+        return count
+
+    def plan_orders(self):
+        """Decide everything that fixes ids up front, so order chunks can load in parallel."""
+        n = self.counts['orders']
+        rng = self.rng(ORDERS)
+        self.item_counts = 1 + rng.poisson(max(self.items_per_order - 1, 0), n)
+        self.item_offsets = np.concatenate([[0], np.cumsum(self.item_counts)])
+        self.paid = rng.random(n) < self.paid_ratio
+        self.payment_offsets = np.concatenate([[0], np.cumsum(self.paid)])
+
+    def seed_order_chunk(self, chunk):
+        start = chunk * self.chunk_size
+        end = min(start + self.chunk_size, self.counts['orders'])
+        k = end - start
+        rng = self.rng(ORDER_CHUNK, chunk)
+
+        users = self.user_base + self.user_rank[rng.choice(self.counts['users'], k, p=self.user_weights)]
+        age = rng.integers(0, HISTORY_DAYS * 86400, k)
+        counts = self.item_counts[start:end]
+        total_items = int(counts.sum())
+        line_order = np.repeat(np.arange(k), counts)
+        ranks = self.product_rank[rng.choice(self.counts['products'], total_items, p=self.product_weights)]
+        quantities = rng.integers(1, 4, total_items)
+        line_cents = self.product_cents[ranks] * quantities
+        totals = np.bincount(line_order, weights=line_cents, minlength=k).astype(np.int64)
+        modes = rng.integers(0, len(PAYMENT_MODES), k)
+
+        order_ids = self.order_base + start + np.arange(k)
+        created = [self.timestamp(a) for a in age]
+
+        paid = self.paid[start:end]
+        self.loader.load(Order, ['id', 'user_id', 'total_price', 'status', 'status_changed_at', 'created_at'],
+                         ((int(order_ids[i]), int(users[i]), money(int(totals[i])),
+                           Order.STATUS_PAID if paid[i] else Order.STATUS_PENDING, created[i] if paid[i] else None,
+                           created[i]) for i in range(k)))
+
+        item_base = self.item_base + int(self.item_offsets[start])
+        self.loader.load(OrderItem, ['id', 'order_id', 'product_id', 'quantity', 'price', 'discount', 'created_at'],
+                         ((item_base + j, int(order_ids[line_order[j]]), self.product_base + int(ranks[j]),
+                           int(quantities[j]), money(int(line_cents[j])), '0.00', created[line_order[j]])
+                          for j in range(total_items)))
+
+        payment_base = self.payment_base + int(self.payment_offsets[start])
+        paid = np.flatnonzero(paid)
+        self.loader.load(Payment, ['id', 'user_id', 'order_id', 'amount', 'status', 'mode_of_payment', 'created_at'],
+                         ((payment_base + j, int(users[i]), int(order_ids[i]), money(int(totals[i])),
+                           Payment.STATUS_COMPLETED, PAYMENT_MODES[modes[i]], created[i]) for j, i in enumerate(paid)))
+        return k, total_items, len(paid)
+
+    def run(self):
+        self.user_base = self.next_id(User)
+        self.product_base = self.next_id(Product)
+        self.order_base = self.next_id(Order)
+        self.item_base = self.next_id(OrderItem)
+        self.payment_base = self.next_id(Payment)
+
+        # Popularity ranks are shuffled so the hottest ids aren't simply the lowest ones
+        rng = self.rng(PRODUCTS, 1)
+        self.product_rank = rng.permutation(self.counts['products'])
+        self.product_weights = zipf_weights(self.counts['products'], self.zipf_s)
+        self.user_rank = rng.permutation(self.counts['users'])
+        self.user_weights = zipf_weights(self.counts['users'], self.zipf_s * 0.8)
+
+        # History reaches back HISTORY_DAYS, further than the partitions kept by default
+        ensure_partitions(since=self.now - timedelta(days=HISTORY_DAYS))
+        self.parallel(self.seed_users, self.seed_products)
+
+        jobs = []
+        if self.cart_items:
+            jobs.append(lambda: self.seed_pairs(Cart, CARTS, self.cart_items, with_quantity=True))
+        if self.wishlist_items:
+            jobs.append(lambda: self.seed_pairs(Wishlist, WISHLISTS, self.wishlist_items, with_quantity=False))
+        if self.counts['orders']:
+            self.plan_orders()
+            chunks = range((self.counts['orders'] + self.chunk_size - 1) // self.chunk_size)
+            jobs.extend(lambda chunk=chunk: self.seed_order_chunk(chunk) for chunk in chunks)
+        results = self.parallel(*jobs)
+        orders = [r for r in results if isinstance(r, tuple)]
+        self.log(f'orders: {sum(r[0] for r in orders)}, order items: {sum(r[1] for r in orders)}, '
+                 f'payments: {sum(r[2] for r in orders)}')
+
+        self.reset_sequences()
+        refresh_bounds()
+
+    def reset_sequences(self):
+        """Explicit ids were inserted, so move the id sequences past them."""
+        connection = connections[self.using]
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Profile, Product, Cart, Wishlist, Order, OrderItem, Payment])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
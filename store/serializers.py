@@ -1,7 +1,14 @@
+import functools
+import time
+
 from rest_framework import serializers
-from django.contrib.auth import get_user_model
+from rest_framework.fields import empty
+from django.contrib.auth import authenticate, get_user_model
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
 from .models import Product, Order, Cart, Wishlist, OrderItem, Payment
 from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from . import metrics
 
 User = get_user_model()
 
@@ -38,6 +45,23 @@ class LoginSerializer(serializers.Serializer):
             return {"email": user.email, "token": token.key}
         raise serializers.ValidationError("Invalid credentials")
 
+# Token Login Serializer (password check runs on the bounded hashing pool)
+class PooledAuthTokenSerializer(AuthTokenSerializer):
+    def validate(self, attrs):
+        username = attrs.get('username')
+        password = attrs.get('password')
+
+        if not username or not password:
+            raise serializers.ValidationError('Must include "username" and "password".', code='authorization')
+
+        # store.hashers.PooledModelBackend runs the check on the bounded hashing pool
+        user = authenticate(request=self.context.get('request'), username=username, password=password)
+        if not user:
+            raise serializers.ValidationError('Unable to log in with provided credentials.', code='authorization')
+
+        attrs['user'] = user
+        return attrs
+
 # Product Serializer
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -95,8 +119,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ['id', 'user', 'total_price', 'created_at']
-        read_only_fields = ['created_at', 'user']  # Allow `total_price` input
+        fields = ['id', 'user', 'total_price', 'status', 'status_changed_at', 'created_at']
+        read_only_fields = ['created_at', 'user', 'status', 'status_changed_at']  # Allow `total_price` input; status moves through /status/
 
     def create(self, validated_data):
         user = self.context['request'].user  
@@ -109,4 +133,101 @@ class OrderSerializer(serializers.ModelSerializer):
 
         # Create order with user and total price
         order = Order.objects.create(user=user, total_price=total_price)
-        return order
\ No newline at end of file
+        return order
+
+
+###### COMPILED (READ-ONLY) SERIALIZERS ##########
+
+# Fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.EmailField, serializers.URLField,
+    serializers.SlugField, serializers.BooleanField, serializers.ReadOnlyField,
+)
+
+
+class CompiledSerializer:
+    """
+    Read-only fast path for list endpoints.
+
+    Output dicts are built straight from `.values_list()` rows by a function generated
+    once per serializer class, instead of instantiating models and calling
+    get_attribute/to_representation for every field of every row. Fields, sources and
+    value formatting come from the serializer itself, so the result equals
+    `serializer_class(queryset, many=True).data`. Serializers with fields that need a
+    model instance (method fields, nested serializers, properties) are refused.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        model = serializer_class.Meta.model
+        columns = {}
+        namespace = {}
+        entries = []
+
+        def column(lookup):
+            return columns.setdefault(lookup, len(columns))
+
+        for field in serializer_class().fields.values():
+            if field.write_only:
+                continue
+            lookup, nullable_hops = self.resolve(model, field)
+            value = f'row[{column(lookup)}]'
+            if not (type(field) in PASSTHROUGH_FIELDS or self.is_pk_field(field)):
+                namespace[f'f{len(namespace)}'] = field.to_representation
+                value = f'(None if {value} is None else f{len(namespace) - 1}({value}))'
+
+            entry = f'{field.field_name!r}: {value}'
+            if nullable_hops:
+                # DRF skips the field (or renders null) when a relation on the way is empty
+                guard = ' and '.join(f'row[{column(hop)}] is not None' for hop in nullable_hops)
+                missing = f'{{{field.field_name!r}: None}}' if field.allow_null else '{}'
+                entry = f'**({{{entry}}} if {guard} else {missing})'
+            entries.append(entry)
+
+        self.lookups = list(columns)
+        self.to_representation = eval(f'lambda row: {{{", ".join(entries)}}}', namespace)
+
+    @staticmethod
+    def is_pk_field(field):
+        return isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None
+
+    def resolve(self, model, field):
+        """ORM lookup for a field's source, plus lookups of nullable relations along the way."""
+        name = f'{self.serializer_class.__name__}.{field.field_name}'
+        if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)) or field.source == '*':
+            raise ImproperlyConfigured(f'{name} needs a model instance and cannot be compiled.')
+
+        path, nullable_hops = [], []
+        for i, attr in enumerate(field.source_attrs):
+            try:
+                model_field = model._meta.pk if attr == 'pk' else model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(f'{name}: "{attr}" is not a model field.')
+            path.append(model_field.name)
+            last = i == len(field.source_attrs) - 1
+            if model_field.many_to_many or model_field.one_to_many:
+                raise ImproperlyConfigured(f'{name}: to-many relations cannot be compiled.')
+            if model_field.is_relation and last and not self.is_pk_field(field):
+                raise ImproperlyConfigured(f'{name}: only primary key relations can be compiled.')
+            if model_field.is_relation and not last:
+                if model_field.null:
+                    if field.default is not empty:
+                        raise ImproperlyConfigured(f'{name}: defaults on nullable relations cannot be compiled.')
+                    nullable_hops.append('__'.join(path))
+                model = model_field.related_model
+        return '__'.join(path), nullable_hops
+
+    def serialize(self, queryset):
+        """Same list as `serializer_class(queryset, many=True).data`."""
+        timings = metrics.current_timings()
+        start = time.perf_counter()
+        data = list(map(self.to_representation, queryset.values_list(*self.lookups)))
+        if timings is not None:
+            timings.serializer_seconds += time.perf_counter() - start
+        return data
+
+
+@functools.cache
+def compiled(serializer_class):
+    return CompiledSerializer(serializer_class)
+
@@ -0,0 +1,236 @@
+"""
+Slow-query recorder (opt-in: SLOW_QUERY_MS > 0).
+
+SlowQueryMiddleware wraps every request's database connections
+(connection.execute_wrapper). A statement that takes SLOW_QUERY_MS or longer is
+recorded under its fingerprint, i.e. its SQL with literals and placeholders replaced
+by ? and IN/VALUES lists collapsed, so `id IN (1, 2)` and `id IN (3)` count as one
+query. Each entry keeps the count, total/max time, the views that ran it and the
+project frames of the stack behind its slowest run. Parameters are never stored.
+
+A fraction (SLOW_QUERY_EXPLAIN_RATE) of slow SELECTs is run again under EXPLAIN
+(ANALYZE, BUFFERS) on PostgreSQL, EXPLAIN QUERY PLAN elsewhere, at most once per
+fingerprint every SLOW_QUERY_EXPLAIN_INTERVAL seconds. The plan is taken inside a
+savepoint, so a failing EXPLAIN can't break the request's transaction. PostgreSQL
+prints the bound values in plan conditions (emails, tokens), so quoted literals,
+and numbers inside Cond/Filter expressions, are replaced by ? before the plan is stored.
+
+Entries live in the SLOW_QUERY_CACHE_ALIAS cache, bounded to SLOW_QUERY_MAX_ENTRIES
+fingerprints (the least recently seen one is dropped). Staff read them at
+GET /api/slow-queries/ or with `manage.py slow_queries`; the command only sees other
+processes' entries when that cache is shared (e.g. Redis or Memcached).
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'slowq:v1:'
+
+current_view = ContextVar('slow_query_view', default='-')
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_lists = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_rows = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_spaces = re.compile(r'\s+')
+_plan_strings = re.compile(r"'(?:[^']|'')*'")
+_plan_conditions = re.compile(r'((?:Cond|Filter): )(\(.*)$', re.M)
+
+
+def normalize(sql):
+    """SQL with literals and placeholders as ?, lists as (...)."""
+    sql = _literals.sub('?', sql)
+    sql = _lists.sub('(...)', sql)
+    sql = _rows.sub('(...), ...', sql)
+    return _spaces.sub(' ', sql).strip()
+
+
+def scrub_plan(plan):
+    """Plan text without the statement's values: quoted literals and numbers in conditions become ?."""
+    plan = _plan_strings.sub('?', plan)
+    return _plan_conditions.sub(lambda match: match[1] + _literals.sub('?', match[2]), plan)
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:16]
+
+
+def project_stack():
+    """The innermost SLOW_QUERY_STACK_DEPTH frames of our own code, outermost first."""
+    root = str(settings.BASE_DIR)
+    frames = [
+        f'{frame.filename[len(root) + 1:]}:{frame.lineno} in {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(root) and 'site-packages' not in frame.filename and frame.filename != __file__
+    ]
+    return frames[-settings.SLOW_QUERY_STACK_DEPTH:]
+
+
+def explain(connection, sql, params):
+    """The statement's plan as text, or None if EXPLAIN failed."""
+    if connection.vendor == 'postgresql':
+        explain_sql = f'EXPLAIN (ANALYZE, BUFFERS) {sql}'
+    else:
+        explain_sql = f'EXPLAIN QUERY PLAN {sql}'
+    # The backend's own cursor: no execute wrappers (so no recursion), and the caller's cursor keeps its rows
+    cursor = connection.create_cursor()
+    savepoint = connection.in_atomic_block
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(explain_sql, params)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            return None
+        finally:
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    finally:
+        cursor.close()
+    return scrub_plan('\n'.join(' | '.join(str(value) for value in row) for row in rows))
+
+
+class SlowQueryLog:
+    """Entries by fingerprint in the cache, with an index of fingerprints in last-seen order."""
+
+    lock_timeout = 5
+
+    def __init__(self):
+        self.cache = caches[settings.SLOW_QUERY_CACHE_ALIAS]
+        self.local_lock = threading.Lock()
+
+    @contextmanager
+    def lock(self):
+        # Same as the cart storage lock: cache.add is atomic on every backend
+        deadline = time.monotonic() + 2 * self.lock_timeout
+        while not self.cache.add(f'{PREFIX}lock', 1, self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError('Slow query log lock is busy')
+            time.sleep(0.002)
+        try:
+            yield
+        finally:
+            self.cache.delete(f'{PREFIX}lock')
+
+    def wants_plan(self, sql):
+        """Sample this run for EXPLAIN? Only if the fingerprint has no plan younger than SLOW_QUERY_EXPLAIN_INTERVAL."""
+        if random.random() >= settings.SLOW_QUERY_EXPLAIN_RATE:
+            return False
+        entry = self.cache.get(PREFIX + fingerprint(sql))
+        return not entry or entry['plan_at'] is None or time.time() - entry['plan_at'] >= settings.SLOW_QUERY_EXPLAIN_INTERVAL
+
+    def record(self, sql, seconds, view, stack, plan=None):
+        """Count one slow run of `sql`, with its plan if one was taken."""
+        key = fingerprint(sql)
+        with self.local_lock, self.lock():
+            entry = self.cache.get(PREFIX + key) or {
+                'fingerprint': key, 'sql': normalize(sql), 'example': sql[:2000], 'count': 0, 'total_ms': 0.0,
+                'max_ms': 0.0, 'views': {}, 'stack': [], 'first_seen': timezone.now().isoformat(),
+                'plan': None, 'plan_at': None,
+            }
+            ms = seconds * 1000
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['views'][view] = entry['views'].get(view, 0) + 1
+            entry['last_seen'] = timezone.now().isoformat()
+            if ms >= entry['max_ms']:
+                entry['max_ms'], entry['stack'] = ms, stack
+            if plan is not None:
+                entry['plan'], entry['plan_at'] = plan, time.time()
+            self.cache.set(PREFIX + key, entry, None)
+
+            index = [fp for fp in self.cache.get(f'{PREFIX}index') or [] if fp != key] + [key]
+            dropped, index = index[:-settings.SLOW_QUERY_MAX_ENTRIES], index[-settings.SLOW_QUERY_MAX_ENTRIES:]
+            self.cache.set(f'{PREFIX}index', index, None)
+            self.cache.delete_many([PREFIX + fp for fp in dropped])
+        return entry
+
+    def entries(self):
+        """Recorded entries, most total time first."""
+        index = self.cache.get(f'{PREFIX}index') or []
+        found = self.cache.get_many([PREFIX + fp for fp in index])
+        return sorted(found.values(), key=lambda entry: entry['total_ms'], reverse=True)
+
+    def clear(self):
+        with self.lock():
+            index = self.cache.get(f'{PREFIX}index') or []
+            self.cache.delete_many([PREFIX + fp for fp in index] + [f'{PREFIX}index'])
+
+
+_log = None
+
+
+def get_log():
+    global _log
+    if _log is None:
+        _log = SlowQueryLog()
+    return _log
+
+
+class Recorder:
+    """connection.execute_wrapper hook recording statements at or over SLOW_QUERY_MS."""
+
+    def __init__(self, threshold_ms=None):
+        self.threshold = (settings.SLOW_QUERY_MS if threshold_ms is None else threshold_ms) / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        seconds = time.perf_counter() - start
+        if seconds >= self.threshold:
+            try:
+                log, plan = get_log(), None
+                # Only SELECTs are re-run: ANALYZE executes the statement
+                if not many and sql.lstrip()[:6].upper() == 'SELECT' and log.wants_plan(sql):
+                    plan = explain(context['connection'], sql, params)
+                log.record(sql, seconds, current_view.get(), project_stack(), plan)
+            except Exception:  # Never fail the request over its diagnostics
+                logger.warning("Could not record a slow query", exc_info=True)
+        return result
+
+
+@contextmanager
+def recording(view, threshold_ms=None):
+    """Record slow statements on every connection in this block, attributed to `view`."""
+    token = current_view.set(view)
+    recorder = Recorder(threshold_ms)
+    try:
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            yield
+    finally:
+        current_view.reset(token)
+
+
+class SlowQueryMiddleware:
+    """Records slow statements per view when SLOW_QUERY_MS is set (see module docstring)."""
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_MS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with recording(f'{request.method} {request.path}'):
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        current_view.set(f'{request.method} {match.url_name or match.view_name}')  # Path until resolved
@@ -1,3 +1,1323 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import logging
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from unittest import addModuleCleanup, skipUnless
+from unittest.mock import patch
+from decimal import Decimal
+from pathlib import Path
 
-# Create your tests here.
+import numpy as np
+import orjson
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse, QueryDict
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.contrib.admin import site
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.renderers import JSONRenderer
+
+from store import (benchmarks, cart_storage, facets, hashers, loadtest, metrics, notifications, order_events, outbox,
+                   promotions, reaper, recommendations, slow_queries, tokens)
+from store.log import JsonFormatter, QueueingHandler, RequestIdFilter, SamplingFilter
+from store.middleware import CompressionMiddleware, ReplicaPinMiddleware, RequestIdMiddleware
+from store.models import (Cart, ChangeStamp, Notification, Order, OrderItem, OutboxCursor, OutboxEvent, Payment, Product,
+                          ProductRecommendation, ProductVariant, Profile, Promotion, User, Wishlist,
+                          WishlistNotificationJob)
+from store import partitions
+from store.seeding import Seeder
+from store.renderers import ORJSONRenderer
+from store.routers import ReplicaRouter, reset_pin
+from store.tokens import SignedTokenAuthentication
+from store.transfers import cart_to_wishlist, wishlist_to_cart
+from store.serializers import CartSerializer, PaymentSerializer, ProductSerializer, WishlistSerializer, compiled
+from store.views import CartAddView, stamp_etag
+
+
+def setUpModule():
+    # Keep the runner's output readable: the 'store' logger writes JSON lines to stdout.
+    # Tests that check logging attach their own handlers.
+    quiet = patch.object(logging.getLogger('store'), 'handlers', [logging.NullHandler()])
+    quiet.start()
+    addModuleCleanup(quiet.stop)
+
+
+class PooledLoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='pooled@example.com', password=None)
+        cls.user.password = make_password('pw-12345', hasher='pbkdf2_sha256')
+        cls.user.save(update_fields=['password'])
+
+    def login(self, password):
+        return APIClient().post('/api/login/', {'username': 'pooled@example.com', 'password': password}, format='json')
+
+    def test_login_rehashes_old_hashes_and_sends_auth_signals(self):
+        failed, logged_in = [], []
+        receivers = [(user_login_failed, lambda **kwargs: failed.append(kwargs['credentials']['username'])),
+                     (user_logged_in, lambda **kwargs: logged_in.append(kwargs['user'].pk))]
+        for signal, receiver in receivers:
+            signal.connect(receiver)
+            self.addCleanup(signal.disconnect, receiver)
+
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.assertEqual(failed, ['pooled@example.com'])
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('pbkdf2_sha256$'))
+
+        self.assertEqual(self.login('pw-12345').status_code, 200)
+        self.assertEqual(logged_in, [self.user.pk])
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('scrypt$'))
+
+    def test_saturated_pool_answers_503(self):
+        pool = hashers.PasswordCheckPool(workers=1, max_pending=1)
+        pool._slots.acquire()  # The one slot is taken by a check still running
+        previous, hashers._pool = hashers._pool, pool
+        self.addCleanup(setattr, hashers, '_pool', previous)
+
+        response = self.login('pw-12345')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        reset_pin()
+        cache.clear()
+
+    def test_catalog_and_order_reads_use_replica(self):
+        self.assertEqual(self.router.db_for_read(Product), 'replica')
+        self.assertEqual(self.router.db_for_read(Order), 'replica')
+
+    def test_other_reads_stay_on_primary(self):
+        self.assertEqual(self.router.db_for_read(Cart), 'default')
+
+    def test_reads_after_write_stick_to_primary(self):
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replica_configured(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_client_stays_pinned_across_requests(self):
+        factory = RequestFactory()
+        seen = []
+
+        def writing_view(request):
+            self.router.db_for_write(Order)
+            return None
+
+        def reading_view(request):
+            seen.append(self.router.db_for_read(Product))
+            return None
+
+        ReplicaPinMiddleware(writing_view)(factory.post('/', HTTP_AUTHORIZATION='Token abc'))
+        ReplicaPinMiddleware(reading_view)(factory.get('/', HTTP_AUTHORIZATION='Token abc'))
+        ReplicaPinMiddleware(reading_view)(factory.get('/', HTTP_AUTHORIZATION='Token other'))
+
+        self.assertEqual(seen, ['default', 'replica'])
+
+    def test_etag_stamped_views_read_from_the_primary(self):
+        # The ChangeStamp behind the ETag is on the primary; the body must not come from a lagging replica
+        seen = []
+
+        @stamp_etag('orders')
+        def order_view(request, order_id):
+            seen.append(self.router.db_for_read(Order))
+            return HttpResponse()
+
+        request = RequestFactory().get('/api/orders/1/')
+        request.user = User(id=1)
+        with patch.object(ChangeStamp, 'current', return_value=3):
+            response = ReplicaPinMiddleware(lambda request: order_view(request, order_id=1))(request)
+        self.assertEqual((response['ETag'], seen), ('"orders-1-3-1"', ['default']))
+        self.assertEqual(self.router.db_for_read(Order), 'replica')  # Only for that request
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.create(name='Metered', price='5.00', stock=1)
+        cls.user = User.objects.create_customer(email='metrics@example.com', password=None)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_requests_are_timed_and_counted_per_route(self):
+        before = metrics.snapshot().get('product-list', metrics.RouteStats())
+        count, queries = before.count, before.queries
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/products/').status_code, 200)
+        after = metrics.snapshot()['product-list']
+        self.assertEqual(after.count - count, 2)
+        self.assertGreaterEqual(after.queries - queries, 2)
+        self.assertEqual(sum(after.buckets), after.count)
+        self.assertGreater(after.seconds, 0)
+
+    def test_metrics_endpoint_is_limited_to_allowed_addresses(self):
+        self.client.get('/api/products/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds_count{route="product-list"}', response.content.decode())
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 403)
+
+    def test_serializer_data_is_timed_for_the_current_request(self):
+        timings = metrics.start_request()
+        try:
+            ProductSerializer(Product.objects.all(), many=True).data
+        finally:
+            metrics.finish_request()
+        self.assertGreater(timings.serializer_seconds, 0)
+        ProductSerializer(Product.objects.all(), many=True).data  # Outside a request: nothing to record into
+        self.assertIsNone(metrics.current_timings())
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class LoggingTests(SimpleTestCase):
+    def record(self, level=logging.INFO, msg='Order %s', args=(7,), **extra):
+        record = logging.LogRecord('store.views', level, __file__, 1, msg, args, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter_writes_message_request_id_and_extras(self):
+        entry = json.loads(JsonFormatter().format(self.record(request_id='abc', order_id=7, total_price=Decimal('9.50'))))
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'store.views')
+        self.assertEqual(entry['message'], 'Order 7')
+        self.assertEqual(entry['request_id'], 'abc')
+        self.assertEqual((entry['order_id'], entry['total_price']), (7, '9.50'))
+        self.assertNotIn('exc', entry)
+        datetime.fromisoformat(entry['ts'])
+
+    def test_json_formatter_includes_the_traceback(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord('store', logging.ERROR, __file__, 1, 'Failed', None, sys.exc_info())
+        self.assertIn('ValueError: boom', json.loads(JsonFormatter().format(record))['exc'])
+
+    def test_request_id_reaches_records_and_response(self):
+        handler = ListHandler()
+        handler.addFilter(RequestIdFilter())
+        logger = logging.getLogger('store.tests.request_id')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        def view(request):
+            logger.warning('Inside the request')
+            return HttpResponse()
+
+        middleware = RequestIdMiddleware(view)
+        response = middleware(RequestFactory().get('/', HTTP_X_REQUEST_ID='req-1'))
+        self.assertEqual(response['X-Request-ID'], 'req-1')
+        generated = middleware(RequestFactory().get('/'))['X-Request-ID']
+        self.assertRegex(generated, r'^[0-9a-f]{32}$')
+        self.assertEqual([record.request_id for record in handler.records], ['req-1', generated])
+
+        logger.warning('Outside any request')
+        self.assertIsNone(handler.records[-1].request_id)
+
+    def test_sampling_keeps_info_and_a_fraction_of_debug(self):
+        info, debug = self.record(), self.record(level=logging.DEBUG)
+        self.assertTrue(SamplingFilter(rate=0).filter(info))
+        self.assertFalse(SamplingFilter(rate=0).filter(debug))
+        self.assertTrue(SamplingFilter(rate=1).filter(debug))
+        with patch('store.log.random.random', side_effect=[0.2, 0.6]):
+            sampler = SamplingFilter(rate=0.5)
+            self.assertEqual([sampler.filter(debug), sampler.filter(debug)], [True, False])
+
+    def test_queueing_handler_writes_json_lines_from_its_thread(self):
+        stream = io.StringIO()
+        handler = QueueingHandler(stream)
+        args = {'n': 1}
+        handler.handle(self.record(msg='Count %(n)s', args=(args,), order_id=3))
+        args['n'] = 2  # The message was resolved when the record was queued
+        handler.stop_listener()
+        handler.stop_listener()
+        entry, = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual((entry['message'], entry['order_id']), ('Count 1', 3))
+
+
+class LoadTestReportTests(SimpleTestCase):
+    def stats(self):
+        stats, other = loadtest.Stats(), loadtest.Stats()
+        for ms in range(1, 101):  # 1..100 ms, every tenth one failed
+            (stats if ms % 2 else other).add('GET /api/products/', ms / 1000, 500 if ms % 10 == 0 else 200)
+        stats.add('POST /api/login/', 0.2, 0)  # Connection error
+        stats.merge(other)
+        return stats
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([loadtest.percentile(values, pct) for pct in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(loadtest.percentile([7], 99), 7)
+        self.assertEqual(loadtest.percentile([], 50), 0.0)
+
+    def test_report_counts_errors_and_latency_per_endpoint(self):
+        result = loadtest.report(self.stats(), elapsed=10, users=2, weights={'browse': 1}, iterations=20)
+        products = result['endpoints']['GET /api/products/']
+        self.assertEqual(products, {
+            'requests': 100, 'throughput_rps': 10.0, 'error_rate': 0.1, 'p50_ms': 50.0, 'p95_ms': 95.0, 'p99_ms': 99.0,
+        })
+        self.assertEqual(result['endpoints']['POST /api/login/']['error_rate'], 1.0)
+        self.assertEqual((result['requests'], result['throughput_rps'], result['error_rate']), (101, 10.1, 0.1089))
+
+    def test_compare_pairs_metrics_of_endpoints_in_both_reports(self):
+        baseline = loadtest.report(self.stats(), elapsed=10, users=2, weights={}, iterations=20)
+        current = loadtest.report(self.stats(), elapsed=5, users=2, weights={}, iterations=20)
+        current['endpoints']['GET /api/new/'] = dict(current['endpoints']['POST /api/login/'])
+        rows = {(endpoint, metric): (before, after) for endpoint, metric, before, after in loadtest.compare(baseline, current)}
+        self.assertEqual(rows[('GET /api/products/', 'throughput_rps')], (10.0, 20.0))
+        self.assertEqual(rows[('GET /api/products/', 'p95_ms')], (95.0, 95.0))
+        self.assertEqual(rows[('POST /api/login/', 'error_rate')], (1.0, 1.0))
+        self.assertEqual(len(rows), 10)
+        self.assertNotIn('GET /api/new/', {endpoint for endpoint, _ in rows})
+
+
+class SeedingTests(TransactionTestCase):
+    # The seeder loads from worker threads with their own connections, so the rows must be committed
+
+    def test_small_seed(self):
+        seeder = Seeder(users=40, products=30, orders=300, cart_items=80, wishlist_items=80, batch_size=50, chunk_size=128)
+        seeder.run()
+
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Profile.objects.count(), 40)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Order.objects.count(), 300)
+        self.assertEqual(OrderItem.objects.count(), int(seeder.item_counts.sum()))
+        self.assertEqual(Payment.objects.count(), int(seeder.paid.sum()))
+        # Duplicate draws are merged, so there are at most as many lines as draws
+        self.assertTrue(0 < Cart.objects.count() <= 80)
+        self.assertTrue(0 < Wishlist.objects.count() <= 80)
+
+        # Every foreign key points at a seeded row
+        self.assertFalse(Profile.objects.exclude(user__in=User.objects.all()).exists())
+        self.assertFalse(Order.objects.exclude(user__in=User.objects.all()).exists())
+        self.assertFalse(OrderItem.objects.exclude(order__in=Order.objects.all()).exists())
+        self.assertFalse(OrderItem.objects.exclude(product__in=Product.objects.all()).exists())
+        self.assertFalse(Payment.objects.exclude(order__in=Order.objects.all()).exists())
+        self.assertFalse(Payment.objects.exclude(user=F('order__user')).exists())
+        self.assertEqual(Order.objects.filter(status=Order.STATUS_PAID).count(), Payment.objects.count())
+        self.assertFalse(Cart.objects.exclude(product__in=Product.objects.all()).exists())
+        self.assertFalse(Wishlist.objects.exclude(user__in=User.objects.all()).exists())
+
+        # Order totals add up, and the sequences were moved past the explicit ids
+        for order in Order.objects.annotate(lines=Sum('order_items__price'))[:20]:
+            self.assertEqual(order.total_price, order.lines)
+        self.assertGreater(Product.objects.create(name='After seeding', price='1.00', stock=1).pk, Product.objects.order_by('-pk')[1].pk)
+
+        # Zipf popularity: the top product is the seeder's rank 0 and sells far more than an even share (1/30)
+        lines = list(OrderItem.objects.values('product').annotate(n=Count('id')).order_by('-n').values_list('product', 'n'))
+        top, top_count = lines[0]
+        self.assertEqual(top, seeder.product_base + int(seeder.product_rank[0]))
+        self.assertGreater(top_count / OrderItem.objects.count(), 0.15)
+        self.assertGreater(top_count, 5 * lines[len(lines) // 2][1])
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='recommend@example.com', password=None)
+        cls.products = [Product.objects.create(name=f'Bundle {i}', price='10.00', stock=50) for i in range(6)]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(RECOMMENDATIONS_MATRIX_PATH=Path(directory.name) / 'cooccurrence.npz')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def order(self, *indexes):
+        order = Order.objects.create(user=self.user)
+        return [OrderItem.objects.create(order=order, product=self.products[i]) for i in indexes]
+
+    def matrix(self):
+        matrix = recommendations.CooccurrenceMatrix.load(recommendations.matrix_path())
+        return dict(zip(matrix.keys.tolist(), matrix.counts.tolist()))
+
+    def rows(self):
+        return {rec.product_id: (rec.neighbor_ids, rec.scores) for rec in ProductRecommendation.objects.all()}
+
+    def test_pair_counts(self):
+        # Orders 1: products 10, 20, 30; 2: 10, 20; 3: 10 twice (no self pairs). Item ids 1..7
+        order_ids = np.array([1, 1, 1, 2, 2, 3, 3])
+        product_ids = np.array([10, 20, 30, 10, 20, 10, 10])
+        item_ids = np.arange(1, 8)
+
+        def counts(*args):
+            keys, counts = recommendations.pair_counts(order_ids, product_ids, item_ids, *args)
+            return {(int(key >> 32), int(key & 0xFFFFFFFF)): int(n) for key, n in zip(keys, counts)}
+
+        self.assertEqual(counts(0), {
+            (10, 20): 2, (20, 10): 2, (10, 30): 1, (30, 10): 1, (20, 30): 1, (30, 20): 1,
+        })
+        # Only item 5 is new: order 2's pair, once each way
+        self.assertEqual(counts(4), {(10, 20): 1, (20, 10): 1})
+        # Past id 2, but items 3 and 4 were already counted: again only item 5's pairs
+        self.assertEqual(counts(2, np.array([3, 4])), {(10, 20): 1, (20, 10): 1})
+        self.assertEqual(counts(7), {})
+
+    def test_incremental_builds_match_a_full_rebuild(self):
+        self.order(0, 1, 2)
+        first = self.order(0, 1, 3)
+        late = first[-1]
+        self.order(1, 2)
+        # An item whose transaction commits after the next run has moved the watermark past its id
+        late_id, late_order = late.id, late.order
+        late.delete()
+        self.assertEqual(recommendations.build(), 3)
+
+        OrderItem.objects.create(id=late_id, order=late_order, product=self.products[3])
+        self.order(0, 2, 4)
+        recommendations.build()
+        self.assertEqual(recommendations.build(), 0)  # Nothing new
+        incremental, rows = self.matrix(), self.rows()
+
+        recommendations.build(full=True)
+        self.assertEqual(self.matrix(), incremental)
+        self.assertEqual(self.rows(), rows)
+        ids = [product.id for product in self.products]
+        self.assertEqual(rows[ids[0]], ([ids[1], ids[2], ids[3], ids[4]], [2, 2, 1, 1]))
+        self.assertEqual(rows[ids[3]], ([ids[0], ids[1]], [1, 1]))
+
+    def test_endpoints_take_a_fixed_number_of_queries(self):
+        ids = [product.id for product in self.products]
+        self.client.force_login(self.user)
+
+        def queries(url, neighbours):
+            ProductRecommendation.objects.update_or_create(
+                product_id=ids[0], defaults={'neighbor_ids': ids[1:1 + neighbours], 'scores': [1] * neighbours})
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(len(response.json()), neighbours)
+            return len(captured)
+
+        url = f'/api/products/{ids[0]}/recommendations/'
+        self.assertEqual(queries(url, 1), queries(url, 5))
+
+        Cart.objects.create(user=self.user, product=self.products[0], quantity=1)
+        self.assertEqual(queries('/api/cart/recommendations/', 1), queries('/api/cart/recommendations/', 5))
+
+
+class WishlistNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Rain jacket', price='50.00', stock=0)
+        cls.users = [User.objects.create_customer(email=f'watcher{i}@example.com', password=None) for i in range(7)]
+        Wishlist.objects.bulk_create(Wishlist(user=user, product=cls.product) for user in cls.users)
+
+    def jobs(self):
+        return list(WishlistNotificationJob.objects.order_by('id').values_list('kind', 'old_price', 'new_price'))
+
+    def test_jobs_are_queued_only_when_the_listing_changes(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.name = 'Rain jacket (blue)'
+        product.save()
+        self.assertEqual(self.jobs(), [])
+
+        product.stock = 5
+        product.save()
+        product.stock = 3  # Still in stock
+        product.price = Decimal('60.00')  # Dearer
+        product.save()
+        self.assertEqual(self.jobs(), [(WishlistNotificationJob.KIND_BACK_IN_STOCK, None, None)])
+
+        product.price = Decimal('45.00')
+        product.save()
+        product.save()
+        self.assertEqual(self.jobs()[1:], [(WishlistNotificationJob.KIND_PRICE_DROP, Decimal('60.00'), Decimal('45.00'))])
+
+        # Nobody watching: nothing to fan out
+        unwatched = Product.objects.create(name='Umbrella', price='20.00', stock=0)
+        unwatched.stock, unwatched.price = 4, Decimal('10.00')
+        unwatched.save()
+        self.assertEqual(len(self.jobs()), 2)
+
+    def test_fan_out_reaches_every_watcher_once(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 5
+        product.save()
+
+        self.assertEqual(notifications.process_pending(chunk_size=3), 1)
+        job = WishlistNotificationJob.objects.get()
+        self.assertEqual((job.status, job.sent), (WishlistNotificationJob.STATUS_DONE, len(self.users)))
+        self.assertEqual(
+            sorted(Notification.objects.filter(job=job).values_list('user_id', flat=True)), sorted(user.id for user in self.users))
+        self.assertEqual(Notification.objects.get(user=self.users[0]).message, 'Rain jacket is back in stock!')
+
+        # Running again finds nothing to do, and a job re-run from the start (a crashed
+        # worker's job being re-claimed) doesn't notify anyone twice
+        call_command('process_wishlist_notifications', stdout=io.StringIO())
+        WishlistNotificationJob.objects.update(status=WishlistNotificationJob.STATUS_PENDING, cursor=0)
+        self.assertEqual(notifications.process_pending(chunk_size=3), 1)
+        self.assertEqual(Notification.objects.count(), len(self.users))
+        self.assertEqual(WishlistNotificationJob.objects.get().sent, len(self.users))
+
+
+class TransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='mover@example.com', password=None)
+        cls.hat = Product.objects.create(name='Hat', price='12.00', stock=4)
+        cls.scarf = Product.objects.create(name='Scarf', price='15.00', stock=2)
+        cls.gloves = Product.objects.create(name='Gloves', price='9.00', stock=0)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cart(self):
+        return dict(Cart.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+    def wishlist(self):
+        return set(Wishlist.objects.filter(user=self.user).values_list('product_id', flat=True))
+
+    def test_move_selected_products_to_cart(self):
+        for product in (self.hat, self.scarf, self.gloves):
+            Wishlist.objects.create(user=self.user, product=product)
+        Cart.objects.create(user=self.user, product=self.scarf, quantity=5)  # More than the 2 in stock
+
+        response = self.client.post('/api/wishlist/move-to-cart/', {'product_ids': [self.scarf.id, self.gloves.id]}, format='json')
+        self.assertEqual(response.json(), {'requested': 2, 'moved': 1, 'out_of_stock': 1})
+        self.assertEqual(self.cart(), {self.scarf.id: 2})
+        self.assertEqual(self.wishlist(), {self.hat.id, self.gloves.id})
+
+        response = self.client.post('/api/wishlist/move-to-cart/', format='json')
+        self.assertEqual(response.json(), {'requested': 2, 'moved': 1, 'out_of_stock': 1})
+        self.assertEqual(self.cart(), {self.scarf.id: 2, self.hat.id: 1})
+        self.assertEqual(self.wishlist(), {self.gloves.id})  # Out of stock: stays on the wishlist
+
+    def test_move_cart_to_wishlist(self):
+        Wishlist.objects.create(user=self.user, product=self.hat)
+        Cart.objects.bulk_create([
+            Cart(user=self.user, product=self.hat, quantity=1),
+            Cart(user=self.user, product=self.scarf, quantity=2),
+            Cart(user=self.user, product=self.gloves, quantity=1),
+            Cart(user=self.user, product=None, quantity=1),  # Its product was deleted
+        ])
+
+        response = self.client.post('/api/cart/move-to-wishlist/', {'product_ids': [self.gloves.id]}, format='json')
+        self.assertEqual(response.json(), {'moved': 1, 'added_to_wishlist': 1, 'already_in_wishlist': 0})
+
+        response = self.client.post('/api/cart/move-to-wishlist/', format='json')
+        self.assertEqual(response.json(), {'moved': 2, 'added_to_wishlist': 1, 'already_in_wishlist': 1})
+        self.assertEqual(self.wishlist(), {self.hat.id, self.scarf.id, self.gloves.id})
+        self.assertEqual(self.cart(), {None: 1})
+
+    def test_empty_selection(self):
+        Wishlist.objects.create(user=self.user, product=self.hat)
+        Cart.objects.create(user=self.user, product=self.scarf, quantity=1)
+        for url in ('/api/wishlist/move-to-cart/', '/api/cart/move-to-wishlist/'):
+            response = self.client.post(url, {'product_ids': []}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('product_ids', response.json())
+        # Called directly, an empty selection moves nothing
+        self.assertEqual(wishlist_to_cart(self.user, []), {'requested': 0, 'moved': 0, 'out_of_stock': 0})
+        self.assertEqual(cart_to_wishlist(self.user, []), {'moved': 0, 'added_to_wishlist': 0, 'already_in_wishlist': 0})
+        self.assertEqual((self.cart(), self.wishlist()), ({self.scarf.id: 1}, {self.hat.id}))
+
+
+class RenderingTests(SimpleTestCase):
+    def test_orjson_matches_drf_output(self):
+        data = {
+            'price': Decimal('19.90'),
+            'created_at': datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+            'name': 'Caf\u00e9 \u2028',
+            'items': [{'id': 1, 'quantity': 2}],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @override_settings(COMPRESSION_MIN_SIZE=100)
+    def test_compression_threshold_and_negotiation(self):
+        body = b'{"id": 1}' * 100
+        middleware = CompressionMiddleware(lambda request: HttpResponse(body, content_type='application/json'))
+        factory = RequestFactory()
+
+        response = middleware(factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        self.assertFalse(middleware(factory.get('/')).has_header('Content-Encoding'))
+        small = CompressionMiddleware(lambda request: HttpResponse(b'{}'))
+        self.assertFalse(small(factory.get('/', HTTP_ACCEPT_ENCODING='gzip')).has_header('Content-Encoding'))
+
+
+class CompiledSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='compiled@example.com', password=None)
+        shirt = Product.objects.create(name='Shirt', price='19.90', stock=3, image_url='https://cdn.example.com/1.jpg', product_size='M')
+        mug = Product.objects.create(name='Mug \u2603', price='5', stock=0)
+        Cart.objects.create(user=cls.user, product=shirt, quantity=2)
+        Cart.objects.create(user=cls.user, product=None)  # Orphaned line: DRF drops the product fields
+        Wishlist.objects.create(user=cls.user, product=mug)
+        order = Order.objects.create(user=cls.user)
+        Payment.objects.create(user=cls.user, order=order, amount='24.90', status=Payment.STATUS_COMPLETED)
+        Payment.objects.create(user=cls.user, order=None, amount='1.5')
+
+    def assertParity(self, serializer_class, queryset):
+        self.assertEqual(compiled(serializer_class).serialize(queryset), serializer_class(queryset, many=True).data)
+
+    def test_product_parity(self):
+        self.assertParity(ProductSerializer, Product.objects.order_by('id'))
+
+    def test_cart_parity(self):
+        self.assertParity(CartSerializer, Cart.objects.order_by('id'))
+
+    def test_wishlist_parity(self):
+        self.assertParity(WishlistSerializer, Wishlist.objects.order_by('id'))
+
+    def test_payment_parity(self):
+        self.assertParity(PaymentSerializer, Payment.objects.order_by('id'))
+
+    def test_instance_only_fields_are_refused(self):
+        class Summary(serializers.ModelSerializer):
+            label = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Product
+                fields = ['id', 'label']
+
+        with self.assertRaises(ImproperlyConfigured):
+            compiled(Summary)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='etag@example.com', password=None)
+        cls.product = Product.objects.create(name='Shirt', price='19.90', stock=3)
+        Cart.objects.create(user=cls.user, product=cls.product)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_cart_is_not_modified_after_one_query(self):
+        etag = self.client.get('/api/cart/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cart/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cart_write_changes_etag(self):
+        etag = self.client.get('/api/cart/')['ETag']
+        Cart.objects.filter(user=self.user).first().delete()
+        self.assertEqual(self.client.get('/api/cart/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_price_change_invalidates_carts_but_stock_change_does_not(self):
+        etag = self.client.get('/api/cart/')['ETag']
+        self.product.stock = 2
+        self.product.save()
+        self.assertEqual(self.client.get('/api/cart/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.product.price = '17.50'
+        self.product.save()
+        self.assertEqual(self.client.get('/api/cart/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_raw_sql_transfer_bumps_stamps(self):
+        Wishlist.objects.create(user=self.user, product=Product.objects.create(name='Mug', price='5', stock=1))
+        before = ChangeStamp.current(self.user.id, 'wishlist')
+        wishlist_to_cart(self.user)
+        self.assertEqual(ChangeStamp.current(self.user.id, 'wishlist'), before + 1)
+
+    def test_order_detail(self):
+        order = Order.objects.create(user=self.user)
+        self.assertEqual(self.revalidate(f'/api/orders/{order.id}/').status_code, 304)
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'Admin', '0900', 'Somewhere', 'pw')
+        cls.product = Product.objects.create(name='Shirt', price='19.90', stock=3)
+
+    def changelist_queries(self, url):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for model_url in ('cart', 'wishlist', 'order', 'payment'):
+            with self.subTest(model_url):
+                url = f'/admin/store/{model_url}/'
+                self.create_rows(1)
+                before = self.changelist_queries(url)
+                self.create_rows(5)
+                self.assertEqual(self.changelist_queries(url), before)
+
+    def create_rows(self, count):
+        for _ in range(count):
+            user = User.objects.create_customer(email=f'row{User.objects.count()}@example.com', password=None)
+            order = Order.objects.create(user=user)
+            Cart.objects.create(user=user, product=self.product)
+            Wishlist.objects.create(user=user, product=self.product)
+            Payment.objects.create(user=user, order=order, amount='1.00')
+
+    def test_exact_search_skips_fields_the_term_cannot_match(self):
+        order_admin = site._registry[Order]
+        by_id, _ = order_admin.get_search_results(None, Order.objects.all(), '42')
+        self.assertNotIn('email', str(by_id.query))
+        by_email, _ = order_admin.get_search_results(None, Order.objects.all(), 'row1@example.com')
+        self.assertNotIn('UPPER', str(by_email.query))
+
+
+class CartReaperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gone = User.objects.create_customer(email='gone@example.com', password=None)
+        cls.back = User.objects.create_customer(email='back@example.com', password=None)
+        products = [Product.objects.create(name=f'P{i}', price='5.00', stock=9) for i in range(3)]
+        old = datetime.now(timezone.utc) - timedelta(days=90)
+        for product in products:
+            Cart.objects.create(user=cls.gone, product=product)
+        Cart.objects.create(user=cls.back, product=products[0])
+        Cart.objects.update(updated_at=old, added_at=old)
+        Cart.objects.create(user=cls.back, product=products[1])  # One recent line keeps the whole cart
+        cls.cutoff = datetime.now(timezone.utc) - timedelta(days=30)
+
+    def test_reaps_only_carts_idle_past_the_ttl_in_batches(self):
+        before = ChangeStamp.current(self.gone.id, 'cart')
+        stats = reaper.reap(self.cutoff, batch_size=2, sleep=0)
+        self.assertEqual((stats['rows'], stats['batches']), (3, 2))
+        self.assertFalse(Cart.objects.filter(user=self.gone).exists())
+        self.assertEqual(Cart.objects.filter(user=self.back).count(), 2)
+        self.assertGreater(ChangeStamp.current(self.gone.id, 'cart'), before)
+        self.assertIn('cart_reaper_rows_deleted_total', metrics.job_counters())
+
+    def test_dry_run_exports_without_deleting(self):
+        rows = []
+        writer = type('Writer', (), {'writerows': lambda self, batch: rows.extend(batch)})()
+        stats = reaper.reap(self.cutoff, sleep=0, writer=writer, dry_run=True)
+        self.assertEqual(stats['exported'], 3)
+        self.assertEqual({row[2] for row in rows}, {'gone@example.com'})
+        self.assertEqual(Cart.objects.count(), 5)
+
+
+class GuestCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shirt = Product.objects.create(name='Shirt', price='19.90', stock=3)
+        cls.mug = Product.objects.create(name='Mug', price='5.00', stock=10)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_guest_cart_writes_nothing_until_login_merges_it(self):
+        user = User.objects.create_customer(email='guest@example.com', password='pw-12345')
+        Cart.objects.create(user=user, product=self.shirt, quantity=2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/guest-cart/', {'product_id': self.shirt.id, 'quantity': 2}, format='json')
+            self.client.post('/api/guest-cart/', {'product_id': self.mug.id}, format='json')
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in queries.captured_queries))
+        self.assertEqual(len(self.client.get('/api/guest-cart/').json()), 2)
+
+        response = self.client.post('/api/login/', {'username': 'guest@example.com', 'password': 'pw-12345'}, format='json')
+        self.assertEqual(response.json()['merged_cart_items'], 2)
+        quantities = dict(Cart.objects.filter(user=user).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.shirt.id: 3, self.mug.id: 1})  # 2 + 2 capped at stock
+        self.assertEqual(self.client.get('/api/guest-cart/').json(), {'message': 'Your cart is empty'})
+
+    def test_registration_merges_and_tampered_cookie_is_ignored(self):
+        self.client.post('/api/guest-cart/', {'product_id': self.mug.id, 'quantity': 4}, format='json')
+        self.client.post('/api/register/', {'email': 'new@example.com', 'password': 'pw-12345'}, format='json')
+        self.assertEqual(Cart.objects.get(user__email='new@example.com').quantity, 4)
+
+        self.client.cookies['guest_cart'] = f'{self.mug.id}:9'
+        self.assertEqual(self.client.get('/api/guest-cart/').json(), {'message': 'Your cart is empty'})
+
+
+
+@override_settings(CART_STORAGE='store.cart_storage.CacheCartStorage', CART_FLUSH_INTERVAL=0)
+class CacheCartStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='cached@example.com', password=None)
+        cls.shirt = Product.objects.create(name='Shirt', price='19.90', stock=3)
+        cls.mug = Product.objects.create(name='Mug', price='5.00', stock=10)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_writes_are_coalesced_until_the_cart_is_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.client.post('/api/cart/', {'product_id': self.mug.id}, format='json')
+        self.assertFalse([q for q in queries.captured_queries if not q['sql'].startswith('SELECT')])
+        self.assertFalse(Cart.objects.exists())
+
+        lines = self.client.get('/api/cart/').json()
+        self.assertEqual([line['quantity'] for line in lines], [3])
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 3)
+
+    def test_dirty_carts_survive_a_restarted_process_and_cache_loss_reverts(self):
+        cart_storage.get_storage().add(self.user.id, self.shirt.id, 2)
+        self.assertEqual(cart_storage.get_storage().flush_due(), 1)  # A fresh instance, as in another process
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 2)
+
+        cart_storage.get_storage().add(self.user.id, self.shirt.id, 1)
+        cache.clear()
+        self.assertEqual(cart_storage.get_storage().flush_due(), 0)
+        self.assertEqual(self.client.get('/api/cart/').json()[0]['quantity'], 2)
+
+    def test_stock_limit_and_checkout_reads_pending_changes(self):
+        self.assertEqual(self.client.post('/api/cart/', {'product_id': self.shirt.id}, format='json').status_code, 201)
+        for _ in range(2):
+            self.client.post('/api/cart/', {'product_id': self.shirt.id}, format='json')
+        self.assertEqual(self.client.post('/api/cart/', {'product_id': self.shirt.id}, format='json').status_code, 400)
+        # Checkout reads the cart through views.user_cart, which flushes first
+        from store.views import user_cart
+        self.assertEqual(list(user_cart(self.user).values_list('quantity', flat=True)), [3])
+
+    def test_edits_through_the_viewset_survive_the_next_flush(self):
+        storage = cart_storage.get_storage()
+        storage.add(self.user.id, self.mug.id, 1)
+        storage.flush(self.user.id)
+        storage.add(self.user.id, self.mug.id, 1)  # Cached quantity 2, not yet written
+        line = Cart.objects.get(user=self.user)
+        response = self.client.patch(f'/api/cart/{line.id}/', {'quantity': 7}, format='json')
+        self.assertEqual(response.status_code, 200)
+        storage.flush(self.user.id)
+        self.assertEqual(Cart.objects.get(user=self.user).quantity, 7)
+
+    def test_cart_add_rejects_bad_quantities(self):
+        # Called directly: the router's cart/<pk>/ route shadows /api/cart/add/
+        def add(quantity):
+            request = APIRequestFactory().post('/api/cart/add/', {'product_id': self.mug.id, 'quantity': quantity}, format='json')
+            force_authenticate(request, self.user)
+            return CartAddView.as_view()(request).status_code
+
+        for quantity in (0, -2, '3', 1.5, None):
+            self.assertEqual(add(quantity), 400, quantity)
+        self.assertEqual(add(2), 201)
+        self.assertEqual(self.client.get('/api/cart/').json()[0]['quantity'], 2)
+
+
+
+class PromotionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='promo@example.com', password=None)
+        cls.shirt = Product.objects.create(name='Shirt', price='20.00', stock=50, product_size='XL')
+        cls.mug = Product.objects.create(name='Mug', price='5.00', stock=50, product_size=None)
+        cls.cap = Product.objects.create(name='Cap', price='10.00', stock=50, product_size='M')
+        Promotion.objects.create(name='10% off mugs', kind=Promotion.PERCENT_OFF, percent=10).products.add(cls.mug)
+        Promotion.objects.create(name='Mug 2+1', kind=Promotion.BUY_X_GET_Y, buy_quantity=2, free_quantity=1).products.add(cls.mug)
+        Promotion.objects.create(name='XL week', kind=Promotion.PERCENT_OFF, percent=25, sizes='XL,XXL')
+        Promotion.objects.create(name='50 off 100', kind=Promotion.CART_THRESHOLD, min_subtotal=100, amount=50)
+        Promotion.objects.create(name='Future', kind=Promotion.PERCENT_OFF, percent=90,
+                                 starts_at=datetime.now(timezone.utc) + timedelta(days=1))
+
+    def test_best_line_deal_then_threshold_spread_over_lines(self):
+        quote = promotions.price_cart([(self.mug, 3), (self.shirt, 4), (self.cap, 1)])
+        mug, shirt, cap = quote.lines
+        self.assertEqual(mug.discount, Decimal('5.00'))  # 2+1 beats 10% (1.50)
+        self.assertEqual(shirt.discount, Decimal('20.00'))  # 25% for XL; 60 + 10 + 10 stays under 100
+        self.assertEqual(cap.discount, 0)
+        self.assertEqual((quote.subtotal, quote.total, quote.cart_promotion_id), (Decimal('105.00'), Decimal('80.00'), None))
+
+        quote = promotions.price_cart([(self.shirt, 6), (self.cap, 2)])  # 90 + 20 after the XL deal
+        self.assertEqual(quote.total, Decimal('60.00'))
+        self.assertEqual(sum(line.total for line in quote.lines), quote.total)
+
+    def test_checkout_charges_the_quote_and_saved_rules_apply_at_once(self):
+        for product, quantity in ((self.mug, 3), (self.cap, 1)):
+            Cart.objects.create(user=self.user, product=product, quantity=quantity)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/cart/quote/').json()['total'], 20.0)
+        response = client.post('/api/orders/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(id=response.json()['id'])
+        self.assertEqual(order.total_price, Decimal('20.00'))
+        self.assertEqual(sorted(order.order_items.values_list('discount', flat=True)), [Decimal('0'), Decimal('5.00')])
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+        Promotion.objects.create(name='Caps half off', kind=Promotion.PERCENT_OFF, percent=50).products.add(self.cap)
+        Cart.objects.create(user=self.user, product=self.cap, quantity=2)
+        self.assertEqual(client.post('/api/place-order/', {}, format='json').json()['total_price'], 10.0)
+
+    def test_incomplete_rules_are_rejected_and_old_ones_skipped(self):
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            Promotion.objects.create(name='No rate', kind=Promotion.PERCENT_OFF)
+        draft = Promotion.objects.create(name='Draft', kind=Promotion.PERCENT_OFF, is_active=False)
+        draft.products.add(self.cap)
+        # A row saved before the constraints existed
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA ignore_check_constraints = ON')
+            else:
+                cursor.execute(f'ALTER TABLE {Promotion._meta.db_table} DROP CONSTRAINT promotion_percent_off_rate')
+            try:
+                Promotion.objects.filter(pk=draft.pk).update(is_active=True)
+            finally:
+                if connection.vendor == 'sqlite':
+                    cursor.execute('PRAGMA ignore_check_constraints = OFF')
+        self.assertEqual(list(promotions.compile_index().candidates(self.cap)), [])
+        Cart.objects.create(user=self.user, product=self.cap, quantity=2)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.post('/api/place-order/', {}, format='json').json()['total_price'], 20.0)
+
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='facets@example.com', password=None)
+        cls.tee = Product.objects.create(name='Tee', price='300.00', stock=0)
+        cls.hoodie = Product.objects.create(name='Hoodie', price='1200.00', stock=0)
+        cls.mug = Product.objects.create(name='Mug', price='150.00', stock=4)  # No variants
+        ProductVariant.objects.create(product=cls.tee, size=' m', color='black', stock=3)  # Saved as 'M'
+        ProductVariant.objects.create(product=cls.tee, size='L', color='black', stock=0)
+        ProductVariant.objects.create(product=cls.hoodie, size='L', color='grey', stock=0)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_page_and_facets_for_filters(self):
+        body = self.client.get('/api/products/browse/').json()
+        self.assertEqual(body['count'], 3)
+        self.assertEqual(body['facets'], {'sizes': {'L': 2, 'M': 1}, 'price': {'0-500': 2, '1000-2500': 1}, 'in_stock': 2})
+        self.assertEqual([v['size'] for v in body['results'][0]['variants']], ['L', 'M'])
+
+        # Size and stock have to hold for the same variant: Tee's M is in stock but its L isn't
+        body = self.client.get('/api/products/browse/?size=l&in_stock=1').json()
+        self.assertEqual((body['count'], body['results']), (0, []))
+        body = self.client.get('/api/products/browse/?size=m,l&in_stock=1').json()
+        self.assertEqual([p['name'] for p in body['results']], ['Tee'])  # Hoodie's only L is sold out
+        self.assertEqual(body['facets']['sizes'], {'L': 1, 'M': 1})
+        body = self.client.get('/api/products/browse/?size=l').json()
+        self.assertEqual(body['count'], 2)
+        self.assertEqual((body['facets']['sizes'], body['facets']['in_stock']), ({'L': 2, 'M': 1}, 0))
+        self.assertEqual(self.client.get('/api/products/browse/?max_price=abc').status_code, 400)
+
+    def test_counts_are_one_query_and_cached_by_signature(self):
+        filters = facets.parse_filters(QueryDict('size=M,L&min_price=100'))
+        with CaptureQueriesContext(connection) as queries:
+            counts = facets.cached_facet_counts(filters)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual(facets.signature(filters), facets.signature(facets.parse_filters(QueryDict('size=l&size=m&min_price=100'))))
+        with self.assertNumQueries(0):
+            facets.cached_facet_counts(filters)
+
+
+
+class SignedTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='bearer@example.com', password='pass12345')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.pair = self.client.post('/api/login/', {'username': 'bearer@example.com', 'password': 'pass12345'}, format='json').json()
+
+    def bearer(self, token):
+        return RequestFactory().get('/api/cart/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_access_token_is_verified_without_queries(self):
+        tokens.denylist.sync(force=True)
+        with self.assertNumQueries(0):
+            user, claims = SignedTokenAuthentication().authenticate(self.bearer(self.pair['access']))
+        self.assertEqual((user.pk, user.is_staff), (self.user.pk, False))
+        self.assertEqual(user.email, 'bearer@example.com')  # Deferred field, loaded on access
+
+        payload, signature = self.pair['access'].split('.')
+        forged = tokens.b64encode(orjson.dumps({**claims, 's': True})).decode() + '.' + signature
+        with self.assertRaises(AuthenticationFailed):
+            SignedTokenAuthentication().authenticate(self.bearer(forged))
+        with override_settings(ACCESS_TOKEN_LIFETIME=-1), self.assertRaisesMessage(AuthenticationFailed, 'expired'):
+            SignedTokenAuthentication().authenticate(self.bearer(tokens.encode_access(self.user)))
+
+    def test_refresh_rotates_and_reuse_revokes_everything(self):
+        fresh = self.client.post('/api/token/refresh/', {'refresh': self.pair['refresh']}, format='json').json()
+        self.assertNotEqual(fresh['refresh'], self.pair['refresh'])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {fresh['access']}")
+        self.assertEqual(self.client.get('/api/cart/').status_code, 200)
+
+        replay = self.client.post('/api/token/refresh/', {'refresh': self.pair['refresh']}, format='json')
+        self.assertEqual(replay.status_code, 401)
+        self.assertEqual(self.client.get('/api/cart/').status_code, 401)
+        self.assertFalse(self.user.refresh_tokens.exists())
+
+    def test_logout_revocation_reaches_other_processes_on_sync(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.pair['access']}")
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/cart/').status_code, 401)
+
+        elsewhere = tokens.Denylist()  # Another process: sees the row on its next sync
+        elsewhere.sync()
+        claims = orjson.loads(tokens.b64decode(self.pair['access'].split('.')[0].encode()))
+        self.assertTrue(elsewhere.revoked(claims))
+        self.assertFalse(elsewhere.revoked({**claims, 'i': claims['i'] + 60_000}))  # Issued after logout
+
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='outbox@example.com', password=None)
+        cls.admin = User.objects.create_customer(email='outbox-admin@example.com', password=None)
+        User.objects.filter(pk=cls.admin.pk).update(is_staff=True)
+        cls.admin.is_staff = True
+        cls.product = Product.objects.create(name='Shirt', price='20.00', stock=5)
+
+    def topics(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('topic', 'event'))
+
+    def test_writes_and_their_events_commit_together(self):
+        Cart.objects.create(user=self.user, product=self.product, quantity=2)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.post('/api/place-order/', {}, format='json').status_code, 201)
+        self.assertEqual(self.topics(), [('product', 'created'), ('order', 'created'), ('order_item', 'created')])
+        self.assertEqual(OutboxEvent.objects.get(topic='order').payload['total_price'], '40.00')
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.product.price = Decimal('15.00')
+            self.product.save()
+            raise RuntimeError
+        self.assertEqual(len(self.topics()), 3)  # Rolled back with the change
+
+    def test_relay_delivers_in_order_and_resends_after_a_failed_batch(self):
+        Payment.objects.create(user=self.user, amount='20.00')
+        OutboxEvent.objects.bulk_create(OutboxEvent(topic='bench', object_id=i, event='created', payload={'id': i}) for i in range(10_000))
+
+        class Broken:
+            def send(self, events):
+                raise ConnectionError
+        self.assertEqual(outbox.sequence(), 5000)
+        with self.assertRaises(ConnectionError):
+            outbox.deliver('broken', Broken())
+        self.assertEqual(OutboxCursor.objects.get(name='sink:broken').position, 0)
+
+        sink = outbox.QueueSink('test-relay')
+        sequenced, delivered = outbox.relay({'queue': sink}, batch_size=2000)
+        self.assertEqual((sequenced, delivered), (10_002 - 5000, {'queue': 10_002}))
+        events = [sink.queue.get_nowait() for _ in range(10_002)]
+        self.assertEqual([event['position'] for event in events], list(range(1, 10_003)))
+        self.assertEqual(events[0]['topic'], 'product')
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        page = client.get('/api/events/?after=1&limit=2&topic=payment,product').json()
+        self.assertEqual(([e['topic'] for e in page['events']], page['cursor']), (['payment'], 2))
+
+    def test_cascades_and_queryset_deletes_are_recorded(self):
+        buyer = User.objects.create_customer(email='outbox-buyer@example.com', password=None)
+        mug = Product.objects.create(name='Mug', price='5.00', stock=5)
+        order = Order.objects.create(user=buyer)
+        shirt_item = OrderItem.objects.create(order=order, product=self.product, quantity=1)
+        mug_item = OrderItem.objects.create(order=order, product=mug, quantity=1)
+        payment = Payment.objects.create(user=buyer, order=order, amount='25.00')
+        OutboxEvent.objects.all().delete()
+
+        def events():
+            return {(e.topic, e.object_id, e.event, e.payload.get('product_id', '-'))
+                    for e in OutboxEvent.objects.all()}
+
+        # SET_NULL on the product's order items is an UPDATE without save(): recorded as updates
+        Product.objects.filter(pk=mug.pk).delete()
+        self.assertEqual(events(), {('product', mug.pk, 'deleted', '-'), ('order_item', mug_item.pk, 'updated', None)})
+
+        OutboxEvent.objects.all().delete()
+        buyer.delete()  # Cascades to the order, its items and the payment
+        self.assertEqual(events(), {
+            ('order', order.pk, 'deleted', '-'), ('order_item', shirt_item.pk, 'deleted', '-'),
+            ('order_item', mug_item.pk, 'deleted', '-'), ('payment', payment.pk, 'deleted', '-'),
+        })
+
+        OutboxEvent.objects.all().delete()
+        product_id = self.product.pk
+        self.product.delete()
+        self.assertEqual(list(OutboxEvent.objects.values_list('topic', 'object_id', 'event')), [('product', product_id, 'deleted')])
+
+
+
+class OrderStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='status@example.com', password=None)
+        cls.staff = User.objects.create_customer(email='status-staff@example.com', password=None)
+        User.objects.filter(pk=cls.staff.pk).update(is_staff=True)
+        cls.staff.is_staff = True
+
+    def setUp(self):
+        self.order = Order.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_payments_and_staff_move_the_order_along(self):
+        self.assertEqual(self.client.post('/api/payments/', {'order_id': self.order.id, 'amount': '10.00'}, format='json').status_code, 201)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_PAID)
+        event = OutboxEvent.objects.get(event=OutboxEvent.STATUS_CHANGED)
+        self.assertEqual((event.payload['previous'], event.payload['status']), ('pending', 'paid'))
+
+        url = f'/api/orders/{self.order.id}/status/'
+        self.assertEqual(self.client.post(url, {'status': 'cancelled'}, format='json').status_code, 403)  # No longer pending
+        staff = APIClient()
+        staff.force_authenticate(self.staff)
+        self.assertEqual(staff.post(url, {'status': 'shipped'}, format='json').json()['status'], 'shipped')
+        self.assertEqual(staff.post(url, {'status': 'paid'}, format='json').status_code, 409)
+
+        payment = Payment.objects.get(order_id=self.order.id)
+        payment.status = Payment.STATUS_REFUNDED
+        payment.save()  # Too late to cancel a shipped order
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.STATUS_SHIPPED)
+
+    def test_concurrent_moves_cannot_both_win(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.order.transition(Order.STATUS_CANCELLED)
+        with self.assertRaisesMessage(ValidationError, 'changed meanwhile'):
+            stale.transition(Order.STATUS_PAID)
+
+
+class OrderEventStreamTests(TransactionTestCase):
+    # Real commits: the feeder reads the outbox from another thread's connection
+    @override_settings(ORDER_EVENTS_POLL_SECONDS=0.01)
+    async def test_status_changes_are_pushed_and_replayed(self):
+        user = await sync_to_async(User.objects.create_customer)(email='sse@example.com', password=None)
+        order = await sync_to_async(Order.objects.create)(user=user)
+        headers = {'Authorization': f'Bearer {tokens.encode_access(user)}'}
+        self.assertEqual((await self.async_client.get('/api/order-events/')).status_code, 401)
+
+        response = await self.async_client.get('/api/order-events/', headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))  # Subscribed from here on
+        await sync_to_async(order.transition)(Order.STATUS_PAID)
+        pushed = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertIn('event: order_status', pushed)
+        self.assertIn('"status":"paid"', pushed)
+        await self.disconnect(stream)
+        self.assertFalse(order_events.broker.subscribers)
+
+        response = await self.async_client.get('/api/order-events/', headers={**headers, 'Last-Event-ID': '0'})
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        self.assertEqual((await anext(stream)).decode(), pushed)  # Missed while disconnected
+        await self.disconnect(stream)
+        await asyncio.wait_for(order_events.broker.feeder, 5)  # Stops with the last subscriber
+
+    async def disconnect(self, stream):
+        # What the ASGI handler does when the client goes away: cancel the pending read
+        read = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        read.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await read
+
+
+class BenchmarkTests(TestCase):
+    def test_suite_runs_and_compare_flags_regressions(self):
+        report = benchmarks.run(repeat=1, sizes=(1,))
+        self.assertEqual(report['vendor'], connection.vendor)
+        self.assertIn('CartSerializer[1]', report['results'])
+        self.assertIn('checkout.PlaceOrderView', report['results'])
+        self.assertFalse(Order.objects.exists())  # Everything seeded is rolled back
+
+        baseline = {'results': {name: dict(result) for name, result in report['results'].items()}}
+        del baseline['results']['OrderItem.save']
+        baseline['results']['CartSerializer[1]']['median_us'] /= 2
+        baseline['results']['checkout.create_order']['queries'] -= 1
+        problems = {name: problems for name, _, _, problems in benchmarks.compare(baseline, report, threshold=0.5)}
+        self.assertEqual(problems['OrderItem.save'], ['new'])
+        self.assertEqual(problems['CartSerializer[1]'], ['slower'])
+        self.assertEqual(problems['checkout.create_order'], ['more queries'])
+        self.assertEqual(problems['OrderSerializer[1]'], [])
+
+
+@override_settings(SLOW_QUERY_MS=0.0001, SLOW_QUERY_EXPLAIN_RATE=1)
+class SlowQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_customer(email='slowq@example.com', password='pw12345!')
+        cls.admin = User.objects.create_customer(email='slowq-admin@example.com', password='pw12345!')
+        User.objects.filter(pk=cls.admin.pk).update(is_staff=True)
+        cls.admin.is_staff = True
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint_ignores_literals_and_list_lengths(self):
+        self.assertEqual(slow_queries.fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'a'"),
+                         slow_queries.fingerprint("SELECT * FROM t WHERE id IN (%s)  AND name = 'b'"))
+        self.assertNotEqual(slow_queries.fingerprint('SELECT a FROM t'), slow_queries.fingerprint('SELECT b FROM t'))
+
+    def test_requests_record_view_stack_and_plan(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for _ in range(2):
+            self.assertEqual(client.get('/api/orders/').status_code, 200)
+
+        entries = slow_queries.get_log().entries()
+        orders = next(entry for entry in entries if 'store_order' in entry['sql'] and entry['sql'].startswith('SELECT'))
+        self.assertEqual(orders['count'], 2)  # Same statement, one fingerprint
+        self.assertIn('GET order-list', orders['views'])
+        self.assertTrue(orders['plan'])
+        self.assertTrue(any(frame.startswith('store/') for frame in orders['stack']))
+
+        client.force_authenticate(self.admin)
+        response = client.get('/api/slow-queries/')
+        self.assertIn(orders['fingerprint'], {entry['fingerprint'] for entry in response.json()['queries']})
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/slow-queries/').status_code, 403)
+
+    def test_plans_keep_no_parameter_values(self):
+        plan = slow_queries.scrub_plan(
+            "Index Scan using store_user_email_key on store_user  (cost=0.29..8.30 rows=1 width=8) (actual time=0.01..0.02 rows=1 loops=1)\n"
+            "  Index Cond: ((email)::text = 'it''s-secret@example.com'::text)\n"
+            "  Filter: ((id > 41) AND (full_name <> ''))\n"
+            "  Rows Removed by Filter: 3"
+        )
+        self.assertNotIn('secret', plan)
+        self.assertIn('Index Cond: ((email)::text = ?::text)', plan)
+        self.assertIn('Filter: ((id > ?) AND (full_name <> ?))', plan)
+        self.assertIn('(cost=0.29..8.30 rows=1 width=8)', plan)
+        self.assertIn('Rows Removed by Filter: 3', plan)
+
+        with slow_queries.recording('test', threshold_ms=0):
+            User.objects.filter(email='token-4f2a9c@example.com').exists()
+        entry, = [entry for entry in slow_queries.get_log().entries() if 'email' in entry['sql']]
+        self.assertTrue(entry['plan'])
+        self.assertNotIn('4f2a9c', repr(entry))
+
+    @override_settings(SLOW_QUERY_MAX_ENTRIES=2)
+    def test_log_keeps_the_most_recent_fingerprints(self):
+        log = slow_queries.get_log()
+        for column in 'abc':
+            log.record(f'SELECT {column} FROM t', 0.5, '-', [])
+        self.assertEqual({entry['sql'] for entry in log.entries()}, {'SELECT b FROM t', 'SELECT c FROM t'})
+
+
+class UserDirectoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_customer(email='directory-admin@example.com', password='pw12345!')
+        User.objects.filter(pk=cls.admin.pk).update(is_staff=True)
+        cls.admin.is_staff = True
+        for i, name in enumerate(['Maria Santos', 'Jose Reyes', 'Mariano Cruz', 'Ana Bautista']):
+            User.objects.create_customer(email=f'{name.split()[0].lower()}{i}@example.com', full_name=name,
+                                         cellphone_number=f'0917000000{i}')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_pages_by_id_with_count(self):
+        first = self.client.get('/api/users/', {'limit': 3}).json()
+        self.assertEqual((first['count'], first['count_estimated'], len(first['results'])), (5, False, 3))
+        rest = self.client.get('/api/users/', {'limit': 3, 'after': first['next']}).json()
+        self.assertEqual(len(rest['results']), 2)
+        self.assertIsNone(rest['next'])
+        ids = [user['id'] for user in first['results'] + rest['results']]
+        self.assertEqual(ids, sorted(User.objects.values_list('id', flat=True)))
+
+    def test_prefix_and_contains_search(self):
+        names = lambda params: sorted(user['full_name'] for user in self.client.get('/api/users/', params).json()['results'])
+        self.assertEqual(names({'q': 'mari'}), ['Maria Santos', 'Mariano Cruz'])
+        self.assertEqual(names({'q': '09170000003'}), ['Ana Bautista'])
+        self.assertEqual(names({'q': 'reyes', 'match': 'contains'}), ['Jose Reyes'])
+        self.assertEqual(names({'q': 'reyes'}), [])
+        self.assertEqual(self.client.get('/api/users/', {'q': 're', 'match': 'contains'}).status_code, 400)
+
+    def test_customers_cannot_list(self):
+        self.client.force_authenticate(User.objects.get(full_name='Ana Bautista'))
+        self.assertEqual(self.client.get('/api/users/').status_code, 403)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Partitioning is PostgreSQL only')
+class PartitionPruningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Rolled back with the class transaction, like the rows below
+        for model in partitions.PARTITIONED_MODELS:
+            partitions.convert_to_partitioned(model)
+        partitions.ensure_partitions(since=datetime.now(timezone.utc) - timedelta(days=600))
+        cls.user = User.objects.create_customer(email='history@example.com', password=None)
+        product = Product.objects.create(name='Shirt', price='19.90', stock=3)
+        this_month = partitions.month_start(datetime.now(timezone.utc))
+        cls.orders = {}
+        for months_ago in (18, 6, 5, 0):
+            order = Order.objects.create(user=cls.user)
+            created = partitions.add_months(this_month, -months_ago) + timedelta(days=1, hours=months_ago)
+            if months_ago:
+                Order.objects.filter(pk=order.pk).update(created_at=created)
+                order.refresh_from_db()
+            OrderItem.objects.create(order=order, product=product, quantity=1)
+            cls.orders[months_ago] = order
+        partitions.refresh_bounds()
+
+    def scanned(self, queryset):
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        return set(re.findall(rf'\b{table}_p\d{{4}}_\d{{2}}\b', plan))  # Partitions, not their indexes
+
+    def test_detail_lookup_touches_its_month_and_the_current_one(self):
+        order = self.orders[6]
+        scanned = self.scanned(partitions.prune(Order.objects.filter(user=self.user, id=order.id), order.id))
+        expected = {partitions.partition_name('store_order', partitions.month_start(d))
+                    for d in (order.created_at, datetime.now(timezone.utc))}
+        self.assertEqual(scanned, expected)
+
+    def test_order_items_follow_their_order(self):
+        order = self.orders[18]
+        scanned = self.scanned(partitions.prune(OrderItem.objects.filter(order_id=order.id), order.id))
+        self.assertIn(partitions.partition_name('store_orderitem', partitions.month_start(order.created_at)), scanned)
+        self.assertLessEqual(len(scanned), 2)
+
+    def test_history_window_skips_old_partitions(self):
+        since = datetime.now(timezone.utc) - timedelta(days=365)
+        scanned = self.scanned(Order.objects.filter(user=self.user, created_at__gte=since))
+        self.assertNotIn(partitions.partition_name('store_order', partitions.month_start(self.orders[18].created_at)), scanned)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        ids = {row['id'] for row in client.get('/api/orders/').json()}
+        self.assertEqual(ids, {self.orders[m].id for m in (6, 5, 0)})
+        ids = {row['id'] for row in client.get('/api/orders/', {'since': '2000-01-01'}).json()}
+        self.assertIn(self.orders[18].id, ids)
+
+    def test_stale_bounds_fall_back_to_unpruned_lookup(self):
+        order = self.orders[5]
+        partitions.PartitionBounds.objects.filter(min_id__lte=order.id, max_id__gte=order.id).delete()
+        self.assertEqual(partitions.get_pruned(Order.objects.all(), order.id), order)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(f'/api/orders/{order.id}/').status_code, 200)
@@ -0,0 +1,202 @@
+"""
+Stateless signed access tokens with rotating refresh tokens.
+
+An access token is `<payload>.<signature>`: base64url JSON {"u": user id, "s": is_staff,
+"i": issued at (ms), "e": expiry (s), "j": token id}, signed with HMAC-SHA256 under a
+key derived from SECRET_KEY (or one of SECRET_KEY_FALLBACKS while rotating). Verifying
+one is a hash and a dict lookup, no query; `request.user` is a User with only id and
+is_staff loaded, the other fields are fetched if a view reads them.
+
+Access tokens live ACCESS_TOKEN_LIFETIME seconds. Refresh tokens are random strings
+stored hashed in RefreshToken; each use rotates them, and presenting a rotated one
+again revokes the user's tokens (it was copied). Refreshing re-reads the user, so
+deactivation or a staff change is picked up by the next refresh.
+
+Revocation goes through TokenRevocation. Each process keeps the unexpired rows in
+memory and reloads them every TOKEN_DENYLIST_SYNC_SECONDS, so a revocation made
+elsewhere is honoured within that delay (immediately in the revoking process). Rows
+are only kept until the tokens they cover expire, which keeps the set small.
+"""
+import base64
+import functools
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from datetime import timedelta
+
+import orjson
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import RefreshToken, TokenRevocation, User
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+@functools.cache
+def signing_keys(secrets_):
+    return [hashlib.sha256(b'store.tokens:' + secret.encode()).digest() for secret in secrets_]
+
+
+def keys():
+    """Current key first, then the SECRET_KEY_FALLBACKS ones (still accepted, never used to sign)."""
+    return signing_keys((settings.SECRET_KEY, *settings.SECRET_KEY_FALLBACKS))
+
+
+def sign(payload):
+    return b64encode(hmac.new(keys()[0], payload, hashlib.sha256).digest())
+
+
+def encode_access(user):
+    now = time.time()
+    payload = b64encode(orjson.dumps({
+        'u': user.pk, 's': user.is_staff, 'i': int(now * 1000),
+        'e': int(now) + settings.ACCESS_TOKEN_LIFETIME, 'j': secrets.token_hex(8),
+    }))
+    return (payload + b'.' + sign(payload)).decode()
+
+
+def decode_access(token):
+    """Claims of a valid, unexpired, unrevoked access token; raises AuthenticationFailed otherwise."""
+    payload, _, signature = token.encode().partition(b'.')
+    try:
+        signature = b64decode(signature)
+    except ValueError:
+        raise AuthenticationFailed('Invalid token.')
+    if not any(hmac.compare_digest(hmac.new(key, payload, hashlib.sha256).digest(), signature) for key in keys()):
+        raise AuthenticationFailed('Invalid token.')
+    claims = orjson.loads(b64decode(payload))
+    if claims['e'] <= time.time():
+        raise AuthenticationFailed('Token expired.', code='token_expired')
+    if denylist.revoked(claims):
+        raise AuthenticationFailed('Token revoked.', code='token_revoked')
+    return claims
+
+
+def token_user(claims):
+    """User built from the claims without a query; other fields load on first access."""
+    loaded = {'id': claims['u'], 'is_staff': claims['s'], 'is_active': True}  # Inactive users can't refresh
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]  # from_db wants model order
+    return User.from_db(None, names, [loaded[name] for name in names])
+
+
+class Denylist:
+    """In-process copy of the unexpired TokenRevocation rows."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jtis = frozenset()
+        self.users = {}  # user id -> tokens issued at or before this time (ms) are revoked
+        self.synced_at = None
+
+    def sync(self, force=False):
+        with self.lock:
+            if not force and self.synced_at is not None and time.monotonic() - self.synced_at < settings.TOKEN_DENYLIST_SYNC_SECONDS:
+                return
+            jtis, users = set(), {}
+            rows = TokenRevocation.objects.filter(expires_at__gt=timezone.now()).values_list('user_id', 'jti', 'revoked_at')
+            for user_id, jti, revoked_at in rows:
+                if jti:
+                    jtis.add(jti)
+                else:
+                    users[user_id] = max(users.get(user_id, 0), int(revoked_at.timestamp() * 1000))
+            self.jtis, self.users, self.synced_at = frozenset(jtis), users, time.monotonic()
+
+    def add(self, user_id, jti, revoked_at):
+        with self.lock:
+            if jti:
+                self.jtis = self.jtis | {jti}
+            else:
+                self.users[user_id] = max(self.users.get(user_id, 0), int(revoked_at.timestamp() * 1000))
+
+    def revoked(self, claims):
+        self.sync()
+        return claims['j'] in self.jtis or claims['i'] <= self.users.get(claims['u'], -1)
+
+
+denylist = Denylist()
+
+
+def issue(user, family=None):
+    """A new access token and refresh token for the user."""
+    refresh = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        user=user, token_hash=hashlib.sha256(refresh.encode()).hexdigest(), family=family or secrets.token_hex(16),
+        expires_at=timezone.now() + timedelta(seconds=settings.REFRESH_TOKEN_LIFETIME),
+    )
+    return {'access': encode_access(user), 'refresh': refresh, 'expires_in': settings.ACCESS_TOKEN_LIFETIME}
+
+
+def refresh(raw):
+    """Rotate a refresh token into a new pair; a reused one revokes everything the user holds."""
+    token_hash = hashlib.sha256(raw.encode()).hexdigest()
+    with transaction.atomic():
+        token = RefreshToken.objects.select_for_update().select_related('user').filter(token_hash=token_hash).first()
+        if token is None or token.expires_at <= timezone.now() or not token.user.is_active:
+            raise AuthenticationFailed('Invalid refresh token.')
+        reused = token.used_at is not None
+        if not reused:
+            token.used_at = timezone.now()
+            token.save(update_fields=['used_at'])
+            return issue(token.user, token.family)
+    revoke_user(token.user_id)  # Committed before the error is raised
+    raise AuthenticationFailed('Refresh token was already used.', code='token_reused')
+
+
+def revoke(claims):
+    """Revoke one access token until it expires."""
+    entry = TokenRevocation.objects.create(
+        user_id=claims['u'], jti=claims['j'], revoked_at=timezone.now(),
+        expires_at=timezone.now() + timedelta(seconds=max(0, claims['e'] - time.time())),
+    )
+    denylist.add(entry.user_id, entry.jti, entry.revoked_at)
+
+
+def revoke_user(user_id):
+    """Revoke every access token issued to the user so far and delete their refresh tokens."""
+    now = timezone.now()
+    with transaction.atomic():
+        RefreshToken.objects.filter(user_id=user_id).delete()
+        TokenRevocation.objects.create(user_id=user_id, revoked_at=now,
+                                       expires_at=now + timedelta(seconds=settings.ACCESS_TOKEN_LIFETIME))
+    denylist.add(user_id, '', now)
+
+
+def purge_expired():
+    """Delete revocations and refresh tokens nothing can use any more; returns (revocations, refresh tokens)."""
+    now = timezone.now()
+    revocations, _ = TokenRevocation.objects.filter(expires_at__lte=now).delete()
+    refresh_tokens, _ = RefreshToken.objects.filter(expires_at__lte=now).delete()
+    return revocations, refresh_tokens
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """`Authorization: Bearer <access token>`, verified in-process."""
+
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid bearer header.')
+        try:
+            claims = decode_access(auth[1].decode('ascii'))
+        except (UnicodeError, ValueError, KeyError, TypeError):
+            raise AuthenticationFailed('Invalid token.')
+        return token_user(claims), claims
+
+    def authenticate_header(self, request):
+        return 'Bearer'
@@ -0,0 +1,135 @@
+"""
+Set-based moves between Wishlist and Cart (and from a guest cart into Cart).
+
+Each transfer is one INSERT ... SELECT plus one DELETE inside a transaction, no
+matter how many products move. Wishlist -> cart skips products that are out of
+stock (they stay on the wishlist) and never pushes a cart line above stock.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cart_storage import get_storage
+from .models import Cart, ChangeStamp, Product, Wishlist
+
+
+def _selection(column, product_ids):
+    """SQL fragment + params restricting to product_ids (None means everything, [] nothing)."""
+    if product_ids is None:
+        return '', []
+    if not product_ids:
+        return ' AND 1 = 0', []  # `IN ()` is a syntax error on PostgreSQL
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    return f' AND {column} IN ({placeholders})', list(product_ids)
+
+
+def wishlist_to_cart(user, product_ids=None):
+    cart, wishlist, product = Cart._meta.db_table, Wishlist._meta.db_table, Product._meta.db_table
+    least = 'LEAST' if connection.vendor == 'postgresql' else 'MIN'
+    selected, params = _selection('w.product_id', product_ids)
+    now = timezone.now()
+    storage = get_storage()
+    storage.flush(user.id)  # The SQL below works on Cart rows, so write-behind changes go first
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT COUNT(DISTINCT w.product_id) FROM {wishlist} w
+            WHERE w.user_id = %s{selected}
+            """,
+            [user.id, *params],
+        )
+        requested = cursor.fetchone()[0]
+
+        # Existing cart lines keep their quantity, capped at current stock
+        cursor.execute(
+            f"""
+            INSERT INTO {cart} (user_id, product_id, quantity, added_at, updated_at)
+            SELECT w.user_id, w.product_id, 1, %s, %s
+            FROM {wishlist} w JOIN {product} p ON p.id = w.product_id
+            WHERE w.user_id = %s AND p.stock > 0{selected}
+            GROUP BY w.user_id, w.product_id
+            ON CONFLICT (user_id, product_id) DO UPDATE
+            SET quantity = {least}({cart}.quantity, (SELECT stock FROM {product} WHERE id = excluded.product_id)),
+                updated_at = excluded.updated_at
+            RETURNING product_id
+            """,
+            [now, now, user.id, *params],
+        )
+        moved = [row[0] for row in cursor.fetchall()]
+
+        if moved:
+            selected, params = _selection('product_id', moved)
+            cursor.execute(f"DELETE FROM {wishlist} WHERE user_id = %s{selected}", [user.id, *params])
+            # Raw SQL skips the signals that keep conditional GET stamps current
+            ChangeStamp.bump('cart', [user.id])
+            ChangeStamp.bump('wishlist', [user.id])
+    storage.forget([user.id])
+
+    return {"requested": requested, "moved": len(moved), "out_of_stock": requested - len(moved)}
+
+
+def cart_to_wishlist(user, product_ids=None):
+    cart, wishlist = Cart._meta.db_table, Wishlist._meta.db_table
+    selected, params = _selection('c.product_id', product_ids)
+    storage = get_storage()
+    storage.flush(user.id)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {wishlist} (user_id, product_id, added_at)
+            SELECT c.user_id, c.product_id, %s FROM {cart} c
+            WHERE c.user_id = %s AND c.product_id IS NOT NULL{selected}
+            AND NOT EXISTS (
+                SELECT 1 FROM {wishlist} w WHERE w.user_id = c.user_id AND w.product_id = c.product_id
+            )
+            """,
+            [timezone.now(), user.id, *params],
+        )
+        added = cursor.rowcount
+
+        # Lines whose product was deleted have nothing to move and stay out of the count
+        selected, params = _selection('product_id', product_ids)
+        cursor.execute(f"DELETE FROM {cart} WHERE user_id = %s AND product_id IS NOT NULL{selected}", [user.id, *params])
+        moved = cursor.rowcount
+        if moved:
+            ChangeStamp.bump('cart', [user.id])
+            ChangeStamp.bump('wishlist', [user.id])
+    storage.forget([user.id])
+
+    return {"moved": moved, "added_to_wishlist": added, "already_in_wishlist": moved - added}
+
+
+def merge_guest_cart(user, items):
+    """
+    Fold a guest cart ({product_id: quantity}) into the user's cart with one upsert:
+    quantities add up, capped at stock; missing or sold-out products are skipped.
+    """
+    if not items:
+        return 0
+    cart, product = Cart._meta.db_table, Product._meta.db_table
+    least = 'LEAST' if connection.vendor == 'postgresql' else 'MIN'
+    rows = ', '.join(['(%s, %s)'] * len(items))
+    now = timezone.now()
+    storage = get_storage()
+    storage.flush(user.id)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # VALUES columns are column1, column2 on both PostgreSQL and SQLite
+        cursor.execute(
+            f"""
+            INSERT INTO {cart} (user_id, product_id, quantity, added_at, updated_at)
+            SELECT %s, p.id, {least}(g.column2, p.stock), %s, %s
+            FROM (VALUES {rows}) g JOIN {product} p ON p.id = g.column1
+            WHERE p.stock > 0
+            ON CONFLICT (user_id, product_id) DO UPDATE
+            SET quantity = {least}({cart}.quantity + excluded.quantity, (SELECT stock FROM {product} WHERE id = excluded.product_id)),
+                updated_at = excluded.updated_at
+            """,
+            [user.id, now, now, *(value for pair in items.items() for value in pair)],
+        )
+        merged = cursor.rowcount
+        if merged:
+            ChangeStamp.bump('cart', [user.id])
+    storage.forget([user.id])
+    return merged
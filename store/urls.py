@@ -10,6 +10,7 @@ from .views import (
     ProductView, get_order_items, OrderItemListView, CreateOrderItemView
 )
 from . import views
+from .order_events import order_events
 
 # API Router
 router = DefaultRouter()
@@ -28,6 +29,7 @@ urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),  
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('token/refresh/', views.TokenRefreshView.as_view(), name='token-refresh'),
     
     # User Profile
     path('profile/', ProfileView.as_view(), name='profile'),
@@ -39,7 +41,7 @@ urlpatterns = [
 
     # Order Management
     path('orders/create/', OrderCreateView.as_view(), name='order-create'),
-    path("orders/<int:id>/", OrderDetailView.as_view(), name="order-detail"),
+    path("orders/<int:order_id>/", OrderDetailView.as_view(), name="order-detail"),
     path('orders/', CreateOrderAPIView.as_view(), name='create-order'),
     path('place-order/', PlaceOrderView.as_view(), name='place-order'),
 
@@ -53,6 +55,12 @@ urlpatterns = [
     # Cart management
     path('cart/', CartView.as_view(), name='cart-view'),
     path('cart/add/', CartAddView.as_view(), name='cart-add'),
+    path('guest-cart/', views.GuestCartView.as_view(), name='guest-cart'),
+
+    # Change events (outbox), read by cursor
+    path('events/', views.EventStreamView.as_view(), name='event-stream'),
+    path('order-events/', order_events, name='order-events'),  # SSE, needs the ASGI app
+    path('slow-queries/', views.SlowQueryView.as_view(), name='slow-queries'),
 
     # Product
     path('products/', ProductView.as_view(), name='product-list'),
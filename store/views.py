@@ -1,25 +1,48 @@
 from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import viewsets, generics, status
 from django.contrib.auth import get_user_model, logout
+from django.contrib.auth.signals import user_logged_in
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
-from .models import Product, Order, Profile, Cart, Wishlist, Payment
-from .serializers import (ProductSerializer, UserSerializer, RegisterSerializer, OrderSerializer, CartSerializer, WishlistSerializer, PaymentSerializer, OrderItemSerializer)
+from .models import Product, ProductVariant, Order, Profile, Cart, Wishlist, Payment, ProductRecommendation, ChangeStamp, OutboxEvent
+from .serializers import (ProductSerializer, UserSerializer, RegisterSerializer, OrderSerializer, CartSerializer, WishlistSerializer, PaymentSerializer, OrderItemSerializer, PooledAuthTokenSerializer, compiled)
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseForbidden
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, action
 from .models import Cart, OrderItem
 from .serializers import CartSerializer
 from rest_framework import serializers
 from django.db import transaction
+from django.db.models import Q
 from rest_framework.generics import RetrieveAPIView
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, timedelta
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from . import metrics
+from .recommendations import recommended_ids
+from .transfers import wishlist_to_cart, cart_to_wishlist, merge_guest_cart
+from . import guest_cart
+from .cart_storage import get_storage as cart_storage
+from .pagination import capped_count
+from .partitions import get_pruned, prune
+from .promotions import price_cart
+from .routers import pin_to_primary
+from . import outbox, tokens
+from .tokens import SignedTokenAuthentication
+from . import facets, slow_queries
+import logging
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 @api_view(["GET", "DELETE"])
 @permission_classes([IsAuthenticated])
@@ -48,47 +71,78 @@ def get_cart(request):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def create_order(request):
+    lines, error = requested_lines(request)
+    if error:
+        return error
+
+    with transaction.atomic():
+        order, quote = create_priced_order(request.user, lines)
+        logger.info("Order total", extra={"order_id": order.id, "total_price": order.total_price})
+
+    return Response({"id": order.id, "total_price": order.total_price, "discount": quote.discount}, status=201)
+
+
+def requested_lines(request):
+    """([(product, quantity)], None) from product_ids/quantities in the body, or (None, error response)."""
     product_ids = request.data.get("product_ids", [])
     quantities = request.data.get("quantities", [])
 
     if not product_ids or not quantities:
-        return Response({"error": "Product IDs and Quantities are required."}, status=400)
+        return None, Response({"error": "Product IDs and Quantities are required."}, status=400)
     if len(product_ids) != len(quantities):
-        return Response({"error": "Product IDs and Quantities lists must have the same length."}, status=400)
+        return None, Response({"error": "Product IDs and Quantities lists must have the same length."}, status=400)
+    if not all(isinstance(quantity, int) and quantity > 0 for quantity in quantities):
+        return None, Response({"error": "Quantities must be positive integers."}, status=400)
 
-    total_price = 0
+    products = Product.objects.in_bulk([pid for pid in product_ids if str(pid).isdigit()])
+    for product_id in product_ids:
+        if not str(product_id).isdigit() or int(product_id) not in products:
+            return None, Response({"error": f"Product with ID {product_id} not found."}, status=404)
+    return [(products[int(pid)], quantity) for pid, quantity in zip(product_ids, quantities)], None
 
-    with transaction.atomic():
-        # Create the order
-        order = Order.objects.create(user=request.user)
-        print(f"Order created: {order.id}")
-
-        # Create order items and calculate total price
-        for product_id, quantity in zip(product_ids, quantities):
-            try:
-                product = Product.objects.get(id=product_id)
-            except Product.DoesNotExist:
-                return Response({"error": f"Product with ID {product_id} not found."}, status=404)
-
-            print(f"Product ID: {product.id}, Price: {product.price}, Quantity: {quantity}")
-            item_total_price = product.price * quantity
-            total_price += item_total_price
-
-            # Create OrderItem
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                total_price=item_total_price,  # Make sure this field is being set correctly
-            )
 
-        # Update the total price in the order
-        print(f"Total price for the order: {total_price}")
-        order.total_price = total_price
-        order.save()
+def cart_checkout_lines(cart_items):
+    return [(cart.product, cart.quantity) for cart in cart_items.select_related("product") if cart.product]
 
-    return Response({"id": order.id, "total_price": order.total_price}, status=201)
 
+def create_priced_order(user, lines):
+    """
+    Order and items for [(product, quantity)], priced by the promotion engine.
+    Call inside a transaction. Returns (order, quote).
+    """
+    quote = price_cart(lines)
+    order = Order(user=user)
+    order.save(outbox_event=False)  # Announced below, once it has its items and total
+    items = OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=line.product, quantity=line.quantity, price=line.total,
+                  discount=line.discount, created_at=order.created_at)  # bulk_create skips OrderItem.save()
+        for line in quote.lines
+    ])
+    order.save(outbox_event=OutboxEvent.CREATED)  # total_price is recomputed from the items, i.e. quote.total
+    OutboxEvent.record(items, OutboxEvent.CREATED)
+    return order, quote
+
+
+
+def directory_search(users, params):
+    """
+    Users whose email, full name or phone starts with (match=prefix, the default) or
+    contains (match=contains, 3+ characters) ?q=, ignoring case. Both are served by the
+    expression indexes of migration 0024 on PostgreSQL.
+    """
+    term = params.get("q", "").strip()
+    if not term:
+        return users
+    match = params.get("match", "prefix")
+    if match not in ("prefix", "contains"):
+        raise ValidationError({"match": ["Must be prefix or contains."]})
+    if match == "contains" and len(term) < 3:
+        raise ValidationError({"q": ["Contains search needs at least 3 characters."]})  # Shorter has no trigram
+    lookup = "istartswith" if match == "prefix" else "icontains"
+    query = Q()
+    for field in ("email", "full_name", "cellphone_number"):
+        query |= Q(**{f"{field}__{lookup}": term})
+    return users.filter(query)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -107,13 +161,27 @@ class UserViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]  # Other actions require authentication
 
     def list(self, request):
-        """ List all users (Admin only) """
+        """
+        Users in id order, a page at a time (?after=<last id>&limit=), optionally searched
+        by email, name or phone (?q=, &match=prefix or contains). Admin only.
+        """
         if not request.user.is_staff:
             return Response({"error": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
 
-        users = User.objects.all()
-        serializer = self.get_serializer(users, many=True)
-        return Response(serializer.data)
+        after = request.query_params.get("after", "0")
+        limit = request.query_params.get("limit", str(settings.USER_DIRECTORY_PAGE_SIZE))
+        if not after.isdigit() or not limit.isdigit() or not 0 < int(limit) <= 200:
+            raise ValidationError({"error": "after must be a user id and limit between 1 and 200"})
+        users = directory_search(User.objects.order_by("id"), request.query_params)
+
+        count, estimated = capped_count(users, settings.USER_DIRECTORY_EXACT_COUNT)
+        page = compiled(UserSerializer).serialize(users.filter(id__gt=int(after))[:int(limit)])
+        return Response({
+            "count": count,
+            "count_estimated": estimated,
+            "next": page[-1]["id"] if len(page) == int(limit) else None,  # ?after= for the next page
+            "results": page,
+        })
 
     def retrieve(self, request, pk=None):
         """ Retrieve a user. Admins can retrieve any, users can retrieve their own. """
@@ -153,12 +221,112 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response({"message": "User deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
 
 
+def stamp_etag(kind):
+    """
+    ETag from the user's ChangeStamp counter: a matching If-None-Match gets a 304
+    after one primary key lookup, before any rows are loaded or serialized.
+
+    The stamp is read from the primary, so the body is too: a lagging replica
+    would otherwise serve old rows under the new ETag, and clients would keep them.
+    """
+    def etag(request, *args, **kwargs):
+        pin_to_primary()
+        if kind == "cart":
+            cart_storage().flush(request.user.id)  # Write-behind changes count too
+        key = kwargs.get("order_id") or kwargs.get("pk") or ""
+        return f'"{kind}-{request.user.id}-{ChangeStamp.current(request.user.id, kind)}-{key}"'
+    return condition(etag_func=etag)
+
+def user_cart(user):
+    """The user's Cart rows, with any write-behind (cached) changes persisted first."""
+    cart_storage().flush(user.id)
+    return Cart.objects.filter(user=user)
+
+def history_since(request):
+    """
+    Start of an order/payment history list: ?since=YYYY-MM-DD, else ORDER_HISTORY_DAYS
+    ago. Bounding created_at keeps the query to the recent monthly partitions.
+    """
+    since = request.query_params.get("since")
+    if not since:
+        return timezone.now() - timedelta(days=settings.ORDER_HISTORY_DAYS)
+    day = parse_date(since)
+    if day is None:
+        raise ValidationError({"since": "Use YYYY-MM-DD."})
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+def selected_product_ids(request):
+    """`product_ids` from the body as a list of ints, or None to select everything."""
+    product_ids = request.data.get("product_ids")
+    if product_ids is None:
+        return None
+    if not isinstance(product_ids, list) or not all(isinstance(pid, int) for pid in product_ids):
+        raise ValidationError({"product_ids": "Must be a list of product IDs."})
+    if not product_ids:
+        raise ValidationError({"product_ids": "Select at least one product, or leave product_ids out to move everything."})
+    return product_ids
+
+
+def recommended_products(recommendations, exclude=(), limit=10):
+    """Products for the merged recommendation rows, in ranking order (one query)."""
+    ids = recommended_ids(recommendations, exclude=exclude, limit=limit)
+    products = Product.objects.in_bulk(ids)
+    return [products[pid] for pid in ids if pid in products]
+
+
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        """Product list built from .values_list() rows (same output as ProductSerializer)."""
+        return Response(compiled(ProductSerializer).serialize(self.filter_queryset(self.get_queryset())))
+
+    @action(detail=True, methods=["get"])
+    def recommendations(self, request, pk=None):
+        """Frequently bought together with this product (2 queries)."""
+        if not str(pk).isdigit():
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        recommendations = ProductRecommendation.objects.filter(product_id=pk)
+        products = recommended_products(recommendations, exclude={int(pk)})
+        return Response(ProductSerializer(products, many=True).data)
+
+    @action(detail=False, methods=["get"])
+    def browse(self, request):
+        """Filtered product page plus facet counts (?size=M&size=L&min_price=&max_price=&in_stock=1&page=)."""
+        try:
+            filters = facets.parse_filters(request.query_params)
+        except ValueError as exc:
+            raise ValidationError({"error": str(exc)})
+        page = request.query_params.get("page", "1")
+        page = int(page) if page.isdigit() and int(page) > 0 else 1
+        size = settings.FACET_PAGE_SIZE
+        products = facets.filtered_products(filters).order_by("id")[(page - 1) * size:page * size]
+        results = compiled(ProductSerializer).serialize(products)
+        variants = {}
+        for row in ProductVariant.objects.filter(product_id__in=[p["id"] for p in results]).order_by("size", "color").values(
+                "id", "product_id", "size", "color", "stock"):
+            variants.setdefault(row.pop("product_id"), []).append(row)
+        for product in results:
+            product["variants"] = variants.get(product["id"], [])
+        counts = facets.cached_facet_counts(filters)
+        return Response({
+            "count": counts["total"],
+            "page": page,
+            "results": results,
+            "facets": {"sizes": counts["sizes"], "price": counts["price"], "in_stock": counts["in_stock"]},
+        })
+
 # Register & Login
+def adopt_guest_cart(request, user, response):
+    """Merge the guest cookie cart into the user's Cart and drop the cookie."""
+    items = guest_cart.read(request)
+    if items:
+        response.data["merged_cart_items"] = merge_guest_cart(user, items)
+        guest_cart.clear(response)
+    return response
+
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
@@ -168,17 +336,98 @@ class RegisterView(generics.CreateAPIView):
         user = serializer.save()
         user.is_active = True  # Ensure users are active upon registration
         user.save()
+        self.created_user = user
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        return adopt_guest_cart(request, self.created_user, response)
 
 class LoginView(ObtainAuthToken):
+    serializer_class = PooledAuthTokenSerializer
+
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
         token, created = Token.objects.get_or_create(user=user)
-        return Response({
+        user_logged_in.send(sender=user.__class__, request=request, user=user)
+        return adopt_guest_cart(request, user, Response({
             "email": user.email,
             "token": token.key,  # ✅ Return Token
-        })
+            **tokens.issue(user),  # Signed access token + refresh token
+        }))
+
+class TokenRefreshView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        """New access + refresh token for a refresh token (which can't be used again)."""
+        raw = request.data.get("refresh")
+        if not isinstance(raw, str) or not raw:
+            raise ValidationError({"refresh": ["This field is required."]})
+        return Response(tokens.refresh(raw))
+
+    def get_authenticate_header(self, request):
+        return "Bearer"  # Rejected refresh tokens are 401s, not 403s
+
+# Guest cart (signed cookie, no DB writes until login)
+class GuestCartView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        items = guest_cart.read(request)
+        products = Product.objects.only("id", "name", "price", "image_url").in_bulk(list(items))
+        lines = [
+            {
+                "product_id": pid,
+                "product_name": products[pid].name,
+                "product_price": products[pid].price,
+                "product_image": products[pid].image_url,
+                "quantity": quantity,
+            }
+            for pid, quantity in items.items() if pid in products
+        ]
+        if not lines:
+            return Response({"message": "Your cart is empty"}, status=status.HTTP_200_OK)
+        return Response(lines, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        """Add a product to the guest cart."""
+        product_id = request.data.get("product_id")
+        quantity = request.data.get("quantity", 1)
+
+        if not product_id:
+            return Response({"error": "Product ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not isinstance(quantity, int) or quantity <= 0:
+            return Response({"error": "Quantity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        product = get_object_or_404(Product.objects.only("id", "stock"), id=product_id)
+        items = guest_cart.read(request)
+        if product.id not in items and len(items) >= settings.GUEST_CART_MAX_LINES:
+            return Response({"error": "Cart is full"}, status=status.HTTP_400_BAD_REQUEST)
+        items[product.id] = min(items.get(product.id, 0) + quantity, product.stock)
+        if not items[product.id]:
+            return Response({"error": "Out of stock"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response({"message": "Product added to cart successfully", "quantity": items[product.id]},
+                            status=status.HTTP_201_CREATED)
+        guest_cart.write(response, items)
+        return response
+
+    def delete(self, request):
+        """Remove one product (?product_id=) or empty the guest cart."""
+        items = guest_cart.read(request)
+        product_id = request.query_params.get("product_id")
+        if product_id:
+            items.pop(int(product_id) if product_id.isdigit() else None, None)
+        else:
+            items = {}
+        response = Response({"message": "Cart updated"}, status=status.HTTP_200_OK)
+        guest_cart.write(response, items)
+        return response
 
 # Profile & Logout
 class ProfileView(generics.RetrieveAPIView):
@@ -200,6 +449,7 @@ class LogoutView(APIView):
     def post(self, request):
         if hasattr(request.user, 'auth_token'):
             request.user.auth_token.delete()
+        tokens.revoke_user(request.user.id)  # Signed access tokens on every device, and refresh tokens
         logout(request)
         return Response({"message": "User logged out successfully"}, status=200)
 
@@ -210,40 +460,69 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        # Flushed first: an edit to a row under a dirty cached cart would be overwritten by the next flush
+        return user_cart(self.request.user)
 
-    def create(self, request, *args, **kwargs):
-        product = get_object_or_404(Product, id=request.data.get("product_id"))
-        cart_item, created = Cart.objects.get_or_create(user=request.user, product=product)
+    @method_decorator(stamp_etag("cart"))
+    def list(self, request, *args, **kwargs):
+        return Response(compiled(CartSerializer).serialize(self.filter_queryset(self.get_queryset())))
 
-        if not created:
-            if product.stock > cart_item.quantity:
-                cart_item.quantity += 1
-                cart_item.save()
-            else:
-                return Response({"error": "Not enough stock"}, status=status.HTTP_400_BAD_REQUEST)
+    def create(self, request, *args, **kwargs):
+        product = get_object_or_404(Product.objects.only("id", "stock"), id=request.data.get("product_id"))
+        if cart_storage().add(request.user.id, product.id, 1, limit=product.stock) is None:
+            return Response({"error": "Not enough stock"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({"message": "Product added to cart"}, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, *args, **kwargs):
-        cart_item = get_object_or_404(Cart, user=request.user, id=kwargs["pk"])
+        cart_item = get_object_or_404(user_cart(request.user), id=kwargs["pk"])
         cart_item.delete()
         return Response({"message": "Product removed from cart"}, status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["post"], url_path="move-to-wishlist")
+    def move_to_wishlist(self, request):
+        """Move the selected products (or the whole cart) to the wishlist in one transaction."""
+        summary = cart_to_wishlist(request.user, selected_product_ids(request))
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def recommendations(self, request):
+        """Frequently bought together with the cart's products (3 queries)."""
+        in_cart = set(user_cart(request.user).filter(product__isnull=False).values_list("product_id", flat=True))
+        recommendations = ProductRecommendation.objects.filter(product_id__in=in_cart)
+        products = recommended_products(recommendations, exclude=in_cart)
+        return Response(ProductSerializer(products, many=True).data)
+
+    @action(detail=False, methods=["get"])
+    def quote(self, request):
+        """The cart priced with current promotions, as checkout would charge it."""
+        quote = price_cart(cart_checkout_lines(user_cart(request.user)))
+        return Response({
+            "lines": [
+                {"product_id": line.product.id, "quantity": line.quantity, "subtotal": line.subtotal,
+                 "discount": line.discount, "total": line.total, "promotion_id": line.promotion_id}
+                for line in quote.lines
+            ],
+            "subtotal": quote.subtotal,
+            "discount": quote.discount,
+            "total": quote.total,
+            "cart_promotion_id": quote.cart_promotion_id,
+        })
+
 # Cart View (Fetch all items in the cart)
 class CartView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [SignedTokenAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(stamp_etag("cart"))
     def get(self, request):
         """Fetch the cart items for the authenticated user."""
-        cart_items = Cart.objects.filter(user=request.user)
+        cart_items = compiled(CartSerializer).serialize(Cart.objects.filter(user=request.user))
 
-        if not cart_items.exists():
+        if not cart_items:
             return Response({"message": "Your cart is empty"}, status=status.HTTP_200_OK)
 
-        serializer = CartSerializer(cart_items, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(cart_items, status=status.HTTP_200_OK)
 
     def post(self, request):
         """Add a product to the cart for the authenticated user."""
@@ -256,38 +535,31 @@ class CartView(APIView):
         if not isinstance(quantity, int) or quantity <= 0:
             return Response({"error": "Quantity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
 
-        product = get_object_or_404(Product, id=product_id)
+        product = get_object_or_404(Product.objects.only("id"), id=product_id)
 
-        # Check if the item already exists in the cart
-        cart_item, created = Cart.objects.get_or_create(user=request.user, product=product)
-        if not created:
-            cart_item.quantity += quantity  # Increase quantity if item exists
-        else:
-            cart_item.quantity = quantity
-        cart_item.save()
+        # Adds to the existing line, if any (cart_item_id is None while the write is deferred)
+        _, cart_item_id = cart_storage().add(request.user.id, product.id, quantity)
 
         return Response(
-            {"message": "Product added to cart successfully", "cart_item_id": cart_item.id},
+            {"message": "Product added to cart successfully", "cart_item_id": cart_item_id},
             status=status.HTTP_201_CREATED
         )
 
 # Cart Add View (Separate post method for adding items)
 class CartAddView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [SignedTokenAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         product_id = request.data.get("product_id")
         quantity = request.data.get("quantity", 1)
 
-        try:
-            product = Product.objects.get(id=product_id)
+        if not isinstance(quantity, int) or quantity <= 0:
+            return Response({"error": "Quantity must be a positive integer"}, status=400)
 
-            # Check if the item is already in the cart
-            cart_item, created = Cart.objects.get_or_create(user=request.user, product=product)
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+        try:
+            product = Product.objects.only("id").get(id=product_id)
+            cart_storage().add(request.user.id, product.id, quantity)
 
             return Response({"message": "Product added to cart"}, status=201)
 
@@ -299,9 +571,8 @@ class PaymentViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
-        payments = Payment.objects.filter(user=request.user)
-        serializer = PaymentSerializer(payments, many=True)
-        return Response(serializer.data)
+        payments = Payment.objects.filter(user=request.user, created_at__gte=history_since(request))
+        return Response(compiled(PaymentSerializer).serialize(payments))
 
     def create(self, request):
         order_id = request.data.get("order_id")
@@ -310,12 +581,16 @@ class PaymentViewSet(viewsets.ViewSet):
         if not order_id or not amount:
             return Response({"error": "order_id and amount are required"}, status=status.HTTP_400_BAD_REQUEST)
 
+        if not str(order_id).isdigit() or not Order.objects.filter(pk=order_id, user=request.user).exists():
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        # Completing the payment marks the order paid (Payment.advance_order)
         payment = Payment.objects.create(
             user=request.user,
             order_id=order_id,
             amount=amount,
             status="completed",
-            transaction_id=f"TXN{order_id}"
+            mode_of_payment=request.data.get("mode_of_payment"),
         )
 
         return Response({"message": "Payment successful", "payment_id": payment.id}, status=status.HTTP_201_CREATED)
@@ -335,13 +610,39 @@ class PaymentViewSet(viewsets.ViewSet):
         payment.save()
         return Response({"message": "Refund successful", "payment_id": payment.id}, status=status.HTTP_200_OK)
 
+# Change-event stream (store/outbox.py)
+class EventStreamView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Outbox events after ?after=<position> (&limit=, &topic=order,payment); resume from "cursor"."""
+        after, limit = request.query_params.get("after", "0"), request.query_params.get("limit", "1000")
+        if not after.isdigit() or not limit.isdigit():
+            raise ValidationError({"error": "after and limit must be non-negative integers"})
+        topics = [topic for topic in request.query_params.get("topic", "").split(",") if topic]
+        events = outbox.read(int(after), min(int(limit), 5000), topics)
+        return Response({"events": events, "cursor": events[-1]["position"] if events else int(after)})
+
+# Slow-query recorder (store/slow_queries.py)
+class SlowQueryView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Recorded slow statements, most total time first (?limit=)."""
+        limit = request.query_params.get("limit", "50")
+        if not limit.isdigit():
+            raise ValidationError({"error": "limit must be a non-negative integer"})
+        return Response({"threshold_ms": settings.SLOW_QUERY_MS, "queries": slow_queries.get_log().entries()[:int(limit)]})
+
+    def delete(self, request):
+        slow_queries.get_log().clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class ProductView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        product = Product.objects.all()
-        serializer = ProductSerializer(product, many=True)
-        return Response(serializer.data)
+        return Response(compiled(ProductSerializer).serialize(Product.objects.all()))
     
 # Wishlist ViewSet
 class WishlistViewSet(viewsets.ModelViewSet):
@@ -351,6 +652,10 @@ class WishlistViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Wishlist.objects.filter(user=self.request.user)
 
+    @method_decorator(stamp_etag("wishlist"))
+    def list(self, request, *args, **kwargs):
+        return Response(compiled(WishlistSerializer).serialize(self.filter_queryset(self.get_queryset())))
+
     def create(self, request, *args, **kwargs):
         product = get_object_or_404(Product, id=request.data.get("product"))
         wishlist_item, created = Wishlist.objects.get_or_create(user=request.user, product=product)
@@ -364,19 +669,25 @@ class WishlistViewSet(viewsets.ModelViewSet):
         wishlist_item.delete()
         return Response({"message": "Product removed from wishlist"}, status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["post"], url_path="move-to-cart")
+    def move_to_cart(self, request):
+        """Move the selected products (or the whole wishlist) to the cart; out-of-stock ones stay."""
+        summary = wishlist_to_cart(request.user, selected_product_ids(request))
+        return Response(summary, status=status.HTTP_200_OK)
+
 class CartView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [SignedTokenAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(stamp_etag("cart"))
     def get(self, request):
         """Fetch the cart items for the authenticated user."""
-        cart_items = Cart.objects.filter(user=request.user)
+        cart_items = compiled(CartSerializer).serialize(Cart.objects.filter(user=request.user))
 
-        if not cart_items.exists():
+        if not cart_items:
             return Response({"message": "Your cart is empty"}, status=status.HTTP_200_OK)
 
-        serializer = CartSerializer(cart_items, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(cart_items, status=status.HTTP_200_OK)
 
     def post(self, request):
         """Add a product to the cart for the authenticated user."""
@@ -389,18 +700,13 @@ class CartView(APIView):
         if not isinstance(quantity, int) or quantity <= 0:
             return Response({"error": "Quantity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
 
-        product = get_object_or_404(Product, id=product_id)
+        product = get_object_or_404(Product.objects.only("id"), id=product_id)
 
-        # Check if the item already exists in the cart
-        cart_item, created = Cart.objects.get_or_create(user=request.user, product=product)
-        if not created:
-            cart_item.quantity += quantity  # Increase quantity if item exists
-        else:
-            cart_item.quantity = quantity
-        cart_item.save()
+        # Adds to the existing line, if any (cart_item_id is None while the write is deferred)
+        _, cart_item_id = cart_storage().add(request.user.id, product.id, quantity)
 
         return Response(
-            {"message": "Product added to cart successfully", "cart_item_id": cart_item.id},
+            {"message": "Product added to cart successfully", "cart_item_id": cart_item_id},
             status=status.HTTP_201_CREATED
         )
 
@@ -410,36 +716,22 @@ class CreateOrderAPIView(APIView):
 
     def post(self, request):
         user = request.user
-        cart_items = Cart.objects.filter(user=user)
+        cart_items = user_cart(user)
 
         if not cart_items.exists():
             return Response({"error": "No items in the cart"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             with transaction.atomic():
-                # ✅ Calculate total price from cart items
-                total_price = sum(cart.product.price * cart.quantity for cart in cart_items)
-
-                # ✅ Create order
-                order = Order.objects.create(user=user, total_price=total_price)
-
-                # ✅ Move cart items to OrderItem
-                order_items = [
-                    OrderItem(
-                        order=order,
-                        product=cart.product,
-                        quantity=cart.quantity,
-                        total_price=cart.product.price * cart.quantity,
-                    )
-                    for cart in cart_items
-                ]
-                OrderItem.objects.bulk_create(order_items)  # ✅ Bulk insert for efficiency
+                # ✅ Move cart items to OrderItem, with promotions applied
+                order, quote = create_priced_order(user, cart_checkout_lines(cart_items))
 
                 # ✅ Clear the cart after order is placed
                 cart_items.delete()
 
             return Response(
-                {"message": "Order created successfully", "order_id": order.id},
+                {"message": "Order created successfully", "order_id": order.id,
+                 "total_price": order.total_price, "discount": quote.discount},
                 status=status.HTTP_201_CREATED
             )
 
@@ -452,20 +744,56 @@ class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # Own orders only (the ETag below is per user); staff move anyone's order along
+        if self.action == "set_status" and self.request.user.is_staff:
+            return Order.objects.all()
+        orders = Order.objects.filter(user=self.request.user)
+        if self.action == "list":
+            orders = orders.filter(created_at__gte=history_since(self.request))
+        return orders
+
+    def get_object(self):
+        pk = self.kwargs["pk"]
+        if not str(pk).isdigit():
+            raise Http404
+        try:
+            order = get_pruned(self.get_queryset(), int(pk))
+        except Order.DoesNotExist:
+            raise Http404
+        self.check_object_permissions(self.request, order)
+        return order
+
+    @method_decorator(stamp_etag("orders"))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=["post"], url_path="status")
+    def set_status(self, request, pk=None):
+        """Move the order to {"status": ...}: staff along the lifecycle, owners only to cancel a pending order."""
+        order = self.get_object()
+        target = request.data.get("status")
+        if target not in dict(Order.STATUS_CHOICES):
+            raise ValidationError({"status": [f"Must be one of {', '.join(dict(Order.STATUS_CHOICES))}."]})
+        if not request.user.is_staff and not (target == Order.STATUS_CANCELLED and order.status == Order.STATUS_PENDING):
+            return Response({"error": "Only a pending order can be cancelled"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            order.transition(target)
+        except DjangoValidationError as exc:
+            return Response({"error": exc.messages[0]}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(order).data)
+
     def perform_create(self, serializer):
         user = self.request.user
 
         # Ensure the user has cart items
-        carts = Cart.objects.filter(user=user)
+        carts = user_cart(user)
         if not carts.exists():
             raise ValidationError({"error": "No cart items found for this user"})
 
         with transaction.atomic():
-            # ✅ Calculate total price from cart items
-            total_price = sum(cart.product.price * cart.quantity for cart in carts)
-
-            # ✅ Create the order linked to the user with total price
-            order = serializer.save(user=user, total_price=total_price)
+            # ✅ Create the order and its items from the cart, with promotions applied
+            serializer.instance, _ = create_priced_order(user, cart_checkout_lines(carts))
 
             # ✅ Clear the cart after order placement
             carts.delete()
@@ -483,49 +811,17 @@ class OrderCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        user = request.user
-        product_ids = request.data.get("product_ids", [])  # List of product IDs
-        quantities = request.data.get("quantities", [])    # List of quantities corresponding to products
-
-        for product_id, quantity in zip(product_ids, quantities):
-            try:
-                product = Product.objects.get(id=product_id)
-            except Product.DoesNotExist:
-                return Response({"error": f"Product with ID {product_id} not found."}, status=404)
-
-            print(f"Product ID: {product.id}, Price: {product.price}, Quantity: {quantity}")
-            item_total_price = product.price * quantity
-            total_price += item_total_price
+        lines, error = requested_lines(request)
+        if error:
+            return error
 
         with transaction.atomic():
-            # ✅ Create order
-            order = Order.objects.create(user=user)
-            total_price = 0
-
-            # ✅ Create order items for each product
-            for product_id, quantity in zip(product_ids, quantities):
-                try:
-                    product = Product.objects.get(id=product_id)
-                except Product.DoesNotExist:
-                    return Response({"error": f"Product with ID {product_id} not found."}, status=404)
-
-                item_total_price = product.price * quantity
-                total_price += item_total_price
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    total_price=item_total_price,  # Check if this field is being stored correctly
-                )
-
-            # ✅ Update total order price
-            order.total_price = total_price
-            order.save()
+            # ✅ Create order and its items, with promotions applied
+            order, quote = create_priced_order(request.user, lines)
+            logger.info("Order total", extra={"order_id": order.id, "total_price": order.total_price})
 
-            print(f"Total price for the order: {total_price}")
-
-        return Response({"id": order.id, "message": "Order created successfully."}, status=201)
+        return Response({"id": order.id, "total_price": order.total_price, "discount": quote.discount,
+                         "message": "Order created successfully."}, status=201)
 
 # ✅ PLACE ORDER FROM CART (Alternative to `OrderCreateView`)
 class PlaceOrderView(APIView):
@@ -533,43 +829,29 @@ class PlaceOrderView(APIView):
 
     def post(self, request):
         user = request.user
-        cart_items = Cart.objects.filter(user=user)
+        cart_items = user_cart(user)
 
         if not cart_items.exists():
             return Response({"error": "No items in the cart."}, status=400)
 
         with transaction.atomic():
-            # ✅ Create order
-            order = Order.objects.create(user=user)
-            total_price = 0
-
-            for cart in cart_items:
-                item_total_price = cart.product.price * cart.quantity
-                total_price += item_total_price
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart.product,
-                    quantity=cart.quantity,
-                    total_price=item_total_price,
-                )
-
-            # ✅ Update order total price
-            order.total_price = total_price
-            order.save()
+            # ✅ Create order and its items, with promotions applied
+            order, quote = create_priced_order(user, cart_checkout_lines(cart_items))
 
             # ✅ Clear cart after order placement
             cart_items.delete()
 
-        return Response({"id": order.id, "message": "Order placed successfully."}, status=201)
+        return Response({"id": order.id, "total_price": order.total_price, "discount": quote.discount,
+                         "message": "Order placed successfully."}, status=201)
 
 # ✅ ORDER DETAIL VIEW (Retrieve Order Details)
 class OrderDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(stamp_etag("orders"))
     def get(self, request, order_id):
         try:
-            order = Order.objects.get(id=order_id, user=request.user)
+            order = get_pruned(Order.objects.filter(user=request.user), order_id)
             return Response(OrderSerializer(order).data, status=200)
         except Order.DoesNotExist:
             return Response({"error": "Order not found."}, status=404)
@@ -582,20 +864,22 @@ def get_order_items(request, order_id):
     """
     Retrieve all items in an order.
     """
-    print(f"Received order_id: {order_id}")  # Debugging
+    logger.debug("Fetching order items", extra={"order_id": order_id})
 
     if not order_id:
         return Response({'error': 'Order ID is required.'}, status=400)
 
     try:
-        items = OrderItem.objects.filter(order_id=order_id)
+        items = prune(OrderItem.objects.filter(order_id=order_id), order_id)
+        if not items.exists():
+            items = OrderItem.objects.filter(order_id=order_id)  # Partition bounds may be stale
         if not items.exists():
             return Response({'error': 'No order items found for this order.'}, status=404)
 
         serializer = OrderItemSerializer(items, many=True)
         return Response(serializer.data)
     except Exception as e:
-        print(f"Error fetching order items: {e}")  # Log error to console
+        logger.exception("Error fetching order items", extra={"order_id": order_id})
         return Response({'error': 'Failed to retrieve order items.'}, status=500)
 
 
@@ -625,7 +909,7 @@ class OrderItemListView(APIView):
             return Response({"error": "Product not found."}, status=404)
 
         # Log the order and product info
-        print(f"Order: {order}, Product: {product}, Quantity: {quantity}")
+        logger.debug("Adding order item", extra={"order_id": order.id, "product_id": product.id, "quantity": quantity})
 
         total_price = product.price * quantity
 
@@ -650,7 +934,7 @@ class OrderItemListView(APIView):
                 status=201,
             )
         except Exception as e:
-            print("Error:", e)  # Log any exception that happens
+            logger.exception("Failed to create order item", extra={"order_id": order.id, "product_id": product.id})
             return Response({"error": "Failed to create order item."}, status=500)
 
 class CreateOrderItemView(APIView):
@@ -659,4 +943,13 @@ class CreateOrderItemView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+################ METRICS ####################################
+
+def metrics_view(request):
+    """Prometheus text exposition of the in-process request metrics."""
+    if not settings.DEBUG and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')